@@ -0,0 +1,167 @@
+"""
+Redirect throughput for each database connection mode (url_shortener/database.py).
+
+Every mode runs in its own process, configured through the SHORTENER_DB_* environment variables,
+against a fresh migrated database: a temporary SQLite file, or for the PostgreSQL modes the
+(scratch!) database named by SHORTENER_DB_NAME/USER/PASSWORD/HOST/PORT. Requests are fed
+straight to Django's WSGI handler from --concurrency threads, each with its own connection, and
+every response is closed so the end-of-request connection handling runs as under a real server.
+
+Workloads:
+    lookup  resolution cache off: every redirect reads the link from the database, clicks are buffered
+    click   resolution cache on: every redirect commits its click event and counter in the request ('sync' click logging)
+
+Usage (from url_shortener_service/):
+
+    python benchmarks/db_modes.py --duration 5 --concurrency 4
+    SHORTENER_DB_NAME=bench SHORTENER_DB_USER=... python benchmarks/db_modes.py --postgres
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+SQLITE_MODES = {
+    'sqlite per-request': {'SHORTENER_DB_CONNECTIONS': 'per-request', 'SHORTENER_SQLITE_PRAGMAS': '0'},  # the previous settings
+    'sqlite persistent': {'SHORTENER_DB_CONNECTIONS': 'persistent', 'SHORTENER_SQLITE_PRAGMAS': '0'},
+    'sqlite persistent+WAL': {'SHORTENER_DB_CONNECTIONS': 'persistent', 'SHORTENER_SQLITE_PRAGMAS': '1'},
+}
+POSTGRES_MODES = {
+    'postgresql per-request': {'SHORTENER_DB_CONNECTIONS': 'per-request'},
+    'postgresql persistent': {'SHORTENER_DB_CONNECTIONS': 'persistent'},
+    'postgresql pool': {'SHORTENER_DB_CONNECTIONS': 'pool'},
+}
+WORKLOADS = {
+    'lookup': {
+        'RESOLUTION_CACHE': {'ENABLED': False},
+        'CLICK_LOGGING': {'MODE': 'memory', 'FLUSH_INTERVAL': None, 'BATCH_SIZE': 10 ** 9},
+        'RATE_LIMITS': {'ENABLED': False},
+    },
+    'click': {
+        'CLICK_LOGGING': {'MODE': 'sync'},
+        'HOT_LINKS': {'ENABLED': False},  # keep every click on the request path
+        'ROLLUPS': {'ENABLED': False},  # leaves the event insert and the counter update, so commits dominate
+        'VISITORS': {'ENABLED': False},
+        'RATE_LIMITS': {'ENABLED': False},
+    },
+}
+
+
+def hammer(handler, environ, concurrency, duration, warmup=1.0):
+    """Send redirects from `concurrency` threads for `duration` seconds; per-request latencies in microseconds."""
+    from django.db import connection
+
+    started = threading.Event()
+    stop = threading.Event()
+    latencies = [[] for _ in range(concurrency)]
+
+    def start_response(status, headers):
+        assert status.startswith('302'), status
+
+    def worker(samples):
+        try:
+            while not stop.is_set():
+                begin = time.perf_counter()
+                handler(dict(environ), start_response).close()  # fires request_finished, which closes or keeps the connection
+                if started.is_set():
+                    samples.append((time.perf_counter() - begin) * 1e6)
+        finally:
+            connection.close()  # this thread's connection
+
+    threads = [threading.Thread(target=worker, args=(samples,)) for samples in latencies]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    started.set()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return [sample for samples in latencies for sample in samples]
+
+
+def child(args):
+    """Runs in the benchmark process of one mode: migrate, create a link, measure, print JSON."""
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'url_shortener.settings')
+    import django
+    django.setup()
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import RequestFactory, override_settings
+
+    call_command('migrate', verbosity=0)
+    from shortener.models import ShortURL
+
+    link = ShortURL.objects.create(original_url='https://example.com/db-modes')
+    connection.close()  # the worker threads open their own
+    environ = RequestFactory()._base_environ(
+        PATH_INFO=f'/r/{link.short_code}/', REQUEST_METHOD='GET', HTTP_HOST='localhost', HTTP_USER_AGENT='bench',
+    )
+    with override_settings(SHORTENER=WORKLOADS[args.workload]):
+        samples = hammer(WSGIHandler(), environ, args.concurrency, args.duration)
+    samples.sort()
+    print(json.dumps({
+        'requests_per_sec': len(samples) / args.duration,
+        'median_us': statistics.median(samples),
+        'p99_us': samples[int(len(samples) * 0.99)],
+        'requests': len(samples),
+    }))
+
+
+def run_mode(name, variables, workload, args):
+    env = {**os.environ, **variables, 'DJANGO_SETTINGS_MODULE': 'url_shortener.settings'}
+    with tempfile.TemporaryDirectory() as directory:
+        if name.startswith('sqlite'):
+            env.update(SHORTENER_DB_ENGINE='sqlite', SHORTENER_DB_NAME=os.path.join(directory, 'bench.sqlite3'))
+        else:
+            env['SHORTENER_DB_ENGINE'] = 'postgresql'
+        command = [sys.executable, os.path.abspath(__file__), '--child', '--workload', workload,
+                   '--duration', str(args.duration), '--concurrency', str(args.concurrency)]
+        output = subprocess.run(command, env=env, cwd=PROJECT_DIR, capture_output=True, text=True)
+    if output.returncode:
+        sys.exit(f'{name} ({workload}) failed:\n{output.stderr}')
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workload', choices=[*WORKLOADS, 'all'], default='all')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds measured per mode')
+    parser.add_argument('--concurrency', type=int, default=4, help='request threads')
+    parser.add_argument('--postgres', action='store_true', help='also run the PostgreSQL modes (needs psycopg and a scratch database)')
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    modes = {**SQLITE_MODES, **(POSTGRES_MODES if args.postgres else {})}
+    workloads = list(WORKLOADS) if args.workload == 'all' else [args.workload]
+    results = {}
+    print(f'{"mode":<24} {"workload":<8} {"req/s":>9} {"p50 us":>9} {"p99 us":>9} {"vs first":>9}')
+    for workload in workloads:
+        first = None
+        for name, variables in modes.items():
+            result = run_mode(name, variables, workload, args)
+            first = first or result['requests_per_sec']
+            results[f'{name} {workload}'] = result
+            print(f'{name:<24} {workload:<8} {result["requests_per_sec"]:>9.0f} {result["median_us"]:>9.0f} '
+                  f'{result["p99_us"]:>9.0f} {result["requests_per_sec"] / first:>8.2f}x')
+    if args.output:
+        sys.path.insert(0, BENCHMARKS_DIR)
+        from harness import write_results
+        write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Minimal benchmark harness: timed rounds with summary statistics, JSON results and
+regression checks against a stored baseline.
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(PROJECT_DIR, 'benchmarks', 'baseline.json')
+
+
+def setup_django():
+    """Configure Django with the project settings, against a throwaway test database."""
+    if PROJECT_DIR not in sys.path:
+        sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'url_shortener.settings')
+    import django
+    django.setup()
+    from django.db import connection
+
+    connection.creation.create_test_db(verbosity=0)  # never touches the project database
+
+
+def measure(func, rounds=20, iterations=50, warmup=1):
+    """
+    Run `func` `iterations` times per round and summarize the time per call in microseconds.
+    """
+    for _ in range(warmup):
+        for _ in range(iterations):
+            func()
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        samples.append((time.perf_counter() - started) / iterations * 1e6)
+    return {
+        'min_us': min(samples),
+        'median_us': statistics.median(samples),
+        'mean_us': statistics.fmean(samples),
+        'stdev_us': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'ops_per_sec': 1e6 / statistics.median(samples),
+        'rounds': rounds,
+        'iterations': iterations,
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'recorded_at': datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def write_results(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump({'environment': environment(), 'benchmarks': results}, handle, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)['benchmarks']
+
+
+def compare(results, baseline, threshold=0.2, metric='median_us'):
+    """
+    Benchmarks slower than the baseline by more than `threshold` (0.2 = 20%), as
+    {name: (baseline, current, relative change)}. Benchmarks missing from either side are skipped.
+    """
+    regressions = {}
+    for name, result in results.items():
+        if name not in baseline or not baseline[name].get(metric):
+            continue
+        before, after = baseline[name][metric], result[metric]
+        change = (after - before) / before
+        if change > threshold:
+            regressions[name] = (before, after, change)
+    return regressions
+
+
+def report(results, baseline=None, metric='median_us'):
+    """Print a results table, with the change against the baseline when there is one."""
+    print(f'{"benchmark":<32} {"median us":>11} {"ops/s":>11} {"stdev us":>10} {"vs baseline":>12}')
+    for name, result in sorted(results.items()):
+        change = ''
+        if baseline and name in baseline and baseline[name].get(metric):
+            change = f'{(result[metric] - baseline[name][metric]) / baseline[name][metric]:+.1%}'
+        print(f'{name:<32} {result["median_us"]:>11.1f} {result["ops_per_sec"]:>11.0f} {result["stdev_us"]:>10.1f} {change:>12}')
@@ -0,0 +1,136 @@
+"""
+Keep-alive HTTP/1.1 load generator (asyncio streams, no client library) for a running server.
+
+Usage, against e.g. `python manage.py runserver` or `uvicorn url_shortener.asgi:application`:
+
+    python benchmarks/loadgen.py http://127.0.0.1:8000/r/<code>/ --requests 20000 --concurrency 64
+    python benchmarks/loadgen.py http://127.0.0.1:8000/api/shorten/ --method POST \\
+        --header "Authorization: Bearer <token>" --header "Content-Type: application/json" \\
+        --body '{"original_url": "https://example.com"}' --output create.json
+
+Use --output to save the results and --baseline to flag a throughput or p99 regression
+(exit status 1) against results saved earlier.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import harness  # noqa: E402
+
+
+async def read_response(reader):
+    """Read one response and return its status code."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Server closed the connection')
+    length, chunked = 0, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value.lower()  # responses without Content-Length, e.g. from the redirect fast path
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)  # chunk data and its CRLF; the last chunk is empty
+            if not size:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+def build_request(host, path, method='GET', headers=(), body=b''):
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {host}', *headers]
+    if body:
+        lines.append(f'Content-Length: {len(body)}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+async def worker(host, port, request, count, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(count):
+        started = time.perf_counter()
+        writer.write(request)
+        status = await read_response(reader)
+        latencies.append(time.perf_counter() - started)
+        statuses[status] = statuses.get(status, 0) + 1
+    writer.close()
+
+
+async def run_load(host, port, request, requests, concurrency):
+    """Send `requests` requests over `concurrency` connections and summarize the latencies."""
+    latencies, statuses = [], {}
+    per_worker = max(1, requests // concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(host, port, request, per_worker, latencies, statuses) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p90_ms': latencies[int(len(latencies) * 0.9) - 1] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def regressions(result, baseline, threshold):
+    """Slower p99 or lower throughput than the baseline by more than `threshold`."""
+    found = {}
+    if baseline.get('p99_ms') and (result['p99_ms'] - baseline['p99_ms']) / baseline['p99_ms'] > threshold:
+        found['p99_ms'] = (baseline['p99_ms'], result['p99_ms'])
+    if baseline.get('rps') and (baseline['rps'] - result['rps']) / baseline['rps'] > threshold:
+        found['rps'] = (baseline['rps'], result['rps'])
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('url')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--warmup', type=int, default=500, help='Requests sent before measuring')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--header', action='append', default=[], help='Extra header, e.g. "Authorization: Bearer ..."')
+    parser.add_argument('--body', default='')
+    parser.add_argument('--name', help='Name of the scenario in the JSON results (default: method and path)')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare with results written earlier with --output')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    path = url.path + (f'?{url.query}' if url.query else '')
+    request = build_request(url.netloc, path, args.method, args.header, args.body.encode('utf-8'))
+    name = args.name or f'{args.method} {url.path}'
+
+    if args.warmup:
+        asyncio.run(run_load(url.hostname, url.port or 80, request, args.warmup, min(args.concurrency, args.warmup)))
+    result = asyncio.run(run_load(url.hostname, url.port or 80, request, args.requests, args.concurrency))
+    print(f'{name}: {result["requests"]} requests, {result["rps"]:.0f} req/s, '
+          f'p50 {result["p50_ms"]:.2f} ms, p90 {result["p90_ms"]:.2f} ms, p99 {result["p99_ms"]:.2f} ms, statuses {result["statuses"]}')
+    if args.output:
+        harness.write_results(args.output, {name: result})
+    if args.baseline:
+        found = regressions(result, harness.load_results(args.baseline).get(name, {}), args.threshold)
+        for metric, (before, after) in found.items():
+            print(f'REGRESSION {name} {metric}: {before:.2f} -> {after:.2f}')
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Micro benchmarks of the URL shortener hot paths, run in-process against a throwaway test database.
+
+Results are written to JSON and compared with a stored baseline; the exit status is 1 when a
+benchmark got slower than the baseline by more than --threshold.
+
+Usage (from url_shortener_service/):
+
+    python benchmarks/micro.py --update-baseline        # record benchmarks/baseline.json on this machine
+    python benchmarks/micro.py --output results.json    # later: measure again and flag regressions
+    python benchmarks/micro.py -k resolve               # only benchmarks whose name contains "resolve"
+"""
+import argparse
+import itertools
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import harness  # noqa: E402
+
+BENCHMARKS = {}
+
+
+def benchmark(name, rounds=20, iterations=50):
+    """Register a benchmark. The decorated function prepares the data and returns the callable to time."""
+    def register(setup):
+        BENCHMARKS[name] = (setup, rounds, iterations)
+        return setup
+    return register
+
+
+def links(count, prefix='bench'):
+    from shortener.models import ShortURL
+
+    return [ShortURL.objects.create(original_url=f'https://example.com/{prefix}/{number}') for number in range(count)]
+
+
+@benchmark('shorturl_save', iterations=20)
+def shorturl_save():
+    from shortener.models import ShortURL
+
+    counter = itertools.count()
+    return lambda: ShortURL(original_url=f'https://example.com/save/{next(counter)}').save()
+
+
+@benchmark('bulk_create_100', rounds=10, iterations=2)
+def bulk_create():
+    from shortener.bulk import create_short_urls
+
+    counter = itertools.count()
+    return lambda: create_short_urls([{'original_url': f'https://example.com/bulk/{next(counter)}'} for _ in range(100)], None)
+
+
+def serializer_list(include_qr_code):
+    from django.test import RequestFactory
+    from rest_framework.request import Request
+    from shortener.models import ShortURL
+    from shortener.serializers import ShortURLReadSerializer
+
+    links(50, 'list')
+    request = Request(RequestFactory().get('/api/shorten/', HTTP_HOST='localhost'))
+    page = list(ShortURL.objects.order_by('-clicks', '-id')[:50])
+    context = {'request': request, 'include_qr_code': include_qr_code}
+    return lambda: ShortURLReadSerializer(page, many=True, context=context).data  # as used by the list endpoints
+
+
+@benchmark('serialize_list_50', iterations=5)
+def serialize_list():
+    return serializer_list(include_qr_code=False)
+
+
+@benchmark('serialize_list_50_with_qr', iterations=5)
+def serialize_list_with_qr():
+    return serializer_list(include_qr_code=True)  # images come from the QR cache after the warm-up round
+
+
+@benchmark('resolve_cached', iterations=2000)
+def resolve_cached():
+    from shortener.cache import resolution_cache
+
+    code = links(1, 'cached')[0].short_code
+    return lambda: resolution_cache.resolve(code)
+
+
+@benchmark('resolve_database', iterations=200)
+def resolve_database():
+    from shortener.cache import resolution_cache
+
+    code = links(1, 'database')[0].short_code
+
+    def run():
+        resolution_cache.invalidate(code)  # force the database lookup
+        resolution_cache.resolve(code)
+    return run
+
+
+@benchmark('resolve_unknown_code', iterations=2000)
+def resolve_unknown():
+    from shortener.cache import resolution_cache
+
+    counter = itertools.count()
+    return lambda: resolution_cache.resolve(f'unknown{next(counter)}')  # a new code every time, like a scanning bot
+
+
+
+@benchmark('resolve_snapshot', iterations=2000)
+def resolve_snapshot():
+    import tempfile
+
+    from shortener.snapshot import RedirectSnapshot
+
+    rows = [(f'/code{number}', number, f'https://example.com/snapshot/{number}', None) for number in range(100000)]
+    path = os.path.join(tempfile.mkdtemp(), 'redirects.bin')
+    RedirectSnapshot.write(rows, path, 0.0)
+    snapshot = RedirectSnapshot(path)
+    counter = itertools.count()
+    return lambda: snapshot.lookup(f'/code{next(counter) * 7919 % 100000}')  # spread over a 100k code table
+
+@benchmark('redirect_request', iterations=200)
+def redirect_request():
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import RequestFactory
+
+    code = links(1, 'redirect')[0].short_code
+    handler = WSGIHandler()
+    environ = RequestFactory()._base_environ(PATH_INFO=f'/r/{code}/', REQUEST_METHOD='GET', HTTP_HOST='localhost')
+
+    def start_response(status, headers):
+        assert status.startswith('302'), status
+    return lambda: handler(dict(environ), start_response)
+
+
+@benchmark('redirect_request_custom_domain', iterations=200)
+def redirect_request_custom_domain():
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import RequestFactory
+    from shortener.models import Domain, ShortURL
+
+    domain = Domain.objects.create(hostname='go.bench.test')
+    code = ShortURL.objects.create(original_url='https://example.com/branded', domain=domain).short_code
+    handler = WSGIHandler()
+    environ = RequestFactory()._base_environ(PATH_INFO=f'/r/{code}/', REQUEST_METHOD='GET', HTTP_HOST='go.bench.test')
+
+    def start_response(status, headers):
+        assert status.startswith('302'), status
+    return lambda: handler(dict(environ), start_response)
+
+
+@benchmark('rate_limit_check', iterations=2000)
+def rate_limit_check():
+    from shortener.throttling import RateLimiter
+
+    limiter = RateLimiter()
+    counter = itertools.count()
+    # a new client every time, so the bucket table stays full and the check is never refused
+    return lambda: limiter.check('redirect', f'ip:10.0.{next(counter) % 65536}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-k', dest='keyword', help='Only run benchmarks whose name contains this')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', default=harness.DEFAULT_BASELINE, help='Baseline JSON file (default: benchmarks/baseline.json)')
+    parser.add_argument('--update-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown before a regression is flagged (default: 0.2 = 20%%)')
+    parser.add_argument('--rounds', type=int, help='Override the number of rounds of every benchmark')
+    args = parser.parse_args()
+
+    harness.setup_django()
+    from django.test import override_settings
+
+    # memory click logging, so redirects measure the request path and not click inserts;
+    # a redirect limit far above the benchmark's rate, so the check is measured but never refuses
+    settings = {'CLICK_LOGGING': {'MODE': 'memory', 'FLUSH_INTERVAL': None, 'BATCH_SIZE': 10 ** 9},
+                'RATE_LIMITS': {'RATES': {'redirect': '1000000/s'}}}
+    results = {}
+    with override_settings(SHORTENER=settings):
+        for name, (setup, rounds, iterations) in BENCHMARKS.items():
+            if args.keyword and args.keyword not in name:
+                continue
+            results[name] = harness.measure(setup(), rounds=args.rounds or rounds, iterations=iterations)
+            print(f'{name}: {results[name]["median_us"]:.1f} us')
+
+    baseline = harness.load_results(args.baseline) if os.path.exists(args.baseline) and not args.update_baseline else None
+    print()
+    harness.report(results, baseline)
+    if args.output:
+        harness.write_results(args.output, results)
+    if args.update_baseline:
+        harness.write_results(args.baseline, results)
+        print(f'\nBaseline written to {args.baseline}')
+        return 0
+    if baseline is None:
+        print(f'\nNo baseline at {args.baseline}, run with --update-baseline to record one.')
+        return 0
+
+    regressions = harness.compare(results, baseline, args.threshold)
+    for name, (before, after, change) in regressions.items():
+        print(f'REGRESSION {name}: {before:.1f} us -> {after:.1f} us ({change:+.1%})')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Benchmark of the redirect endpoint under uvicorn: the DRF view (RedirectToOriginalView)
+against the native async view (AsyncRedirectView).
+
+Each variant is served by its own uvicorn process and hit by the keep-alive load generator
+of benchmarks/loadgen.py.
+
+Usage (from url_shortener_service/, with a migrated database and `pip install uvicorn`):
+
+    python benchmarks/redirect_asgi.py --requests 20000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from benchmarks.loadgen import build_request, run_load  # noqa: E402
+
+VARIANTS = {'drf': '0', 'async': '1'}  # variant -> SHORTENER_ASYNC_REDIRECTS
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(variant, port, click_mode):
+    env = dict(os.environ, SHORTENER_ASYNC_REDIRECTS=VARIANTS[variant], SHORTENER_CLICK_MODE=click_mode)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'url_shortener.asgi:application', '--port', str(port), '--log-level', 'warning', '--no-access-log'],
+        cwd=PROJECT_DIR, env=env,
+    )
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:  # wait until the server accepts connections
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f'uvicorn did not start for the {variant} variant')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--click-mode', default='memory', help="SHORTENER_CLICK_MODE of the servers (default: memory)")
+    parser.add_argument('--variants', nargs='+', choices=VARIANTS, default=list(VARIANTS))
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'url_shortener.settings')
+    import django
+    django.setup()
+    from django.db import connection
+    from shortener.models import ShortURL
+
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:  # let the servers' click flushes run while requests read (persists in the file)
+            cursor.execute('PRAGMA journal_mode=WAL')
+    link = ShortURL.objects.create(original_url='https://example.com/benchmark')  # removed again at the end
+    request = build_request('localhost', f'/r/{link.short_code}/')
+    try:
+        print(f'{"variant":<8} {"requests":>9} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8}  statuses')
+        for variant in args.variants:
+            port = free_port()
+            server = start_server(variant, port, args.click_mode)
+            try:
+                asyncio.run(run_load('127.0.0.1', port, request, min(1000, args.requests), args.concurrency))  # warm up caches and connections
+                result = asyncio.run(run_load('127.0.0.1', port, request, args.requests, args.concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f'{variant:<8} {result["requests"]:>9} {result["rps"]:>9.0f} {result["p50_ms"]:>8.2f} {result["p99_ms"]:>8.2f}  {result["statuses"]}')
+    finally:
+        link.delete()
+
+
+if __name__ == '__main__':
+    main()
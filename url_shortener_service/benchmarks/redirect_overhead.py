@@ -0,0 +1,79 @@
+"""
+Per-request overhead of the redirect endpoint inside Django, without a server or network:
+the RedirectFastPathMiddleware against the full middleware stack and the DRF view.
+
+Requests are fed straight to Django's WSGI handler against a throwaway test database, with
+a warm resolution cache and clicks queued in memory, so the numbers are the framework cost.
+
+Usage (from url_shortener_service/):
+
+    python benchmarks/redirect_overhead.py --requests 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(handler, environ, requests):
+    """Average microseconds per request."""
+    def start_response(status, headers):
+        assert status.startswith('302'), status
+
+    for _ in range(min(500, requests)):  # warm up
+        handler(dict(environ), start_response)
+    started = time.perf_counter()
+    for _ in range(requests):
+        handler(dict(environ), start_response)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=10000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'url_shortener.settings')
+    import django
+    django.setup()
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from django.test import RequestFactory, override_settings
+    from shortener.clicks import click_buffer
+
+    connection.creation.create_test_db(verbosity=0)  # never touches the project database
+    from shortener.models import ShortURL
+
+    from django.contrib.auth import get_user_model
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    link = ShortURL.objects.create(original_url='https://example.com/benchmark')
+    user = get_user_model().objects.create_user(username='bench', password='bench-pass-123')
+    token = 'Bearer ' + str(RefreshToken.for_user(user).access_token)  # sent by API clients that are logged in
+    environ = RequestFactory()._base_environ(
+        PATH_INFO=f'/r/{link.short_code}/', REQUEST_METHOD='GET', HTTP_HOST='localhost', HTTP_USER_AGENT='bench',
+    )
+    variants = [
+        ('fast path', {'FAST_PATH': True}, {}),
+        ('DRF view', {'FAST_PATH': False}, {}),
+        ('DRF view + JWT', {'FAST_PATH': False}, {'HTTP_AUTHORIZATION': token}),
+    ]
+
+    results = []
+    for name, redirects, headers in variants:
+        settings = {'REDIRECTS': redirects, 'CLICK_LOGGING': {'MODE': 'memory', 'FLUSH_INTERVAL': None, 'BATCH_SIZE': 10 ** 9}}
+        with override_settings(SHORTENER=settings):
+            results.append((name, measure(WSGIHandler(), {**environ, **headers}, args.requests)))
+            click_buffer._records.clear()  # the benchmark only measures request handling
+
+    baseline = results[0][1]
+    print(f'{"variant":<16} {"us/request":>11} {"vs fast path":>13}')
+    for name, micros in results:
+        print(f'{name:<16} {micros:>11.1f} {micros / baseline:>12.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,40 @@
 from django.contrib import admin
-from .models import ShortURL, ClickEvent
+from .models import ShortURL, ClickEvent, ClickRollup, Device, Domain
+
+@admin.register(Domain)
+class DomainAdmin(admin.ModelAdmin):
+    list_display = ('hostname', 'user', 'is_active', 'created_at')
+    search_fields = ('hostname',)
+    list_filter = ('is_active',)
+    raw_id_fields = ('user',)
+    ordering = ('hostname',)
 
 @admin.register(ShortURL)
 class ShortURLAdmin(admin.ModelAdmin):
-    list_display = ('short_code', 'original_url', 'clicks', 'created_at', 'is_active', 'expiration_date', 'user')
+    list_display = ('short_code', 'domain', 'original_url', 'clicks', 'unique_visitors', 'created_at', 'is_active', 'expiration_date', 'user')
     search_fields = ('short_code', 'original_url')
-    list_filter = ('is_active',)
-    readonly_fields = ('short_code', 'clicks', 'created_at')
+    list_filter = ('is_active', 'domain')
+    list_select_related = ('domain', 'user')
+    readonly_fields = ('short_code', 'clicks', 'unique_visitors', 'created_at')
     ordering = ('-created_at',)
 
 @admin.register(ClickEvent)
 class ClickEventAdmin(admin.ModelAdmin):
-    list_display = ('short_url', 'clicked_at', 'ip_address')
+    list_display = ('short_url', 'clicked_at', 'ip_address', 'country', 'device')
+    list_select_related = ('short_url', 'device')
+    raw_id_fields = ('user_agent',)
     search_fields = ('short_url__short_code', 'ip_address')
     ordering = ('-clicked_at',)
+
+@admin.register(ClickRollup)
+class ClickRollupAdmin(admin.ModelAdmin):
+    list_display = ('short_url', 'granularity', 'bucket_start', 'clicks', 'unique_ips')
+    list_filter = ('granularity',)
+    search_fields = ('short_url__short_code',)
+    exclude = ('ip_sketch',)
+    ordering = ('-bucket_start',)
+
+@admin.register(Device)
+class DeviceAdmin(admin.ModelAdmin):
+    list_display = ('browser', 'os', 'device_type')
+    list_filter = ('device_type', 'os')
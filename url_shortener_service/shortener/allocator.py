@@ -0,0 +1,86 @@
+import os
+import threading
+
+from django.db import connection, transaction
+from django.db.models import F, Max
+from hashids import Hashids
+
+from .conf import get_setting
+
+hashids = Hashids(min_length=6)  # Initialize Hashids for generating short codes
+
+SEQUENCE_NAME = 'short_code'  # row of ShortCodeSequence used for generated short codes
+
+
+class ShortCodeAllocator:
+    """
+    Hands out generated short codes before the ShortURL row is inserted.
+
+    Codes are hashids of numbers taken from the ShortCodeSequence counter row. Each process
+    reserves BLOCK_SIZE numbers at a time with one atomic UPDATE, then encodes them from memory,
+    so most inserts need no extra query and workers never hand out the same number twice.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # the block is shared by the threads of a process
+        self._next = 0  # next unused number of the current block
+        self._limit = 0  # end of the current block (exclusive)
+        self._pid = None  # process that reserved the block, a forked worker must not reuse it
+
+    def allocate(self, count=1):
+        """
+        Return `count` new short codes.
+        """
+        return [hashids.encode(number) for number in self.allocate_numbers(count)]
+
+    def allocate_numbers(self, count):
+        """
+        Return `count` unused sequence numbers, from the local block when it has enough left.
+        """
+        with self._lock:
+            if self._pid != os.getpid():  # forked since the block was reserved
+                self.reset()
+                self._pid = os.getpid()
+
+            taken = min(count, self._limit - self._next)  # use what is left of the current block first
+            numbers = list(range(self._next, self._next + taken))
+            self._next += taken
+            missing = count - taken
+            if not missing:
+                return numbers
+
+            if connection.in_atomic_block:
+                # The reservation would be rolled back with the surrounding transaction while
+                # this process kept the block, so only reserve exactly what is needed here.
+                start, end = self._reserve(missing)
+                return numbers + list(range(start, end))
+
+            block_size = max(missing, get_setting('SHORT_CODES')['BLOCK_SIZE'])
+            start, end = self._reserve(block_size)
+            numbers += list(range(start, start + missing))
+            self._next, self._limit = start + missing, end  # keep the rest of the block for later inserts
+            return numbers
+
+    def reset(self):
+        """
+        Forget the current block (its unused numbers are skipped, never reused).
+        """
+        self._next = self._limit = 0
+
+    def _reserve(self, size):
+        """
+        Atomically move the counter row forward by `size` and return the reserved [start, end) range.
+        """
+        from .models import ShortCodeSequence, ShortURL  # imported here because models.py imports this module
+
+        with transaction.atomic():
+            updated = ShortCodeSequence.objects.filter(name=SEQUENCE_NAME).update(next_value=F('next_value') + size)
+            if not updated:  # fresh database without the row seeded by the migration
+                first = (ShortURL.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+                ShortCodeSequence.objects.get_or_create(name=SEQUENCE_NAME, defaults={'next_value': first})
+                ShortCodeSequence.objects.filter(name=SEQUENCE_NAME).update(next_value=F('next_value') + size)
+            end = ShortCodeSequence.objects.values_list('next_value', flat=True).get(name=SEQUENCE_NAME)
+        return end - size, end
+
+
+short_code_allocator = ShortCodeAllocator()  # process-wide instance used by ShortURL.save() and bulk creates
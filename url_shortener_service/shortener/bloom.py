@@ -0,0 +1,241 @@
+import atexit
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+
+from django.db import connection
+
+from .conf import get_setting
+from .counters import bump_counter, counter_value
+from .cursors import IdCursor
+from .domains import routing_key
+
+logger = logging.getLogger(__name__)
+
+RENAMES_COUNTER = 'short_code_renames'  # ChangeCounter counting short code changes
+FILE_MAGIC = b'SCF3'  # SCF1 files held a catch-up time instead of the last id, SCF2 files unprefixed default host keys
+
+
+class BloomFilter:
+    """
+    Bloom filter over strings: `value in filter` is False only for values never added, and
+    wrongly True for about `error_rate` of the others once `capacity` values were added.
+    """
+
+    def __init__(self, capacity, error_rate=0.01, bits=None, hashes=None, count=0):
+        self.capacity = capacity
+        self.size = bits or max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))  # number of bits
+        self.hashes = hashes or max(1, round(self.size / capacity * math.log(2)))
+        self.count = count  # values added, including duplicates
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]  # double hashing
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def to_bytes(self):
+        return struct.pack('>QQBQ', self.capacity, self.size, self.hashes, self.count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        header = struct.calcsize('>QQBQ')
+        capacity, size, hashes, count = struct.unpack('>QQBQ', data[:header])
+        bloom = cls(capacity, bits=size, hashes=hashes, count=count)
+        if len(data) - header != len(bloom.bits):
+            raise ValueError('Truncated Bloom filter data.')
+        bloom.bits[:] = data[header:]
+        return bloom
+
+
+def rename_count():
+    return counter_value(RENAMES_COUNTER)
+
+
+def record_rename():
+    """
+    Count a short code change. Codes are never removed from the filters, but a renamed link's
+    new code is not caught by the id catch-up, so filters rebuild when the count moves.
+    """
+    bump_counter(RENAMES_COUNTER)
+
+
+class CodeFilter:
+    """
+    Per-process Bloom filter of every existing short code (by routing key, so per domain),
+    consulted by the resolution cache before the database so lookups of codes that do not
+    exist never leave memory.
+
+    Built from ShortURL.short_code by a background thread on first use (or loaded from
+    SHORTENER['BLOOM_FILTER']['FILE'] for a warm start); until it is ready every code passes
+    through to the database. Then kept current by:
+    - adding codes saved by this process right away (ShortURL.save, bulk creates)
+    - every REFRESH_INTERVAL seconds, adding the rows created in the meantime by other processes
+      (read by id, see IdCursor) and rebuilding after short code renames
+    Codes created elsewhere are published to the shared cache tier on commit, which covers
+    the time until the next refresh when that tier spans the worker processes; otherwise the
+    resolution cache catches up (see caught_up_since) before it lets the filter rule a code out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._pid = None  # process that built the filter
+        self._cursor = IdCursor()  # ShortURL rows the filter holds
+        self._renames = None  # rename count the filter reflects
+        self._checked_at = float('-inf')  # monotonic time of the last refresh
+        self._builder = None  # thread building the filter off the request path
+
+    def __contains__(self, short_code):
+        """Whether the code may exist. Always True when disabled or not built yet."""
+        bloom = self._filter
+        return bloom is None or self._pid != os.getpid() or short_code in bloom
+
+    def due(self):
+        """Whether refresh() should run before the filter is consulted."""
+        config = get_setting('BLOOM_FILTER')
+        if not config['ENABLED'] or (self._pid == os.getpid() and self._building()):
+            return False  # the filter being built is installed when ready
+        return self._pid != os.getpid() or time.monotonic() - self._checked_at >= config['REFRESH_INTERVAL']  # also paces retries of a failed build
+
+    def caught_up_since(self, since):
+        """Whether a catch-up with the database ran after `since` (a time.monotonic() value)."""
+        return self._checked_at >= since
+
+    def might_contain(self, short_code):
+        if not get_setting('BLOOM_FILTER')['ENABLED']:
+            return True
+        if self.due():
+            self.refresh(background=True)
+        return short_code in self
+
+    def add(self, *short_codes):
+        bloom = self._filter
+        if bloom is not None:
+            for short_code in short_codes:
+                bloom.add(short_code)
+
+    def refresh(self, background=False):
+        """
+        Build or load the filter if this process has none, then catch up with the database.
+        With background=True (the request path) a build runs in a thread and the filter passes
+        every code until it is installed; catch-ups are one indexed query and run inline. Inside
+        a transaction the build stays inline, as only this connection sees the rows written in it.
+        """
+        from .models import ShortURL
+
+        config = get_setting('BLOOM_FILTER')
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if self._pid != os.getpid():  # forked worker, the parent's builder thread is not ours
+                self._pid, self._filter, self._builder = os.getpid(), None, None
+            if background and self._building():
+                return
+            if self._filter is None and not self._load(config):
+                return self._rebuild(config, background)
+            if rename_count() != self._renames:
+                self._filter = None  # renamed codes are missing from it, pass everything until rebuilt
+                return self._rebuild(config, background)
+            if self._filter.count > self._filter.capacity:
+                return self._rebuild(config, background)  # so many codes that the error rate suffers, still correct meanwhile
+            rows = list(self._cursor.unread(ShortURL.objects.all()).values_list('id', 'domain_id', 'short_code'))
+            for _, domain_id, short_code in rows:
+                self._filter.add(routing_key(domain_id, short_code))
+            self._cursor.advance([pk for pk, _, _ in rows], config['REFRESH_MARGIN'])
+
+    def _building(self):
+        builder = self._builder
+        return builder is not None and builder.is_alive()
+
+    def _rebuild(self, config, background):
+        """Build a new filter, in this thread or in a background one (at most one at a time)."""
+        if not background or connection.in_atomic_block:
+            self._install(*self._build(config))
+            return
+        if not self._building():
+            self._builder = threading.Thread(target=self._build_in_background, args=(config,), name='code-filter-build', daemon=True)
+            self._builder.start()
+
+    def _build_in_background(self, config):
+        try:
+            built = self._build(config)
+            with self._lock:
+                if self._pid == os.getpid():
+                    self._install(*built)
+        except Exception:
+            logger.exception('Failed to build the short code filter, codes pass through to the database')
+        finally:
+            connection.close()  # this thread's connection
+
+    def _build(self, config):
+        """Read every short code into a new filter. Returns the filter, its cursor and the rename count."""
+        from .models import ShortURL
+
+        renames, cursor = rename_count(), IdCursor()
+        bloom = BloomFilter(max(config['CAPACITY'], 2 * ShortURL.objects.count()), config['ERROR_RATE'])
+        chunk = []
+        for pk, domain_id, short_code in ShortURL.objects.order_by('id').values_list('id', 'domain_id', 'short_code').iterator(chunk_size=10000):
+            bloom.add(routing_key(domain_id, short_code))
+            chunk.append(pk)
+            if len(chunk) >= 10000:
+                cursor.advance(chunk, config['REFRESH_MARGIN'])
+                chunk = []
+        cursor.advance(chunk, config['REFRESH_MARGIN'])
+        return bloom, cursor, renames
+
+    def _install(self, bloom, cursor, renames):
+        """Swap in a built filter. Must hold the lock."""
+        self._filter, self._cursor, self._renames = bloom, cursor, renames
+        self._save(get_setting('BLOOM_FILTER'))
+
+    def _load(self, config):
+        """Load the filter saved by a previous process. Returns False if there is none."""
+        path = config['FILE']
+        try:
+            with open(path, 'rb') as handle:
+                data = handle.read()
+            magic, last_id, renames = struct.unpack('>4sqq', data[:20])
+            if magic != FILE_MAGIC:
+                return False
+            self._filter, self._cursor, self._renames = BloomFilter.from_bytes(data[20:]), IdCursor(last_id), renames
+            return True
+        except (TypeError, OSError, ValueError, struct.error):  # no file configured, missing or unreadable
+            return False
+
+    def _save(self, config):
+        path = config['FILE']
+        if not path or self._filter is None:
+            return
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as handle:  # rows still in a gap are read again after a warm start
+            handle.write(struct.pack('>4sqq', FILE_MAGIC, self._cursor.resume_id(), self._renames) + self._filter.to_bytes())
+        os.replace(temp_path, path)
+
+    def save(self):
+        """Persist the filter of this process (also done at exit) for the next warm start."""
+        with self._lock:
+            if self._pid == os.getpid():
+                self._save(get_setting('BLOOM_FILTER'))
+
+    def reset(self):
+        """Drop the filter; the next lookup rebuilds it."""
+        with self._lock:
+            self._filter = None
+            self._checked_at = float('-inf')
+
+
+code_filter = CodeFilter()  # process-wide instance used by the resolution cache
+atexit.register(code_filter.save)
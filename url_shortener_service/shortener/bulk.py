@@ -0,0 +1,84 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .allocator import short_code_allocator
+from .bloom import code_filter
+from .cache import ResolvedURL, resolution_cache
+from .domains import routing_key
+from .models import ShortURL
+from .serializers import DUPLICATE_CODE_ERROR, BulkShortURLSerializer
+
+
+def validate_items(items, user=None):
+    """
+    Validate every item of a bulk request. Returns (validated, errors) where `validated` maps
+    item index -> validated data and `errors` maps item index -> error dict.
+    """
+    validator = BulkShortURLSerializer(context={'user': user})  # one instance validates every item, no per-item field setup
+    validated, errors = {}, {}
+    for index, item in enumerate(items):
+        try:
+            validated[index] = validator.run_validation(item)
+        except ValidationError as exc:
+            detail = exc.detail if isinstance(exc.detail, dict) else {'non_field_errors': exc.detail}
+            errors[index] = detail
+    return validated, errors
+
+
+def reject_taken_codes(validated, errors):
+    """
+    Move items whose custom short code is taken on their domain (in the database or earlier in
+    the batch) from `validated` to `errors`, with a single query for the whole batch.
+    """
+    custom = {index: (data.get('domain_id'), data['short_code']) for index, data in validated.items() if data.get('short_code')}
+    by_domain = {}
+    for domain_id, code in custom.values():
+        by_domain.setdefault(domain_id, set()).add(code)
+    taken = set()
+    if by_domain:
+        query = Q()
+        for domain_id, codes in by_domain.items():
+            query |= Q(domain_id=domain_id, short_code__in=codes)  # domain_id=None is the default host
+        taken = {routing_key(*row) for row in ShortURL.objects.filter(query).values_list('domain_id', 'short_code')}
+    for index, (domain_id, code) in sorted(custom.items()):
+        key = routing_key(domain_id, code)
+        if key in taken:
+            errors[index] = {'short_code': [DUPLICATE_CODE_ERROR]}
+            del validated[index]
+        taken.add(key)  # later items in the batch may not reuse it either
+
+
+def create_short_urls(items, user):
+    """
+    Validate and insert a batch of URLs with bulk_create.
+
+    Returns one result per item, in order: ('created', ShortURL) or ('error', error dict).
+    """
+    validated, errors = validate_items(items, user)
+    for attempt in range(2):
+        reject_taken_codes(validated, errors)
+        objects = {index: ShortURL(user=user, **data) for index, data in validated.items()}
+        generated = [obj for obj in objects.values() if not obj.short_code]
+        for obj, code in zip(generated, short_code_allocator.allocate(len(generated))):
+            obj.short_code = code  # codes are known before the INSERT, so bulk_create can be used
+        try:
+            with transaction.atomic():
+                ShortURL.objects.bulk_create(list(objects.values()))
+            break
+        except IntegrityError:
+            if attempt:  # still conflicting after re-checking the custom codes
+                raise
+            # a custom code was taken by a concurrent request, check again and retry once
+    publish(list(objects.values()))
+    return [('created', objects[index]) if index in objects else ('error', errors[index]) for index in range(len(items))]
+
+
+def publish(created):
+    """
+    Make bulk created codes resolvable right away: bulk_create skips ShortURL.save(), which
+    otherwise adds the code to the code filter and writes the mapping to the resolution cache.
+    """
+    code_filter.add(*(obj.routing_key for obj in created))
+    entries = {obj.routing_key: ResolvedURL(obj.pk, obj.original_url, obj.is_active, obj.expiration_date) for obj in created}
+    transaction.on_commit(lambda: [resolution_cache.store(key, entry) for key, entry in entries.items()])
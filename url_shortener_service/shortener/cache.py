@@ -0,0 +1,383 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+
+from .bloom import code_filter
+from .conf import get_setting
+from .domains import routing_key
+from .snapshot import redirect_snapshot
+
+# What the redirect path needs to know about a short code, without loading the model
+ResolvedURL = namedtuple('ResolvedURL', ['id', 'original_url', 'is_active', 'expiration_date'])
+
+MISSING = ResolvedURL(None, '', False, None)  # negative entry: the code does not exist
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)  # cache backends other worker processes cannot see
+
+
+def is_dead(entry):
+    """Whether a mapping can no longer be followed (deactivated or past its expiration date)."""
+    return not entry.is_active or (entry.expiration_date is not None and entry.expiration_date <= timezone.now())
+
+
+def tombstone(entry):
+    """Compact form of a dead mapping: enough to answer 404/410, without the destination URL."""
+    return entry._replace(original_url='')
+
+
+class LocalTier:
+    """
+    In-process LRU tier. Entries expire after LOCAL_TIMEOUT seconds so that
+    invalidations made by other worker processes are picked up eventually.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()  # routing key -> (expires_at, ResolvedURL), oldest first
+        self._lock = threading.Lock()  # guard the OrderedDict across request threads
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():  # entry is too old, drop it
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)  # mark as most recently used
+            return value
+
+    def set(self, key, value, timeout):
+        config = get_setting('RESOLUTION_CACHE')
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > config['LOCAL_MAX_ENTRIES']:  # evict least recently used entries
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedTier:
+    """
+    Shared tier backed by a Django cache alias (Redis, Memcached, locmem...),
+    so that worker processes can reuse each other's lookups.
+
+    Keys carry a generation number kept in the alias itself ('<KEY_PREFIX><generation>:<key>'):
+    clear() replaces it, which orphans every entry of the tier (they expire on their own) without
+    touching other users of the alias. Each process rereads the generation at most every
+    LOCAL_TIMEOUT seconds, the staleness already accepted for the local tier.
+    """
+    GENERATION_KEY = 'generation'
+
+    def __init__(self):
+        self._generation = None  # (alias, prefix, generation, monotonic time read)
+
+    def _backend(self):
+        alias = get_setting('RESOLUTION_CACHE')['SHARED_CACHE_ALIAS']
+        return caches[alias] if alias else None  # None when the shared tier is disabled
+
+    def spans_processes(self):
+        """Whether the tier is shared by the worker processes, so what one publishes the others read."""
+        backend = self._backend()
+        return backend is not None and not isinstance(backend, PROCESS_LOCAL_BACKENDS)
+
+    def _cached_generation(self):
+        """(settings, generation) with generation None when it must be reread from the alias."""
+        settings = get_setting('RESOLUTION_CACHE')
+        alias, prefix, generation, read_at = self._generation or (None, None, None, float('-inf'))
+        if (alias, prefix) != (settings['SHARED_CACHE_ALIAS'], settings['KEY_PREFIX']) or time.monotonic() - read_at >= settings['LOCAL_TIMEOUT']:
+            return settings, None
+        return settings, generation
+
+    def _remember_generation(self, settings, generation):
+        self._generation = (settings['SHARED_CACHE_ALIAS'], settings['KEY_PREFIX'], generation or 0, time.monotonic())
+        return f"{settings['KEY_PREFIX']}{generation or 0}:"
+
+    def _prefix(self, backend):
+        settings, generation = self._cached_generation()
+        if generation is None:
+            generation = backend.get(settings['KEY_PREFIX'] + self.GENERATION_KEY)
+        return self._remember_generation(settings, generation)
+
+    async def _aprefix(self, backend):
+        settings, generation = self._cached_generation()
+        if generation is None:
+            generation = await backend.aget(settings['KEY_PREFIX'] + self.GENERATION_KEY)
+        return self._remember_generation(settings, generation)
+
+    def get(self, key):
+        backend = self._backend()
+        if backend is None:
+            return None
+        value = backend.get(self._prefix(backend) + key)
+        return ResolvedURL(*value) if value is not None else None  # stored as a plain tuple
+
+    async def aget(self, key):
+        backend = self._backend()
+        if backend is None:
+            return None
+        value = await backend.aget(await self._aprefix(backend) + key)
+        return ResolvedURL(*value) if value is not None else None
+
+    def set(self, key, value, timeout):
+        backend = self._backend()
+        if backend is not None:
+            backend.set(self._prefix(backend) + key, tuple(value), timeout)
+
+    async def aset(self, key, value, timeout):
+        backend = self._backend()
+        if backend is not None:
+            await backend.aset(await self._aprefix(backend) + key, tuple(value), timeout)
+
+    def delete(self, key):
+        backend = self._backend()
+        if backend is not None:
+            backend.delete(self._prefix(backend) + key)
+
+    def clear(self):
+        """Drop this tier's entries by moving to a new key generation; other keys of the alias stay."""
+        backend = self._backend()
+        if backend is None:
+            return
+        settings = get_setting('RESOLUTION_CACHE')
+        generation = time.time_ns()  # unique without a read-modify-write, even when the old value was evicted
+        backend.set(settings['KEY_PREFIX'] + self.GENERATION_KEY, generation, None)
+        self._remember_generation(settings, generation)
+
+
+class ResolutionCache:
+    """
+    Two-tier cache mapping short codes to ResolvedURL entries, keyed by routing key
+    (domains.routing_key: '/<code>' on the default host, '<domain id>/<code>' on custom domains).
+
+    Lookups go local tier -> redirect snapshot (when configured) -> shared tier -> Bloom filter
+    of existing codes -> database.
+    Codes the filter rules out, and codes the database does not have, are answered in
+    memory; the latter are also cached as negative entries for NEGATIVE_TIMEOUT seconds.
+    Unless the shared tier spans the worker processes (where links created by another worker
+    are published), a code is only ruled out by a filter that caught up with the database
+    after the lookup started, so a link created elsewhere moments ago is never answered 404.
+    Writes to ShortURL must call invalidate() (the model and viewset do this) so stale
+    mappings are dropped.
+    """
+
+    def __init__(self, local=None, shared=None):
+        self.local = local or LocalTier()
+        self.shared = shared or SharedTier()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+        self.reset_stats()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def load(self, short_code, domain_id=None):
+        """
+        Fetch the mapping for a short code of a domain from the database, or None if it does not exist.
+        """
+        from .models import ShortURL  # imported here because models.py imports this module
+
+        rows = list(
+            ShortURL.objects.filter(short_code=short_code, domain_id=domain_id)  # domain_id=None matches the default host
+            .values_list('id', 'original_url', 'is_active', 'expiration_date')[:1]
+        )
+        return ResolvedURL(*rows[0]) if rows else None
+
+    async def aload(self, short_code, domain_id=None):
+        """
+        Async version of load(), using the async ORM interface.
+        """
+        from .models import ShortURL
+
+        rows = [
+            row async for row in ShortURL.objects.filter(short_code=short_code, domain_id=domain_id)
+            .values_list('id', 'original_url', 'is_active', 'expiration_date')[:1]
+        ]
+        return ResolvedURL(*rows[0]) if rows else None
+
+    def resolve(self, short_code, domain_id=None):
+        """
+        Return the ResolvedURL for a short code of a domain (None: the default host), or None if
+        it does not exist, consulting the cache tiers and the code filter before the database.
+        """
+        config = get_setting('RESOLUTION_CACHE')
+        if not config['ENABLED']:
+            self._count('db_lookups')
+            return self.load(short_code, domain_id)
+
+        started = time.monotonic()
+        key = routing_key(domain_id, short_code)
+        entry = self.local.get(key)
+        if entry is not None:
+            if entry.original_url and is_dead(entry):  # expired since it was cached, keep it as a tombstone
+                entry = self.store(key, entry)
+            return self._hit(entry, 'local_hits')
+
+        row = redirect_snapshot.get(key)
+        if row is not None:
+            return self._hit(ResolvedURL._make(row), 'snapshot_hits')
+
+        entry = self.shared.get(key)
+        if entry is not None:
+            if entry.original_url and is_dead(entry):
+                entry = self.store(key, entry)
+            else:
+                self.local.set(key, entry, self._local_timeout(entry, config))  # promote to the local tier
+            return self._hit(entry, 'shared_hits')
+
+        if not code_filter.might_contain(key):
+            if not (self.shared.spans_processes() or code_filter.caught_up_since(started)):
+                self._count('filter_catch_ups')
+                code_filter.refresh(background=True)  # one indexed query for the rows other workers added since
+            if key not in code_filter:
+                self._count('filter_rejects')
+                return None
+
+        self._count('misses')
+        self._count('db_lookups')
+        entry = self.load(short_code, domain_id)
+        return self.store(key, entry if entry is not None else MISSING)
+
+    async def aresolve(self, short_code, domain_id=None):
+        """
+        Async version of resolve() for async views. The local tier and the code filter are
+        plain memory and are read directly on the event loop; the shared tier and the
+        database use the async APIs.
+        """
+        config = get_setting('RESOLUTION_CACHE')
+        if not config['ENABLED']:
+            self._count('db_lookups')
+            return await self.aload(short_code, domain_id)
+
+        started = time.monotonic()
+        key = routing_key(domain_id, short_code)
+        entry = self.local.get(key)
+        if entry is not None:
+            if entry.original_url and is_dead(entry):
+                entry = await self.astore(key, entry)
+            return self._hit(entry, 'local_hits')
+
+        if redirect_snapshot.enabled():
+            if redirect_snapshot.due():
+                await sync_to_async(redirect_snapshot.refresh)()  # reading the change markers queries the database
+            row = redirect_snapshot.lookup(key)
+            if row is not None:
+                return self._hit(ResolvedURL._make(row), 'snapshot_hits')
+
+        entry = await self.shared.aget(key)
+        if entry is not None:
+            if entry.original_url and is_dead(entry):
+                entry = await self.astore(key, entry)
+            else:
+                self.local.set(key, entry, self._local_timeout(entry, config))
+            return self._hit(entry, 'shared_hits')
+
+        if code_filter.due():
+            await sync_to_async(code_filter.refresh)(background=True)  # the catch-up queries the database, a build runs in a thread
+        if key not in code_filter and not (self.shared.spans_processes() or code_filter.caught_up_since(started)):
+            self._count('filter_catch_ups')
+            await sync_to_async(code_filter.refresh)(background=True)
+        if key not in code_filter:
+            self._count('filter_rejects')
+            return None
+
+        self._count('misses')
+        self._count('db_lookups')
+        entry = await self.aload(short_code, domain_id)
+        return await self.astore(key, entry if entry is not None else MISSING)
+
+    def _hit(self, entry, counter):
+        """Count a cache hit and return its mapping, None for a negative entry."""
+        if entry.id is None:
+            self._count('negative_hits')
+            return None
+        self._count(counter)
+        return entry
+
+    def _local_timeout(self, entry, config):
+        return config['NEGATIVE_TIMEOUT'] if entry.id is None else config['LOCAL_TIMEOUT']
+
+    def _prepare(self, entry, config):
+        """The form and shared tier timeout an entry is cached with."""
+        if entry.id is None:
+            return entry, config['NEGATIVE_TIMEOUT']  # a code created meanwhile invalidates it, keep it short anyway
+        if is_dead(entry):
+            return tombstone(entry), config['TOMBSTONE_TIMEOUT']
+        return entry, config['SHARED_TIMEOUT']
+
+    def store(self, key, entry):
+        """
+        Cache a mapping (or MISSING) under its routing key in both tiers and return it, None for MISSING.
+
+        Dead mappings are stored as tombstones, kept TOMBSTONE_TIMEOUT seconds in the shared
+        tier: they only come back to life through a save, which invalidates them, so expired
+        codes are answered without the database.
+        """
+        config = get_setting('RESOLUTION_CACHE')
+        entry, shared_timeout = self._prepare(entry, config)
+        self.shared.set(key, entry, shared_timeout)
+        self.local.set(key, entry, self._local_timeout(entry, config))  # other processes may change it, keep this short
+        return entry if entry.id is not None else None
+
+    async def astore(self, key, entry):
+        """
+        Async version of store().
+        """
+        config = get_setting('RESOLUTION_CACHE')
+        entry, shared_timeout = self._prepare(entry, config)
+        await self.shared.aset(key, entry, shared_timeout)
+        self.local.set(key, entry, self._local_timeout(entry, config))
+        return entry if entry.id is not None else None
+
+    def invalidate(self, *keys):
+        """
+        Drop cached mappings for the given routing keys from both tiers.
+        """
+        for key in keys:
+            if not key:
+                continue
+            self.local.delete(key)
+            self.shared.delete(key)
+            self._count('invalidations')
+
+    def clear(self):
+        """
+        Drop every cached mapping (used by tests and after bulk data changes).
+        """
+        self.local.clear()
+        self.shared.clear()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = dict.fromkeys(['local_hits', 'snapshot_hits', 'shared_hits', 'negative_hits', 'filter_catch_ups', 'filter_rejects', 'misses', 'db_lookups', 'invalidations'], 0)
+
+    def stats(self):
+        """
+        Return hit/miss counters for this process, plus the share of lookups answered without the database.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        answered = stats['local_hits'] + stats['snapshot_hits'] + stats['shared_hits'] + stats['negative_hits'] + stats['filter_rejects']  # without the database
+        lookups = answered + stats['misses']
+        stats['hit_ratio'] = round(answered / lookups, 4) if lookups else None
+        stats['local_entries'] = len(self.local)
+        return stats
+
+
+resolution_cache = ResolutionCache()  # process-wide instance used by the views and model hooks
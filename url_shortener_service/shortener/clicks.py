@@ -0,0 +1,326 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+from collections import Counter, namedtuple
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+from .conf import get_setting
+from .counters import add_to_shards, hot_links
+
+logger = logging.getLogger(__name__)
+
+# Lightweight click record queued by the redirect view instead of a model instance
+ClickRecord = namedtuple('ClickRecord', ['short_url_id', 'clicked_at', 'ip_address', 'user_agent', 'referrer'], defaults=[None])
+
+
+def persist_clicks(records, aggregates=True):
+    """
+    Write a batch of click records: one counter UPDATE per short URL (which also stores the new
+    unique visitor estimate), one bulk INSERT of events, and the matching sketch and rollup updates.
+    Hot links get a counter shard UPDATE instead of the ShortURL one (see HotLinks).
+    With aggregates=False only the counters and events are written, and the caller must pass the
+    records to update_aggregates() later ('sync' mode, see ClickBuffer).
+
+    Records for short URLs deleted in the meantime are dropped. Returns the number of events written.
+    """
+    from .models import ShortURL, ClickEvent  # imported here because models.py is loaded after this module
+    from .rollups import update_rollups
+    from .visitors import VisitorSketchBatch
+    from .interning import user_agents
+
+    if not records:
+        return 0
+    counts = Counter(record.short_url_id for record in records)  # aggregate clicks per short URL
+    hot = {short_url_id: count for short_url_id, count in counts.items() if hot_links.is_hot(short_url_id)}
+    with transaction.atomic():
+        visitors = VisitorSketchBatch(records if aggregates else [])  # unique visitor sketches of the batch's links, merged in memory
+        estimates = visitors.estimates()
+        existing = add_to_shards(hot) if hot else set()  # the estimates of hot links are stored when shards are folded
+        for short_url_id, count in counts.items():
+            if short_url_id in hot:
+                continue
+            changes = {'clicks': F('clicks') + count}
+            if short_url_id in estimates:
+                changes['unique_visitors'] = estimates[short_url_id]  # same UPDATE, no extra query
+            if ShortURL.objects.filter(pk=short_url_id).update(**changes):  # 0 rows when deleted
+                existing.add(short_url_id)
+        visitors.save(existing)
+        kept = [record for record in records if record.short_url_id in existing]
+        agent_ids = user_agents.ids(record.user_agent for record in kept)  # interned, one id per distinct string
+        events = [
+            ClickEvent(
+                short_url_id=record.short_url_id,
+                clicked_at=record.clicked_at,  # keep the time of the click, not the time of the flush
+                ip_address=record.ip_address,
+                user_agent_id=agent_ids.get(record.user_agent),
+                referrer=record.referrer,
+            )
+            for record in kept
+        ]
+        ClickEvent.objects.bulk_create(events, batch_size=get_setting('CLICK_LOGGING')['BATCH_SIZE'])
+        if aggregates:
+            update_rollups(kept)
+    return len(events)
+
+
+def update_aggregates(records):
+    """
+    Add click records whose events and counters persist_clicks(records, aggregates=False) already
+    wrote to the unique visitor sketches and the rollups, for the whole batch at once: the sketch
+    and existence SELECTs, one estimate UPDATE per link and the rollup updates.
+
+    Records for short URLs deleted in the meantime are dropped. Returns the number of records applied.
+    """
+    from .models import ShortURL
+    from .rollups import update_rollups
+    from .visitors import VisitorSketchBatch
+
+    if not records:
+        return 0
+    with transaction.atomic():
+        visitors = VisitorSketchBatch(records)
+        existing = set(ShortURL.objects.filter(pk__in={record.short_url_id for record in records}).values_list('pk', flat=True))
+        for short_url_id, estimate in visitors.estimates().items():
+            if short_url_id in existing and not hot_links.is_hot(short_url_id):  # hot links get theirs when shards are folded
+                ShortURL.objects.filter(pk=short_url_id).update(unique_visitors=estimate)
+        visitors.save(existing)
+        kept = [record for record in records if record.short_url_id in existing]
+        update_rollups(kept)
+    return len(kept)
+
+
+def encode_record(record):
+    """Serialize a click record to one journal line."""
+    return json.dumps([record.short_url_id, record.clicked_at.isoformat(), record.ip_address, record.user_agent, record.referrer])
+
+
+def decode_record(line):
+    """Parse a journal line written by encode_record."""
+    short_url_id, clicked_at, *rest = json.loads(line)  # older journals have no referrer
+    return ClickRecord(short_url_id, datetime.fromisoformat(clicked_at), *rest)
+
+
+def replay_journal(path, batch_size):
+    """
+    Persist every record of a journal file in batches, then delete the file. Returns the number of records read.
+    """
+    total = 0
+    batch = []
+    with open(path, encoding='utf-8') as journal:
+        for line in journal:
+            if not line.strip():
+                continue
+            try:
+                batch.append(decode_record(line))
+            except ValueError:  # half-written last line of a crashed process
+                logger.warning('Skipping unreadable click journal line in %s', path)
+                continue
+            if len(batch) >= batch_size:
+                persist_clicks(batch)
+                total += len(batch)
+                batch = []
+    persist_clicks(batch)
+    total += len(batch)
+    os.remove(path)
+    return total
+
+
+class ClickBuffer:
+    """
+    Per-process click ingestion buffer.
+
+    Durability modes (SHORTENER['CLICK_LOGGING']['MODE']):
+    - 'sync': write the event and counter of each click inside the request, and queue the click
+      for the visitor sketch and rollup updates, which the flushes apply per batch
+      (update_aggregates); clicks on hot links (see HotLinks) are queued like in 'memory' mode
+    - 'memory': queue clicks in memory, lost if the process crashes before a flush
+    - 'disk': also append each click to a journal file, replayed by `manage.py drain_clicks`
+
+    Queued clicks are flushed by a background thread every FLUSH_INTERVAL seconds or
+    as soon as BATCH_SIZE clicks are pending, and once more when the process exits.
+    """
+
+    def __init__(self):
+        self._records = []  # pending ClickRecords
+        self._written = []  # ClickRecords written in 'sync' mode, still to be added to the sketches and rollups
+        self._lock = threading.Lock()  # guards _records and the journal file
+        self._wakeup = threading.Event()  # set to make the flusher run before its interval ends
+        self._thread = None
+        self._pid = None  # process that owns the thread and journal, reset after a fork
+        self._journal = None
+        self._journal_path = None
+        self._flushing_paths = []  # rotated journals whose clicks are not in the database yet
+        self._rotations = 0
+
+    def add(self, record):
+        """
+        Queue a click record (or write its event and counter right away in 'sync' mode).
+        """
+        config = get_setting('CLICK_LOGGING')
+        hot = hot_links.hit(record.short_url_id)
+        if config['MODE'] == 'sync' and not hot:
+            persist_clicks([record], aggregates=False)  # the counter UPDATE and event INSERT, the rest is batched
+            transaction.on_commit(lambda: self._queue(record, config, written=True))  # once the click is committed
+            return
+        self._queue(record, config)
+
+    def _queue(self, record, config, written=False):
+        """Queue a record, then flush or wake the flusher as the queue length and settings require."""
+        pending = self._enqueue(record, config, written)
+        if config['FLUSH_INTERVAL'] is None:  # no background thread, flush inline on the size threshold
+            if pending >= config['BATCH_SIZE']:
+                self.flush()
+            return
+        self._ensure_thread()
+        if pending >= config['BATCH_SIZE']:
+            self._wakeup.set()  # let the flusher write the full batch now
+        if pending >= config['MAX_PENDING']:
+            self.flush()  # the flusher is falling behind, apply backpressure on the request
+
+    async def aadd(self, record):
+        """
+        Queue a click record from an async view without writing to the database on the event loop.
+
+        Every mode queues the record and leaves the write to the flusher thread; 'sync' mode
+        wakes the flusher right away, so the click is written moments after the response
+        (unless the link is hot, whose clicks are batched).
+        Only the MAX_PENDING backpressure flush is awaited by the request.
+        """
+        config = get_setting('CLICK_LOGGING')
+        hot = hot_links.hit(record.short_url_id)
+        pending = self._enqueue(record, config)
+        flush_now = (config['MODE'] == 'sync' and not hot) or pending >= config['BATCH_SIZE']
+        if flush_now or config['FLUSH_INTERVAL'] is not None:
+            self._ensure_thread()
+        if flush_now:
+            self._wakeup.set()
+        if pending >= config['MAX_PENDING']:
+            await sync_to_async(self.flush)()
+
+    def _enqueue(self, record, config, written=False):
+        """
+        Append a record to the queue (and the journal in 'disk' mode), or to the written records
+        awaiting their aggregates, returning the number of queued records.
+        """
+        if config['MODE'] not in ('sync', 'memory', 'disk'):
+            raise ImproperlyConfigured("SHORTENER['CLICK_LOGGING']['MODE'] must be 'sync', 'memory' or 'disk'.")
+        with self._lock:
+            self._check_process()
+            if written:
+                self._written.append(record)
+            else:
+                self._records.append(record)
+                if config['MODE'] == 'disk':
+                    self._write_journal(record, config)
+            return len(self._records) + len(self._written)
+
+    def pending(self):
+        """Number of queued clicks not yet written."""
+        return len(self._records)
+
+    def pending_aggregates(self):
+        """Number of clicks written in 'sync' mode whose sketch and rollup updates are still queued."""
+        return len(self._written)
+
+    def flush(self):
+        """
+        Write every queued click, and the aggregates of the clicks written in 'sync' mode.
+        On failure the clicks are put back in the queue. Returns the number of queued clicks written.
+        """
+        with self._lock:
+            records, self._records = self._records, []
+            written, self._written = self._written, []
+            self._rotate_journal()
+            flushing_paths, self._flushing_paths = self._flushing_paths, []
+        try:
+            persist_clicks(records)
+        except Exception:
+            logger.exception('Failed to flush %d clicks, keeping them queued', len(records))
+            with self._lock:
+                self._records[:0] = records  # keep the original order ahead of newer clicks
+                self._written[:0] = written
+                self._flushing_paths[:0] = flushing_paths  # their journals stay until a flush succeeds
+            raise
+        for path in flushing_paths:
+            os.remove(path)  # these clicks are in the database now
+        try:
+            update_aggregates(written)
+        except Exception:
+            logger.exception('Failed to update the aggregates of %d clicks, keeping them queued', len(written))
+            with self._lock:
+                self._written[:0] = written
+            raise
+        return len(records)
+
+    def _check_process(self):
+        """Start over with a fresh thread and journal in a forked worker process."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = None
+            self._journal = None
+            self._journal_path = None
+            self._flushing_paths = []
+
+    def _write_journal(self, record, config):
+        if self._journal is None:
+            journal_dir = config['JOURNAL_DIR']
+            if not journal_dir:
+                raise ImproperlyConfigured("SHORTENER['CLICK_LOGGING']['JOURNAL_DIR'] is required in 'disk' mode.")
+            os.makedirs(journal_dir, exist_ok=True)
+            self._journal_path = os.path.join(journal_dir, f'clicks-{self._pid}.jsonl')
+            self._journal = open(self._journal_path, 'a', encoding='utf-8')
+        self._journal.write(encode_record(record) + '\n')
+        self._journal.flush()
+        if config['FSYNC']:
+            os.fsync(self._journal.fileno())  # survive power loss, at the cost of a disk sync per click
+
+    def _rotate_journal(self):
+        """Move the current journal aside while its clicks are written. Must hold the lock."""
+        if self._journal is None:
+            return
+        self._journal.close()
+        self._rotations += 1
+        flushing_path = f'{self._journal_path}.{self._rotations}.flushing'
+        self._journal = None
+        try:
+            os.replace(self._journal_path, flushing_path)
+        except FileNotFoundError:  # already replayed by drain_clicks
+            return
+        self._flushing_paths.append(flushing_path)
+
+    def _ensure_thread(self):
+        with self._lock:  # concurrent requests must not start a second flusher
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='click-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(get_setting('CLICK_LOGGING')['FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            close_old_connections()  # this thread keeps its own database connection
+            try:
+                self.flush()
+            except Exception:
+                pass  # already logged, the clicks stay queued for the next round
+            try:
+                hot_links.fold_if_due()
+            except Exception:
+                logger.exception('Failed to fold click counter shards')
+
+
+def journal_files(journal_dir):
+    """Journal files left in a directory, including ones that were being flushed."""
+    return sorted(glob.glob(os.path.join(journal_dir, 'clicks-*.jsonl*')))
+
+
+click_buffer = ClickBuffer()  # process-wide instance used by the redirect view
+atexit.register(click_buffer.flush)  # write whatever is still queued when the worker exits
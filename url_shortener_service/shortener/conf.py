@@ -0,0 +1,140 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# Default values for the SHORTENER settings dict, grouped by feature.
+# Projects override individual keys, e.g. SHORTENER = {'RESOLUTION_CACHE': {'LOCAL_TIMEOUT': 10}}
+DEFAULTS = {
+    'RESOLUTION_CACHE': {
+        'ENABLED': True,  # Set to False to always resolve short codes from the database
+        'LOCAL_MAX_ENTRIES': 10000,  # Size of the in-process LRU tier
+        'LOCAL_TIMEOUT': 30,  # Seconds an entry may live in the in-process tier (bounds cross-process staleness)
+        'SHARED_CACHE_ALIAS': None,  # Django cache alias used as the shared tier, None disables it
+        'SHARED_TIMEOUT': 300,  # Seconds an entry may live in the shared tier
+        'TOMBSTONE_TIMEOUT': 86400,  # Seconds expired/inactive codes are remembered in the shared tier
+        'NEGATIVE_TIMEOUT': 5,  # Seconds a code found missing in the database is remembered
+        'KEY_PREFIX': 'shortener:resolve:',  # Prefix for keys written to the shared tier
+    },
+    'CLICK_LOGGING': {
+        'MODE': 'memory',  # 'memory' (buffered, the default), 'disk' (buffered + journal) or 'sync' (event and counter written in the request)
+        'BATCH_SIZE': 500,  # Flush as soon as this many clicks are queued
+        'FLUSH_INTERVAL': 2.0,  # Seconds between background flushes, None flushes only on BATCH_SIZE
+        'MAX_PENDING': 50000,  # Requests flush inline above this many queued clicks (backpressure)
+        'JOURNAL_DIR': None,  # Directory for the per-process journal files used in 'disk' mode
+        'FSYNC': False,  # fsync the journal after every click in 'disk' mode
+    },
+    'HOT_LINKS': {
+        'ENABLED': True,  # Move the click counts of viral links to sharded counters
+        'THRESHOLD': 20,  # Clicks per second, seen by one worker process, that make a link hot
+        'WINDOW': 5,  # Seconds over which the click rate is measured
+        'COOLDOWN': 60,  # Seconds a link stays hot after its rate was last reached
+        'SHARDS': 16,  # Counter rows per hot link, picked at random by each write
+        'FOLD_INTERVAL': 10,  # Seconds between folds of the shards into ShortURL.clicks, None to only fold in drain_clicks
+    },
+    'ROLLUPS': {
+        'ENABLED': True,  # Maintain hourly/daily ClickRollup rows as clicks are written
+        'TOP_N': 10,  # Referrers and user agents kept per bucket
+        'HLL_PRECISION': 10,  # HyperLogLog precision of the per-bucket unique IP sketch (2**p bytes)
+        'MAX_BUCKETS': 1000,  # Largest number of buckets one stats request may return
+    },
+    'ENRICHMENT': {
+        'BATCH_SIZE': 1000,  # Click events enriched per transaction by `manage.py enrich_clicks`
+        'IP_TABLE': None,  # IP range -> country table written by `manage.py build_ip_table`, None leaves countries empty
+    },
+    'DIMENSIONS': {
+        'CACHE_SIZE': 10000,  # Distinct user agents whose UserAgent id each process keeps in memory
+    },
+    'VISITORS': {
+        'ENABLED': True,  # Maintain a per-link HyperLogLog of visitor IP addresses
+        'HLL_PRECISION': 12,  # 2**p one-byte registers (4 KB per link), about 1.6% standard error
+    },
+    'REDIRECTS': {
+        'ASYNC': False,  # Serve /r/<code>/ with the native async view (for ASGI servers) instead of the DRF view
+        'FAST_PATH': True,  # Answer redirects in RedirectFastPathMiddleware, before sessions, CSRF and auth
+        'FAST_PATH_PREFIX': '/r/',  # Path prefix of redirects, must match the 'redirect' URL pattern
+    },
+    'RATE_LIMITS': {
+        'ENABLED': True,  # Set to False to turn every limit off
+        'RATES': {  # Requests per client (user, or IP address when anonymous) per scope, e.g. '100/min'; None for no limit
+            'shorten': None,  # POST /api/shorten/ and /api/shorten/bulk/
+            'redirect': None,  # GET /r/<code>/, checked in the fast path before the code is resolved
+        },
+        'SHARED_CACHE_ALIAS': None,  # Django cache alias holding shared sliding window counters, None for per-process token buckets
+        'MAX_CLIENTS': 100000,  # Token buckets each process keeps in memory
+        'KEY_PREFIX': 'shortener:ratelimit:',  # Prefix for keys written to the shared cache
+    },
+    'REDIRECT_SNAPSHOT': {
+        'FILE': None,  # Snapshot of the active mappings written by `manage.py build_redirect_snapshot`, None disables it
+        'RELOAD_INTERVAL': 5,  # Seconds between checks for a new snapshot file and for links changed since the snapshot
+        'REFRESH_MARGIN': 60,  # Seconds skipped marker ids are read again (commits out of id order) and covered markers are kept after a rebuild
+    },
+    'BLOOM_FILTER': {
+        'ENABLED': True,  # Reject codes that do not exist from an in-memory Bloom filter of every short code
+        'CAPACITY': 100000,  # Minimum number of codes the filter is sized for (at least twice the table size)
+        'ERROR_RATE': 0.01,  # Share of unknown codes that still reach the database at full capacity
+        'REFRESH_INTERVAL': 5,  # Seconds between catch-ups with codes created by other processes
+        'REFRESH_MARGIN': 60,  # Seconds ids skipped by a catch-up are read again (rows committed out of id order)
+        'FILE': None,  # Where the filter is saved for a warm start, None to always build it from the database
+    },
+    'EXPIRY': {
+        'SWEEP_INTERVAL': None,  # Seconds between in-process sweeps of expired links, None to rely on `manage.py sweep_expired`
+        'BATCH_SIZE': 1000,  # Links deactivated per transaction
+    },
+    'CLICK_RETENTION': {
+        'HOT_MONTHS': 1,  # Months kept in the ClickEvent table, older closed months are moved to partitions
+        'RAW_MONTHS': 12,  # Months of raw events kept at all; older partitions are exported and dropped
+        'ARCHIVE_DIR': None,  # Where exported partitions (<name>.csv.gz) are written
+        'REQUIRE_ROLLUPS': True,  # Only drop a month whose daily rollups count all its clicks, per link
+        'BATCH_SIZE': 5000,  # Rows moved per transaction while rotating
+    },
+    'CLICK_REBUILD': {
+        'WORKERS': 1,  # Processes aggregating ClickEvent ID ranges in `manage.py rebuild_clicks`
+        'RANGE_SIZE': 2000,  # Link ids per range, aggregated and corrected before the next range is scanned
+        'CHUNK_SIZE': 5000,  # Rows fetched from the database at a time while aggregating
+        'BATCH_SIZE': 500,  # Links corrected per transaction
+        'CHECKPOINT_DIR': None,  # Where finished ranges are saved so an interrupted run can --resume, None disables it
+    },
+    'DOMAINS': {
+        'REFRESH_INTERVAL': 5,  # Seconds between checks for Domain changes made by other processes
+    },
+    'SHORT_CODES': {
+        'BLOCK_SIZE': 100,  # Sequence numbers each process reserves at once for generated short codes
+    },
+    'BULK': {
+        'MAX_ITEMS': 1000,  # Largest number of URLs accepted by /api/shorten/bulk/
+    },
+    'EXPORTS': {
+        'CHUNK_SIZE': 2000,  # Rows fetched from the database at a time by the export endpoints
+        'BUFFER_SIZE': 64 * 1024,  # Bytes of CSV/NDJSON joined into each chunk of the streamed response
+        'GZIP_LEVEL': 6,  # Compression level of ?compression=gzip
+    },
+    'QR_CODES': {
+        'CACHE_ALIAS': 'default',  # Django cache alias storing rendered QR images
+        'TIMEOUT': 60 * 60 * 24 * 30,  # Seconds a rendered image is kept
+        'DEFAULT_SIZE': 10,  # Pixels per QR module when no ?size= is given
+        'MAX_SIZE': 20,  # Largest accepted ?size=
+        'MAX_AGE': 60 * 60,  # Cache-Control max-age of the QR endpoint
+    },
+}
+
+_cache = {}  # merged settings per section, cleared when SHORTENER changes
+
+
+def get_setting(section):
+    """
+    Return the merged settings dict for a SHORTENER section (defaults + project overrides).
+    """
+    if section not in _cache:
+        merged = dict(DEFAULTS[section])  # start from the defaults
+        merged.update(getattr(settings, 'SHORTENER', {}).get(section, {}))  # apply project overrides
+        _cache[section] = merged
+    return _cache[section]
+
+
+@receiver(setting_changed)
+def reload_shortener_settings(*, setting, **kwargs):
+    """
+    Drop merged settings when SHORTENER is overridden (e.g. with override_settings in tests).
+    """
+    if setting == 'SHORTENER':
+        _cache.clear()
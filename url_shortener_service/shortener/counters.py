@@ -0,0 +1,146 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .conf import get_setting
+from .hll import HyperLogLog
+
+
+class HotLinks:
+    """
+    Per-process detection of viral links, whose clicks go to sharded counters.
+
+    A link turns hot when this process sees THRESHOLD clicks per second on it, averaged over
+    a WINDOW of seconds, and stays hot for COOLDOWN seconds after the rate was last reached.
+    Clicks on hot links are written behind (also in 'sync' click logging mode) and added to
+    one of SHARDS ClickCounterShard rows picked at random instead of the ShortURL row, so
+    workers flushing at the same time do not queue on one row lock. The shards are summed on
+    read and folded into ShortURL.clicks every FOLD_INTERVAL seconds by the click flusher.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()  # clicks per link in the current window
+        self._window_start = float('-inf')  # the first click starts a window
+        self._hot = {}  # short_url_id -> monotonic time the link stops being hot
+        self._folded_at = time.monotonic()
+
+    def hit(self, short_url_id, now=None):
+        """Count a click on a link and return whether the link is hot."""
+        config = get_setting('HOT_LINKS')
+        if not config['ENABLED']:
+            return False
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now - self._window_start >= config['WINDOW']:  # start a new window
+                self._counts.clear()
+                self._window_start = now
+                self._hot = {link: until for link, until in self._hot.items() if until > now}
+            self._counts[short_url_id] += 1
+            if self._counts[short_url_id] >= config['THRESHOLD'] * config['WINDOW']:
+                self._hot[short_url_id] = now + config['COOLDOWN']
+            return self._hot.get(short_url_id, 0) > now
+
+    def is_hot(self, short_url_id, now=None):
+        if not get_setting('HOT_LINKS')['ENABLED']:
+            return False
+        return self._hot.get(short_url_id, 0) > (time.monotonic() if now is None else now)
+
+    def fold_if_due(self):
+        """Fold the counter shards when FOLD_INTERVAL has passed. Returns the number of links folded."""
+        interval = get_setting('HOT_LINKS')['FOLD_INTERVAL']
+        if interval is None or time.monotonic() - self._folded_at < interval:
+            return 0
+        self._folded_at = time.monotonic()
+        return fold_counters()
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._hot.clear()
+
+
+def add_to_shards(counts):
+    """
+    Add {short_url_id: clicks} to one random counter shard per link. Called by persist_clicks
+    inside its transaction. Returns the ids of the links that still exist.
+    """
+    from .models import ClickCounterShard, ShortURL  # imported here because models.py is loaded after this module
+
+    existing = set(ShortURL.objects.filter(pk__in=counts).values_list('pk', flat=True))  # a plain read, no row lock
+    shards = get_setting('HOT_LINKS')['SHARDS']
+    for short_url_id in existing:
+        number = random.randrange(shards)
+        shard = ClickCounterShard.objects.filter(short_url_id=short_url_id, shard=number)
+        if shard.update(clicks=F('clicks') + counts[short_url_id]):
+            continue
+        try:
+            with transaction.atomic():
+                ClickCounterShard.objects.create(short_url_id=short_url_id, shard=number, clicks=counts[short_url_id])
+        except IntegrityError:  # another worker created the shard first
+            shard.update(clicks=F('clicks') + counts[short_url_id])
+    return existing
+
+
+def fold_counters():
+    """
+    Move the clicks of every counter shard into ShortURL.clicks, and refresh the unique visitor
+    estimate of the links, which persist_clicks does not write for hot links. Returns the number of links folded.
+    """
+    from .models import ClickCounterShard, ShortURL, VisitorSketch
+
+    with transaction.atomic():
+        rows = list(ClickCounterShard.objects.select_for_update().filter(clicks__gt=0).values_list('id', 'short_url_id', 'clicks'))
+        totals = Counter()
+        for _, short_url_id, clicks in rows:
+            totals[short_url_id] += clicks
+        sketches = dict(VisitorSketch.objects.filter(short_url_id__in=totals).values_list('short_url_id', 'registers'))
+        for short_url_id, total in totals.items():
+            changes = {'clicks': F('clicks') + total}
+            if short_url_id in sketches:
+                changes['unique_visitors'] = HyperLogLog.from_bytes(sketches[short_url_id]).count()
+            ShortURL.objects.filter(pk=short_url_id).update(**changes)
+        for pk, _, clicks in rows:
+            ClickCounterShard.objects.filter(pk=pk).update(clicks=F('clicks') - clicks)  # keeps increments made meanwhile
+    return len(totals)
+
+
+def counter_value(name):
+    """Current value of a ChangeCounter, 0 until it is first bumped."""
+    from .models import ChangeCounter
+
+    return ChangeCounter.objects.filter(name=name).values_list('value', flat=True).first() or 0
+
+
+def bump_counter(name):
+    """
+    Add one to a ChangeCounter, creating it on first use. Inside a transaction the row stays
+    locked until the transaction ends, which also serializes the callers.
+    """
+    from .models import ChangeCounter
+
+    if ChangeCounter.objects.filter(name=name).update(value=F('value') + 1):
+        return
+    try:
+        with transaction.atomic():
+            ChangeCounter.objects.create(name=name, value=1)
+    except IntegrityError:  # another process created it first
+        ChangeCounter.objects.filter(name=name).update(value=F('value') + 1)
+
+
+def with_pending_clicks(queryset):
+    """
+    Annotate a ShortURL queryset with `pending_clicks`, the clicks still in counter shards.
+    """
+    from .models import ClickCounterShard
+
+    pending = ClickCounterShard.objects.filter(short_url=OuterRef('pk')).values('short_url').annotate(total=Sum('clicks')).values('total')
+    return queryset.annotate(pending_clicks=Coalesce(Subquery(pending), 0))
+
+
+hot_links = HotLinks()  # process-wide instance used by the click buffer
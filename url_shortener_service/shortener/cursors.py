@@ -0,0 +1,52 @@
+import time
+
+from django.db.models import Q
+
+MAX_GAPS = 1000  # skipped ids a cursor retries at most, the highest ones
+
+
+class IdCursor:
+    """
+    Position of a process reading the rows of a table added since its last read (the catch-ups
+    of the code filter and of the redirect snapshot markers), by primary key instead of by time,
+    so neither clock skew nor a slow catch-up can hide a row.
+
+    Ids are handed out before commit, so a row can become visible after rows with higher ids
+    (concurrent transactions on PostgreSQL). Ids a read skipped over are therefore retried by
+    the following reads for `margin` seconds, after which they are taken as rolled back or deleted.
+    """
+
+    def __init__(self, last_id=0):
+        self.last_id = last_id  # highest id read
+        self._gaps = {}  # id skipped over -> monotonic time it was first missed
+
+    def unread(self, queryset):
+        """Rows of the queryset not read yet: past the cursor, or in a gap."""
+        if self._gaps:
+            return queryset.filter(Q(pk__gt=self.last_id) | Q(pk__in=list(self._gaps)))
+        return queryset.filter(pk__gt=self.last_id)
+
+    def advance(self, ids, margin, now=None):
+        """
+        Record a read of the given ids (one batch of unread() rows, or one chunk of a full read in
+        id order): move the cursor past them and remember the ids skipped in between.
+        """
+        now = time.monotonic() if now is None else now
+        ids = set(ids)
+        for pk in ids:
+            self._gaps.pop(pk, None)
+        top = max(ids, default=self.last_id)
+        if top > self.last_id:
+            for pk in range(max(self.last_id + 1, top - MAX_GAPS), top):
+                if pk not in ids:
+                    self._gaps.setdefault(pk, now)
+            self.last_id = top
+        kept = sorted(pk for pk, missed_at in self._gaps.items() if now - missed_at < margin)[-MAX_GAPS:]
+        self._gaps = {pk: self._gaps[pk] for pk in kept}
+
+    def gaps(self):
+        return sorted(self._gaps)
+
+    def resume_id(self):
+        """Id a new cursor should start after to read every row this one may still miss (the gaps included)."""
+        return min([self.last_id, *(pk - 1 for pk in self._gaps)])
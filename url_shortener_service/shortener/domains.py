@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import namedtuple
+
+from .conf import get_setting
+from .counters import bump_counter, counter_value
+
+CHANGES_COUNTER = 'domain_changes'  # ChangeCounter counting Domain changes
+
+# A registered host as the router knows it; inactive domains stay in the map so their hosts keep their namespace
+DomainEntry = namedtuple('DomainEntry', ['id', 'owner_id', 'is_active'])
+
+
+def routing_key(domain_id, short_code):
+    """
+    Key a link's mapping is cached, filtered and snapshotted under: '/<short code>' on the default
+    host, '<domain id>/<short code>' on a custom domain. The namespace ends at the first '/', so the
+    keys of two hosts never overlap, even for codes created before codes were validated.
+    """
+    return f'/{short_code}' if domain_id is None else f'{domain_id}/{short_code}'
+
+
+def normalize_host(host):
+    """Lower case host name without the port or a trailing dot, as Domain.hostname is stored."""
+    host = host.strip().lower()
+    if host.startswith('['):  # IPv6 literal, the port follows the bracket
+        return host.split(']', 1)[0] + ']'
+    return host.rsplit(':', 1)[0].rstrip('.')
+
+
+def request_host(request):
+    """
+    Host name a request was sent to. Read from the header without Django's ALLOWED_HOSTS check:
+    it is only compared with the registered domains, never used to build a URL.
+    """
+    return normalize_host(request.META.get('HTTP_HOST') or request.META.get('SERVER_NAME', ''))
+
+
+def short_link_base(request, domain_id):
+    """Absolute URL the short links of a domain start with (the requested host for the default one)."""
+    if domain_id is None:
+        return request.build_absolute_uri('/r/') if request else '/r/'
+    hostname = domain_router.hostname(domain_id)
+    return f'{request.scheme}://{hostname}/r/' if request else f'//{hostname}/r/'
+
+
+def change_count():
+    return counter_value(CHANGES_COUNTER)
+
+
+def record_domain_change():
+    """
+    Count a change to the Domain table (added, deactivated, renamed, reassigned), so every
+    process reloads its domain map at its next refresh; this process reloads right away.
+    """
+    bump_counter(CHANGES_COUNTER)
+    domain_router.mark_stale()
+
+
+class DomainRouter:
+    """
+    Per-process map of the custom domains, so routing a redirect by its Host header and
+    rendering a link's domain never query the database.
+
+    Loaded on first use, then every REFRESH_INTERVAL seconds the change counter is read (one
+    single-row query) and the whole map reloaded when it moved. The table holds one row per
+    branded domain, so reloading it is cheap.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = None  # host name -> DomainEntry, inactive domains included, None until loaded
+        self._names = {}  # domain id -> host name, inactive domains included
+        self._version = None  # change count the map reflects
+        self._checked_at = float('-inf')  # monotonic time of the last refresh
+
+    def due(self):
+        """Whether refresh() should run before the map is consulted."""
+        return self._hosts is None or time.monotonic() - self._checked_at >= get_setting('DOMAINS')['REFRESH_INTERVAL']
+
+    def refresh(self):
+        """Reload the map if it was never loaded or the Domain table changed since."""
+        from .models import Domain
+
+        with self._lock:
+            self._checked_at = time.monotonic()
+            version = change_count()
+            if self._hosts is not None and version == self._version:
+                return
+            hosts, names = {}, {}
+            for pk, hostname, user_id, is_active in Domain.objects.values_list('id', 'hostname', 'user_id', 'is_active'):
+                names[pk] = hostname
+                hosts[hostname] = DomainEntry(pk, user_id, is_active)
+            self._hosts, self._names, self._version = hosts, names, version
+
+    def lookup(self, host):
+        """DomainEntry of a registered host (active or not), None for any other host. Does not refresh."""
+        hosts = self._hosts
+        return hosts.get(host) if hosts else None
+
+    def get(self, host):
+        """lookup() after refreshing the map when due."""
+        if self.due():
+            self.refresh()
+        return self.lookup(host)
+
+    def hostname(self, domain_id):
+        """Host name of a domain id (refreshing when due), None for the default host."""
+        if domain_id is None:
+            return None
+        if self.due() or domain_id not in self._names:  # created moments ago, possibly by another process
+            self.refresh()
+        return self._names.get(domain_id)
+
+    def mark_stale(self):
+        """Reload the map at the next lookup (after a change made by this process)."""
+        self._version = None
+        self._checked_at = float('-inf')
+
+    def clear(self):
+        with self._lock:
+            self._hosts, self._names, self._version = None, {}, None
+            self._checked_at = float('-inf')
+
+
+domain_router = DomainRouter()  # process-wide instance used by the redirect views and serializers
@@ -0,0 +1,220 @@
+import csv
+import gzip
+import ipaddress
+import mmap
+import os
+import re
+import struct
+from collections import namedtuple
+from functools import lru_cache
+
+from django.db import transaction
+
+from .conf import get_setting
+from .counters import bump_counter
+
+ENRICHED_COUNTER = 'click_enrichment_batches'  # ChangeCounter locked (and bumped) by every enrichment batch
+UA_CACHE_SIZE = 10000  # distinct user agents remembered by the parser, a few hundred cover most traffic
+
+# Parsed user agent, the natural key of a Device row
+UserAgentInfo = namedtuple('UserAgentInfo', ['browser', 'os', 'device_type'])
+UNKNOWN_DEVICE = UserAgentInfo('Other', 'Other', 'unknown')
+
+BOT_PATTERN = re.compile(r'bot|crawl|spider|slurp|preview|curl|wget|python-requests|httpclient|headless', re.IGNORECASE)
+# First match wins: Edge and Opera user agents also mention Chrome, and Chrome ones mention Safari
+BROWSER_PATTERNS = [
+    ('Edge', re.compile(r'Edg(?:e|A|iOS)?/')),
+    ('Opera', re.compile(r'OPR/|Opera')),
+    ('Samsung Internet', re.compile(r'SamsungBrowser/')),
+    ('Firefox', re.compile(r'Firefox/|FxiOS/')),
+    ('Chrome', re.compile(r'Chrome/|CriOS/')),
+    ('Safari', re.compile(r'Safari/')),
+    ('Internet Explorer', re.compile(r'MSIE |Trident/')),
+]
+OS_PATTERNS = [
+    ('iOS', re.compile(r'iPhone|iPad|iPod')),
+    ('Android', re.compile(r'Android')),
+    ('Windows', re.compile(r'Windows')),
+    ('macOS', re.compile(r'Macintosh|Mac OS X')),
+    ('ChromeOS', re.compile(r'CrOS')),
+    ('Linux', re.compile(r'Linux|X11')),
+]
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def parse_user_agent(user_agent):
+    """
+    Browser family, OS family and device type of a User-Agent header. Memoized, since a
+    small set of user agents makes up most clicks.
+    """
+    if not user_agent:
+        return UNKNOWN_DEVICE
+    browser = next((name for name, pattern in BROWSER_PATTERNS if pattern.search(user_agent)), 'Other')
+    os_family = next((name for name, pattern in OS_PATTERNS if pattern.search(user_agent)), 'Other')
+    if BOT_PATTERN.search(user_agent):
+        device_type = 'bot'
+    elif 'iPad' in user_agent or 'Tablet' in user_agent or (os_family == 'Android' and 'Mobile' not in user_agent):
+        device_type = 'tablet'
+    elif 'Mobi' in user_agent or os_family in ('iOS', 'Android'):
+        device_type = 'mobile'
+    else:
+        device_type = 'desktop'
+    return UserAgentInfo(browser, os_family, device_type)
+
+
+IP_TABLE_MAGIC = b'IPR1'
+IP_RANGE = struct.Struct('>16s16s2s')  # first address, last address (IPv6, IPv4 mapped), ISO country code
+
+
+def ip_key(address):
+    """16-byte sort key of an address; IPv4 addresses are mapped into ::ffff:0:0/96."""
+    ip = ipaddress.ip_address(address)
+    if ip.version == 4:
+        return b'\0' * 10 + b'\xff\xff' + ip.packed
+    return ip.packed
+
+
+class IPRangeTable:
+    """
+    IP to country lookups in a file of sorted, non-overlapping address ranges (see write()).
+
+    The file is memory-mapped rather than loaded, so every worker process shares the same
+    page cache pages, and a lookup is a binary search touching about log2(ranges) records.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:4] != IP_TABLE_MAGIC or (len(self._map) - 4) % IP_RANGE.size:
+            self._map.close()
+            raise ValueError(f'{path} is not an IP range table.')
+        self.size = (len(self._map) - 4) // IP_RANGE.size
+
+    def lookup(self, address):
+        """ISO country code of an address, '' when unknown or not an IP address."""
+        try:
+            key = ip_key(address)
+        except ValueError:
+            return ''
+        low, high = 0, self.size
+        while low < high:  # find the last range starting at or before the address
+            middle = (low + high) // 2
+            offset = 4 + middle * IP_RANGE.size
+            if self._map[offset:offset + 16] <= key:
+                low = middle + 1
+            else:
+                high = middle
+        if not low:
+            return ''
+        _, last, country = IP_RANGE.unpack_from(self._map, 4 + (low - 1) * IP_RANGE.size)
+        return country.decode('ascii') if key <= last else ''
+
+    def close(self):
+        self._map.close()
+
+    @staticmethod
+    def write(ranges, path):
+        """
+        Write (first address, last address, country code) ranges to a table file. Returns the number of ranges.
+        """
+        records = sorted((ip_key(first), ip_key(last), country.upper().encode('ascii')) for first, last, country in ranges)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as handle:
+            handle.write(IP_TABLE_MAGIC)
+            for record in records:
+                handle.write(IP_RANGE.pack(*record))
+        os.replace(temp_path, path)  # workers reopen the table when the file changes
+        return len(records)
+
+
+def read_ranges_csv(path):
+    """
+    Yield (first, last, country) from a CSV of IP ranges (optionally gzipped), in the layout of the
+    free IP-to-country databases: addresses either dotted/colon notation or integers. Rows without
+    a country ('', '-', 'ZZ') and header lines are skipped.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='', encoding='utf-8') as handle:
+        for row in csv.reader(handle):
+            if len(row) < 3 or len(row[2].strip()) != 2 or row[2].strip().upper() == 'ZZ':
+                continue
+            try:
+                first, last = (ipaddress.ip_address(int(value) if value.isdigit() else value.strip()) for value in row[:2])
+            except ValueError:
+                continue
+            yield str(first), str(last), row[2].strip()
+
+
+_tables = {}  # (path, mtime) -> IPRangeTable opened by this process
+
+
+def ip_table(path):
+    """The IP range table at `path`, reopened after the file is replaced; None when missing."""
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except (TypeError, OSError):
+        return None
+    if key not in _tables:
+        for stale in [stale for stale in _tables if stale[0] == path]:
+            _tables.pop(stale).close()
+        _tables[key] = IPRangeTable(path)
+    return _tables[key]
+
+
+def device_ids(infos):
+    """Device row id of each UserAgentInfo, creating the missing rows."""
+    from .models import Device  # imported here because models.py is loaded after this module
+
+    ids = {
+        UserAgentInfo(browser, os_family, device_type): pk
+        for pk, browser, os_family, device_type in Device.objects.filter(
+            browser__in={info.browser for info in infos}, os__in={info.os for info in infos},
+        ).values_list('id', 'browser', 'os', 'device_type')
+    }
+    for info in set(infos) - ids.keys():
+        ids[info] = Device.objects.get_or_create(**info._asdict())[0].pk  # new devices are rare after the first batches
+    return ids
+
+
+def enrich_batch(batch_size=None):
+    """
+    Enrich the oldest click events not enriched yet: parse the user agent into a Device, look up
+    the country of the IP address, and add both to the rollups the clicks were counted in.
+
+    Unenriched events are found through a partial index on device IS NULL. The batch first bumps
+    a counter row, which serializes concurrent enrichers (a row lock on PostgreSQL, the write
+    lock on SQLite), so no event is added to the rollups twice. Returns the number of events enriched.
+    """
+    from .models import ClickEvent
+    from .rollups import update_dimensions
+
+    config = get_setting('ENRICHMENT')
+    batch_size = batch_size or config['BATCH_SIZE']
+    table = ip_table(config['IP_TABLE'])
+    with transaction.atomic():
+        bump_counter(ENRICHED_COUNTER)
+        events = list(
+            ClickEvent.objects.filter(device__isnull=True).select_related('user_agent').order_by('id')
+            .only('id', 'short_url_id', 'clicked_at', 'ip_address', 'user_agent__value')[:batch_size]
+        )
+        if not events:
+            return 0
+        infos = [parse_user_agent(event.user_agent.value if event.user_agent else '') for event in events]
+        ids = device_ids(infos)
+        for event, info in zip(events, infos):
+            event.device_id = ids[info]
+            event.country = table.lookup(event.ip_address) if table else ''
+        ClickEvent.objects.bulk_update(events, ['device', 'country'], batch_size=batch_size)
+        update_dimensions([(event.short_url_id, event.clicked_at, event.country, info) for event, info in zip(events, infos)])
+    return len(events)
+
+
+def enrich_pending(batch_size=None):
+    """Enrich batches until no unenriched click event is left. Returns the number of events enriched."""
+    total = 0
+    while True:
+        enriched = enrich_batch(batch_size)
+        total += enriched
+        if not enriched:
+            return total
@@ -0,0 +1,81 @@
+import logging
+import os
+import threading
+import time
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .cache import ResolvedURL, resolution_cache
+from .conf import get_setting
+from .domains import routing_key
+
+logger = logging.getLogger(__name__)
+
+
+def sweep_expired(now=None, batch_size=None):
+    """
+    Deactivate active links whose expiration date has passed, `batch_size` links per transaction.
+
+    Each batch is read through the partial index on expiration_date, and a tombstone is written
+    to the resolution cache for every swept code, so redirects of expired codes keep answering
+    410 from the cache. Returns the number of links deactivated.
+    """
+    from .models import ShortURL  # imported here because models.py is loaded after this module
+
+    now = now or timezone.now()
+    batch_size = batch_size or get_setting('EXPIRY')['BATCH_SIZE']
+    expired = ShortURL.objects.filter(is_active=True, expiration_date__lte=now)
+    swept = 0
+    while True:
+        with transaction.atomic():
+            rows = list(expired.order_by('expiration_date').values_list('id', 'domain_id', 'short_code', 'expiration_date')[:batch_size])
+            if not rows:
+                return swept
+            # re-check the condition, a link saved meanwhile with a new expiration date stays active
+            expired.filter(id__in=[row[0] for row in rows]).update(is_active=False)
+            entries = {routing_key(domain_id, code): ResolvedURL(pk, '', False, expiration_date) for pk, domain_id, code, expiration_date in rows}
+            transaction.on_commit(lambda entries=entries: [resolution_cache.store(code, entry) for code, entry in entries.items()])
+        swept += len(rows)
+
+
+class ExpirySweeper:
+    """
+    Optional in-process periodic sweep, every SHORTENER['EXPIRY']['SWEEP_INTERVAL'] seconds.
+
+    The thread is started lazily by the first request of each worker process (see
+    RedirectFastPathMiddleware). Running `manage.py sweep_expired` from a scheduler instead
+    keeps the web workers free of it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None  # a forked worker needs its own thread
+
+    def ensure_running(self):
+        if get_setting('EXPIRY')['SWEEP_INTERVAL'] is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='expiry-sweeper', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            interval = get_setting('EXPIRY')['SWEEP_INTERVAL']
+            if interval is None:  # disabled at runtime
+                return
+            time.sleep(interval)
+            close_old_connections()  # this thread keeps its own database connection
+            try:
+                swept = sweep_expired()
+                if swept:
+                    logger.info('Deactivated %d expired short URLs', swept)
+            except Exception:
+                logger.exception('Expiry sweep failed')
+
+
+expiry_sweeper = ExpirySweeper()  # process-wide instance started by the middleware
@@ -0,0 +1,65 @@
+import hashlib
+import math
+
+
+def relative_error(precision):
+    """Standard error of a HyperLogLog estimate relative to the true cardinality (1.04 / sqrt(registers))."""
+    return round(1.04 / math.sqrt(2 ** precision), 4)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog cardinality sketch with 2**precision one-byte registers.
+
+    Serialized as one header byte holding the precision, followed by the registers, so a
+    sketch costs 2**precision + 1 bytes however many values it has seen. Sketches of the
+    same precision can be merged, e.g. hourly buckets into a range.
+    """
+
+    def __init__(self, precision=10, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError('HyperLogLog precision must be between 4 and 16.')
+        self.precision = precision
+        self.size = 1 << precision  # number of registers
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    @classmethod
+    def from_bytes(cls, data, precision=10):
+        """Load a sketch written by to_bytes(), or return an empty one for empty data."""
+        if not data:
+            return cls(precision)
+        data = bytes(data)  # BinaryField values may come back as memoryview
+        return cls(data[0], data[1:])
+
+    def to_bytes(self):
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @property
+    def relative_error(self):
+        """Standard error of count() relative to the true cardinality, see relative_error()."""
+        return relative_error(self.precision)
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one (register-wise maximum)."""
+        if other.precision != self.precision:
+            raise ValueError('Only HyperLogLog sketches of the same precision can be merged.')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def add(self, value):
+        """Add a value (anything with a str() form) to the sketch."""
+        hashed = int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+        index = hashed >> (64 - self.precision)  # first `precision` bits pick the register
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1  # position of the leftmost 1-bit in the rest
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        """Estimated number of distinct values added."""
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:  # small cardinalities: linear counting is more accurate
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from .conf import get_setting
+
+
+class StringInterner:
+    """
+    Per-process map of strings to the ids of their rows in a deduplicated dimension table
+    (a model with a unique `value` field), creating the rows of new strings.
+
+    Known strings are answered from an LRU dict of SHORTENER['DIMENSIONS']['CACHE_SIZE']
+    entries; the unknown strings of a batch cost one SELECT and one INSERT. Ids are only
+    cached once their transaction committed, so a rolled back insert never leaves a
+    dangling id in the cache.
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self._ids = OrderedDict()  # value -> id, least recently used first
+        self._lock = threading.Lock()
+
+    def ids(self, values):
+        """{value: id} for every non-empty value, creating the missing rows."""
+        model = apps.get_model('shortener', self.model_name)  # resolved lazily, models.py imports the click code
+        found, missing = {}, set()
+        with self._lock:
+            for value in set(values):
+                if not value:
+                    continue
+                if value in self._ids:
+                    self._ids.move_to_end(value)
+                    found[value] = self._ids[value]
+                else:
+                    missing.add(value)
+        if not missing:
+            return found
+        # ignore_conflicts: a concurrent batch may insert the same new strings first
+        model.objects.bulk_create([model(value=value) for value in missing], ignore_conflicts=True)
+        created = dict(model.objects.filter(value__in=missing).values_list('value', 'id'))
+        found.update(created)
+        transaction.on_commit(lambda: self._remember(created))
+        return found
+
+    def _remember(self, ids):
+        size = get_setting('DIMENSIONS')['CACHE_SIZE']
+        with self._lock:
+            self._ids.update(ids)
+            while len(self._ids) > size:
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+user_agents = StringInterner('UserAgent')  # process-wide user agent -> UserAgent id map used by the click writer
+
+
+@receiver(post_migrate)
+def clear_interned_ids(**kwargs):
+    """
+    Forget cached ids when tables are migrated or flushed (e.g. between TransactionTestCases).
+    """
+    user_agents.clear()
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shortener import partitions
+from shortener.conf import get_setting
+
+
+def months_back(moment, months):
+    """(year, month) of the month `months` before the month of `moment`."""
+    index = moment.year * 12 + moment.month - 1 - months
+    return index // 12, index % 12 + 1
+
+
+class Command(BaseCommand):
+    help = 'Move old click events into monthly partitions, export partitions past retention and drop them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be moved, exported and dropped')
+        parser.add_argument('--no-export', action='store_true', help='Drop expired partitions without exporting them first')
+        parser.add_argument('--compact', action='store_true', help='VACUUM afterwards to reclaim the freed space')
+
+    def handle(self, *args, **options):
+        """
+        Handle the command: rotate closed months out of ClickEvent, then apply the retention policy.
+        """
+        config = get_setting('CLICK_RETENTION')
+        now = timezone.now()
+        hot_cutoff = partitions.month_start(*months_back(now, config['HOT_MONTHS'] - 1))  # first month kept hot
+        raw_cutoff = months_back(now, config['RAW_MONTHS'] - 1)  # first month whose raw events are kept
+
+        # 1. rotation: ClickEvent keeps only the last HOT_MONTHS months
+        if options['dry_run']:
+            self.stdout.write(f'Would move click events before {hot_cutoff:%Y-%m-%d} into monthly partitions.')
+        else:
+            for name, count in sorted(partitions.rotate(hot_cutoff, config['BATCH_SIZE']).items()):
+                self.stdout.write(f'Moved {count} click events into {name}')
+
+        # 2. retention: export and drop partitions older than RAW_MONTHS
+        archive_dir = config['ARCHIVE_DIR']
+        if not options['no_export'] and not archive_dir:
+            raise CommandError("Set SHORTENER['CLICK_RETENTION']['ARCHIVE_DIR'] or pass --no-export.")
+        for year, month, name in partitions.list_partitions():
+            if (year, month) >= raw_cutoff:
+                continue
+            uncovered = partitions.uncovered_links(name, year, month) if config['REQUIRE_ROLLUPS'] else []
+            if uncovered:
+                self.stdout.write(self.style.WARNING(
+                    f'Keeping {name}: the daily rollups of {len(uncovered)} links (e.g. {uncovered[0]}) '
+                    f'count fewer clicks than it holds for {year}-{month:02d}.'
+                ))
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'Would export and drop {name} ({partitions.count_rows(name)} rows).')
+                continue
+            if not options['no_export']:
+                self.stdout.write(f'Exported {name} to {partitions.export_partition(name, archive_dir)}')
+            partitions.drop_partition(name)
+            self.stdout.write(f'Dropped {name}')
+
+        if options['compact'] and not options['dry_run']:
+            partitions.compact()
+            self.stdout.write('Compacted the database.')
+        self.stdout.write(self.style.SUCCESS('Click archival finished.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener.conf import get_setting
+from shortener.enrichment import IPRangeTable, read_ranges_csv
+
+
+class Command(BaseCommand):
+    help = 'Convert a CSV of IP ranges and country codes into the table used by enrich_clicks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='CSV (or .csv.gz) with first address, last address and country code columns')
+        parser.add_argument('--output', help="Table file to write (defaults to SHORTENER['ENRICHMENT']['IP_TABLE'])")
+
+    def handle(self, *args, **options):
+        """
+        Handle the command to build the IP range table. Running enrichers pick up the new file
+        at their next batch.
+        """
+        output = options['output'] or get_setting('ENRICHMENT')['IP_TABLE']
+        if not output:
+            raise CommandError("Pass --output or set SHORTENER['ENRICHMENT']['IP_TABLE'].")
+        try:
+            count = IPRangeTable.write(read_ranges_csv(options['csv_path']), output)
+        except OSError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} IP ranges to {output}.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener.conf import get_setting
+from shortener.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Compile every active short link into the memory-mapped redirect snapshot read by the workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Snapshot file to write (defaults to SHORTENER['REDIRECT_SNAPSHOT']['FILE'])")
+
+    def handle(self, *args, **options):
+        """
+        Handle the command to build the redirect snapshot. The file is replaced atomically and
+        workers switch to it within RELOAD_INTERVAL seconds; run it on a schedule (e.g. every
+        few minutes) so links created since are served from the snapshot as well.
+        """
+        output = options['output'] or get_setting('REDIRECT_SNAPSHOT')['FILE']
+        if not output:
+            raise CommandError("Pass --output or set SHORTENER['REDIRECT_SNAPSHOT']['FILE'].")
+        try:
+            count = build_snapshot(output)
+        except OSError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} short codes to {output}.'))
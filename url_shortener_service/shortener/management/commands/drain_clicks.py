@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from shortener.clicks import click_buffer, journal_files, replay_journal
+from shortener.conf import get_setting
+from shortener.counters import fold_counters
+
+
+class Command(BaseCommand):
+    help = 'Write queued clicks to the database, including click journals left by stopped worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--journal-dir', help="Directory holding click journals (defaults to SHORTENER['CLICK_LOGGING']['JOURNAL_DIR'])")
+
+    def handle(self, *args, **options):
+        """
+        Handle the command to drain the click buffer and replay journal files.
+        Run it after the web workers have stopped, so no journal is still being written to.
+        """
+        config = get_setting('CLICK_LOGGING')
+        flushed = click_buffer.flush()  # clicks queued in this process, if any
+        journal_dir = options['journal_dir'] or config['JOURNAL_DIR']
+
+        replayed = 0
+        if journal_dir:
+            for path in journal_files(journal_dir):
+                count = replay_journal(path, config['BATCH_SIZE'])
+                replayed += count
+                self.stdout.write(f'Replayed {count} clicks from {path}')
+
+        folded = fold_counters()  # counter shards of hot links into ShortURL.clicks
+        self.stdout.write(self.style.SUCCESS(f'Drained {flushed + replayed} clicks, folded the counters of {folded} hot links.'))
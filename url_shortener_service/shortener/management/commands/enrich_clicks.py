@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from shortener.conf import get_setting
+from shortener.enrichment import enrich_pending, ip_table, parse_user_agent
+from shortener.models import ClickEvent
+
+
+class Command(BaseCommand):
+    help = 'Parse user agents and look up countries of new click events, off the request path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Click events enriched per transaction (defaults to SHORTENER['ENRICHMENT']['BATCH_SIZE'])")
+        parser.add_argument('--follow', action='store_true', help='Keep running and enrich new clicks as they are logged')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to wait for new clicks with --follow')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many click events are waiting')
+
+    def handle(self, *args, **options):
+        """
+        Handle the command to enrich click events. Run it from a scheduler, or as a long running
+        process with --follow, next to the web workers.
+        """
+        if options['dry_run']:
+            count = ClickEvent.objects.filter(device__isnull=True).count()
+            self.stdout.write(f'{count} click events waiting for enrichment.')
+            return
+        if ip_table(get_setting('ENRICHMENT')['IP_TABLE']) is None:
+            self.stdout.write(self.style.WARNING('No IP range table, countries are left empty (see build_ip_table).'))
+
+        while True:
+            enriched = enrich_pending(options['batch_size'])
+            if enriched or not options['follow']:
+                cache = parse_user_agent.cache_info()
+                self.stdout.write(self.style.SUCCESS(
+                    f'Enriched {enriched} click events ({cache.hits} user agent cache hits, {cache.misses} parsed).'
+                ))
+            if not options['follow']:
+                return
+            time.sleep(options['interval'])
+            close_old_connections()
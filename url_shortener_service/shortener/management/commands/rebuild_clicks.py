@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener.rebuild import ClickRebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute ShortURL.clicks and the click rollups from the ClickEvent table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help="Processes aggregating ID ranges in parallel (defaults to SHORTENER['CLICK_REBUILD']['WORKERS'])")
+        parser.add_argument('--range-size', type=int, help='Link ids per range')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched at a time')
+        parser.add_argument('--batch-size', type=int, help='Links corrected per transaction')
+        parser.add_argument('--checkpoint-dir', help="Where progress is saved (defaults to SHORTENER['CLICK_REBUILD']['CHECKPOINT_DIR'])")
+        parser.add_argument('--resume', action='store_true', help='Continue the last unfinished run from its checkpoints')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the differences, write nothing')
+        parser.add_argument('--show', type=int, default=20, help='Number of links with the largest differences to list')
+
+    def handle(self, *args, **options):
+        """
+        Handle the command to rebuild the click counters. It can run next to the web workers,
+        except in 'sync' click mode, where their flushers still hold the rollup updates of written
+        clicks: stop them and run drain_clicks first. Do not run archive_clicks at the same time,
+        as it moves events out of the table.
+        """
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+        rebuild = ClickRebuild(
+            workers=options['workers'], range_size=options['range_size'], chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'], checkpoint_dir=options['checkpoint_dir'], log=self.stdout.write,
+        )
+        report = rebuild.run(dry_run=options['dry_run'], resume=options['resume'])
+
+        largest = sorted(report.changed, key=lambda change: -abs(change[3] - change[2]))[:options['show']]
+        for pk, short_code, before, after in largest:
+            self.stdout.write(f'  {short_code} (id {pk}): {before} -> {after} ({after - before:+d})')
+        verb = 'Would correct' if options['dry_run'] else 'Corrected'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(report.changed)} of {report.links} links (net {report.drift:+d} clicks); rollup buckets: '
+            f'{report.buckets_created} created, {report.buckets_updated} updated, {report.buckets_deleted} deleted.'
+        ))
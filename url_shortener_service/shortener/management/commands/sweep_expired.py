@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from shortener.conf import get_setting
+from shortener.expiry import sweep_expired
+from shortener.models import ShortURL
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Deactivate short URLs whose expiration date has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Links deactivated per transaction (defaults to SHORTENER['EXPIRY']['BATCH_SIZE'])")
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many links would be deactivated')
+
+    def handle(self, *args, **options):
+        """
+        Handle the command to sweep expired links. Schedule it (cron, systemd timer...) to keep
+        the active set free of expired links.
+        """
+        if options['dry_run']:
+            count = ShortURL.objects.filter(is_active=True, expiration_date__lte=timezone.now()).count()
+            self.stdout.write(f'Would deactivate {count} expired short URLs.')
+            return
+        swept = sweep_expired(batch_size=options['batch_size'] or get_setting('EXPIRY')['BATCH_SIZE'])
+        self.stdout.write(self.style.SUCCESS(f'Deactivated {swept} expired short URLs.'))
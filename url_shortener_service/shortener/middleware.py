@@ -0,0 +1,54 @@
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .conf import get_setting
+from .expiry import expiry_sweeper
+from .redirects import afollow, follow
+
+
+class RedirectFastPathMiddleware:
+    """
+    Serve GET /r/<code>/ before the rest of the middleware stack and the URL resolver run.
+
+    Listed first in MIDDLEWARE, so a redirect does no session, CSRF, authentication or
+    message work and never enters DRF (no JWT authentication, permissions or Response
+    rendering). Every other request is passed on untouched. Works under WSGI and ASGI.
+    Also starts the periodic expiry sweep of this process, when one is configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self._prefix = None
+        self._pattern = None
+
+    def short_code(self, request):
+        """The short code of a redirect request, or None for any other request."""
+        config = get_setting('REDIRECTS')
+        if not config['FAST_PATH'] or request.method not in ('GET', 'HEAD'):
+            return None
+        if config['FAST_PATH_PREFIX'] != self._prefix:  # compiled once, again only if the setting changes
+            self._prefix = config['FAST_PATH_PREFIX']
+            self._pattern = re.compile('^' + re.escape(self._prefix) + r'(?P<code>[^/]+)/$')
+        match = self._pattern.match(request.path_info)
+        return match.group('code') if match else None
+
+    def __call__(self, request):
+        expiry_sweeper.ensure_running()
+        if self.is_async:
+            return self.__acall__(request)
+        short_code = self.short_code(request)
+        if short_code is None:
+            return self.get_response(request)
+        return follow(request, short_code)
+
+    async def __acall__(self, request):
+        short_code = self.short_code(request)
+        if short_code is None:
+            return await self.get_response(request)
+        return await afollow(request, short_code)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clickevent',
+            name='clicked_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
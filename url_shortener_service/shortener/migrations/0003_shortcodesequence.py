@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:44
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_sequence(apps, schema_editor):
+    """Start the counter after the highest id, since existing generated codes are hashids of the row id."""
+    ShortURL = apps.get_model('shortener', 'ShortURL')
+    ShortCodeSequence = apps.get_model('shortener', 'ShortCodeSequence')
+    highest_id = ShortURL.objects.aggregate(Max('id'))['id__max'] or 0
+    ShortCodeSequence.objects.create(name='short_code', next_value=highest_id + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0002_clickevent_clicked_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShortCodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(seed_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0003_shortcodesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clickevent',
+            name='referrer',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.CreateModel(
+            name='ClickRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('unique_ips', models.PositiveIntegerField(default=0)),
+                ('ip_sketch', models.BinaryField(default=bytes)),
+                ('top_referrers', models.JSONField(default=dict)),
+                ('top_user_agents', models.JSONField(default=dict)),
+                ('short_url', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='shortener.shorturl')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('short_url', 'granularity', 'bucket_start'), name='unique_rollup_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0004_clickrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitorSketch',
+            fields=[
+                ('short_url', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='visitor_sketch', serialize=False, to='shortener.shorturl')),
+                ('registers', models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='shorturl',
+            name='unique_visitors',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0005_visitorsketch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clickevent',
+            index=models.Index(fields=['short_url', 'clicked_at'], name='clickevent_link_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shorturl',
+            index=models.Index(fields=['short_code', 'is_active'], include=('original_url', 'expiration_date'), name='shorturl_code_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shorturl',
+            index=models.Index(fields=['-clicks', '-id'], name='shorturl_clicks_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shorturl',
+            index=models.Index(fields=['user', '-clicks', '-id'], name='shorturl_user_clicks_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0006_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shorturl',
+            index=models.Index(fields=['-created_at', '-id'], name='shorturl_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shorturl',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='shorturl_user_created_idx'),
+        ),
+    ]
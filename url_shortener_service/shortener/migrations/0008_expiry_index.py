@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0007_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shorturl',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['expiration_date'], name='shorturl_active_expiry_idx'),
+        ),
+    ]
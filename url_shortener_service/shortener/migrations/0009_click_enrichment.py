@@ -0,0 +1,60 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0008_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clickevent',
+            name='country',
+            field=models.CharField(blank=True, default='', max_length=2),
+        ),
+        migrations.AddField(
+            model_name='clickrollup',
+            name='device_types',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='clickrollup',
+            name='top_browsers',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='clickrollup',
+            name='top_countries',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='clickrollup',
+            name='top_os',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.CreateModel(
+            name='Device',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('browser', models.CharField(max_length=50)),
+                ('os', models.CharField(max_length=50)),
+                ('device_type', models.CharField(max_length=10)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('browser', 'os', 'device_type'), name='unique_device')],
+            },
+        ),
+        migrations.AddField(
+            model_name='clickevent',
+            name='device',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='shortener.device'),
+        ),
+        migrations.AddIndex(
+            model_name='clickevent',
+            index=models.Index(condition=models.Q(('device__isnull', True)), fields=['id'], name='clickevent_unenriched_idx'),
+        ),
+    ]
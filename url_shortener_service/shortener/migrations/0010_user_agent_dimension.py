@@ -0,0 +1,122 @@
+import sys
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import Max, Min, Sum
+from django.db.models.functions import Length
+
+CHUNK_SIZE = 10000  # click events converted per transaction
+TABLE = 'shortener_clickevent'
+sizes = {}  # measurements carried from the first step to the report at the end
+
+
+def table_bytes(connection, table):
+    """On-disk size of a table and its indexes, None when the database cannot tell."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+            return cursor.fetchone()[0]
+        if connection.vendor == 'sqlite':
+            try:  # needs SQLite built with the dbstat virtual table
+                cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = %s)', [table])
+                return cursor.fetchone()[0]
+            except Exception:
+                return None
+    return None
+
+
+def human_size(size):
+    if size is None:
+        return 'unknown'
+    return f'{size / 1e6:.2f} MB' if size >= 1e6 else f'{size / 1e3:.1f} kB'
+
+
+def measure_before(apps, schema_editor):
+    ClickEvent = apps.get_model('shortener', 'ClickEvent')
+    connection = schema_editor.connection
+    sizes['rows'] = ClickEvent.objects.using(connection.alias).count()
+    sizes['strings'] = ClickEvent.objects.using(connection.alias).aggregate(total=Sum(Length('user_agent')))['total'] or 0
+    sizes['table'] = table_bytes(connection, TABLE)
+
+
+def intern_user_agents(apps, schema_editor):
+    """
+    Point every click event at the UserAgent row of its user agent string, CHUNK_SIZE events
+    per transaction: one SELECT of the distinct strings of the chunk, one INSERT of the new
+    ones, and one UPDATE per distinct string.
+    """
+    ClickEvent = apps.get_model('shortener', 'ClickEvent')
+    UserAgent = apps.get_model('shortener', 'UserAgent')
+    alias = schema_editor.connection.alias
+    bounds = ClickEvent.objects.using(alias).aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return
+    ids = {}  # user agent -> UserAgent id
+    for window_start in range(bounds['low'] - 1, bounds['high'], CHUNK_SIZE):
+        with transaction.atomic(using=alias):
+            window = ClickEvent.objects.using(alias).filter(id__gt=window_start, id__lte=window_start + CHUNK_SIZE).exclude(user_agent__isnull=True).exclude(user_agent='')
+            values = set(window.values_list('user_agent', flat=True).distinct())
+            missing = values - ids.keys()
+            UserAgent.objects.using(alias).bulk_create([UserAgent(value=value) for value in missing], ignore_conflicts=True)
+            ids.update(UserAgent.objects.using(alias).filter(value__in=missing).values_list('value', 'id'))
+            for value in values:
+                window.filter(user_agent=value).update(agent=ids[value])
+
+
+def restore_user_agents(apps, schema_editor):
+    ClickEvent = apps.get_model('shortener', 'ClickEvent')
+    UserAgent = apps.get_model('shortener', 'UserAgent')
+    alias = schema_editor.connection.alias
+    for pk, value in UserAgent.objects.using(alias).values_list('id', 'value').iterator():
+        ClickEvent.objects.using(alias).filter(agent=pk).update(user_agent=value)
+
+
+def report_sizes(apps, schema_editor):
+    if not sizes.get('rows'):
+        return
+    UserAgent = apps.get_model('shortener', 'UserAgent')
+    connection = schema_editor.connection
+    distinct = UserAgent.objects.using(connection.alias).count()
+    dimension = UserAgent.objects.using(connection.alias).aggregate(total=Sum(Length('value')))['total'] or 0
+    after = table_bytes(connection, TABLE)
+    sys.stdout.write(
+        f'\n  {sizes["rows"]} click events, {distinct} distinct user agents\n'
+        f'  user agent strings: {human_size(sizes["strings"])} in {TABLE}, now {human_size(dimension)} in the dimension table plus 8 bytes per event\n'
+        f'  {TABLE} with indexes: {human_size(sizes["table"])} before, {human_size(after)} after'
+        + (' (PostgreSQL frees the dropped column after VACUUM FULL)' if connection.vendor == 'postgresql' else '') + '\n'
+    )
+
+
+class Migration(migrations.Migration):
+    atomic = False  # the backfill commits chunk by chunk instead of holding one huge transaction
+
+    dependencies = [
+        ('shortener', '0009_click_enrichment'),
+    ]
+
+    operations = [
+        migrations.RunPython(measure_before, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='clickevent',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='shortener.useragent'),
+        ),
+        migrations.RunPython(intern_user_agents, restore_user_agents),
+        migrations.RemoveField(
+            model_name='clickevent',
+            name='user_agent',
+        ),
+        migrations.RenameField(
+            model_name='clickevent',
+            old_name='agent',
+            new_name='user_agent',
+        ),
+        migrations.RunPython(report_sizes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0010_user_agent_dimension'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClickCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('clicks', models.BigIntegerField(default=0)),
+                ('short_url', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='shortener.shorturl')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('short_url', 'shard'), name='unique_counter_shard')],
+            },
+        ),
+    ]
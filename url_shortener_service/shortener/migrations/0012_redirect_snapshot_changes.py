@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0011_click_counter_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RedirectChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('short_code', models.CharField(max_length=10)),
+                ('changed_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
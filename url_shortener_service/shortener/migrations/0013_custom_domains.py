@@ -0,0 +1,56 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0012_redirect_snapshot_changes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Domain',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hostname', models.CharField(max_length=253, unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='shorturl',
+            name='shorturl_code_active_idx',
+        ),
+        migrations.AlterField(
+            model_name='shorturl',
+            name='short_code',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='domain',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='shorturl',
+            name='domain',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='links', to='shortener.domain'),
+        ),
+        migrations.AddIndex(
+            model_name='shorturl',
+            index=models.Index(fields=['short_code', 'domain', 'is_active'], include=('original_url', 'expiration_date'), name='shorturl_code_domain_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='shorturl',
+            constraint=models.UniqueConstraint(fields=('domain', 'short_code'), name='unique_domain_short_code'),
+        ),
+        migrations.AddConstraint(
+            model_name='shorturl',
+            constraint=models.UniqueConstraint(condition=models.Q(('domain__isnull', True)), fields=('short_code',), name='unique_default_short_code'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+COUNTER_NAMES = ['short_code_renames', 'click_enrichment_batches', 'domain_changes']
+
+
+def move_counters(apps, schema_editor):
+    """Move the change counters kept in ShortCodeSequence rows to their own table, keeping their values."""
+    ShortCodeSequence = apps.get_model('shortener', 'ShortCodeSequence')
+    ChangeCounter = apps.get_model('shortener', 'ChangeCounter')
+    rows = ShortCodeSequence.objects.filter(name__in=COUNTER_NAMES)
+    ChangeCounter.objects.bulk_create([ChangeCounter(name=row.name, value=row.next_value) for row in rows])
+    rows.delete()
+
+
+def restore_counters(apps, schema_editor):
+    ShortCodeSequence = apps.get_model('shortener', 'ShortCodeSequence')
+    ChangeCounter = apps.get_model('shortener', 'ChangeCounter')
+    for counter in ChangeCounter.objects.filter(name__in=COUNTER_NAMES):
+        ShortCodeSequence.objects.create(name=counter.name, next_value=counter.value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0013_custom_domains'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(move_counters, restore_counters),
+    ]
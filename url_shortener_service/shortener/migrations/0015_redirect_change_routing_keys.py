@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0014_change_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='redirectchange',
+            name='short_code',
+            field=models.CharField(max_length=24),
+        ),
+    ]
@@ -1,43 +1,229 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
-import string
-import random
-from hashids import Hashids
+from django.utils import timezone
+from .allocator import short_code_allocator
+from .bloom import code_filter, record_rename
+from .cache import ResolvedURL, resolution_cache
+from .domains import normalize_host, record_domain_change, routing_key
+from .snapshot import record_changes
 
-# def generate_short_code(length=6):
-#     """Generate a random short code of specified length."""
-#     characters = string.ascii_letters + string.digits  # Characters to use in the short code
-#     return ''.join(random.choice(characters) for _ in range(length))  # Generate the short code
 
-hashids = Hashids(min_length=6)  # Initialize Hashids for generating short codes
+class Domain(models.Model):
+    hostname = models.CharField(max_length=253, unique=True)  # Branded host name links are served on, lower case without port, e.g. 'go.example.com'
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)  # Owner, the only user (besides staff) who may create links on it
+    is_active = models.BooleanField(default=True)  # Inactive domains stop routing, their links keep their rows
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        """Store the host name as requests are matched against it, then have every process reload its domain map."""
+        self.hostname = normalize_host(self.hostname)
+        super().save(*args, **kwargs)
+        record_domain_change()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        record_domain_change()
+        return result
+
+    def __str__(self):
+        return self.hostname
+
 
 class ShortURL(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True) # Optional foreign key to User model
+    domain = models.ForeignKey(Domain, on_delete=models.PROTECT, null=True, blank=True, related_name='links') # Custom domain the code lives on, NULL for the default host
     original_url = models.URLField()  # Field to store the original URL
-    short_code = models.CharField(max_length=10, unique=True, blank=True) # Field to store the generated short code
+    short_code = models.CharField(max_length=10, blank=True) # Field to store the generated short code, unique per domain
     clicks = models.IntegerField(default=0) # Field to count the number of clicks on the short URL
+    unique_visitors = models.IntegerField(default=0) # Estimated distinct visitor IPs, from the link's VisitorSketch
     created_at = models.DateTimeField(auto_now_add=True) # Field to store the creation timestamp
     expiration_date = models.DateTimeField(null=True, blank=True) # Optional field for URL expiration
     is_active = models.BooleanField(default=True) # Field to indicate if the short URL is active
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['domain', 'short_code'], name='unique_domain_short_code'),  # one namespace per custom domain
+            models.UniqueConstraint(fields=['short_code'], condition=Q(domain__isnull=True), name='unique_default_short_code'),  # NULLs are distinct above
+        ]
+        indexes = [
+            # redirect lookup on any host; on PostgreSQL the included columns make it an index-only scan
+            models.Index(fields=['short_code', 'domain', 'is_active'], include=['original_url', 'expiration_date'], name='shorturl_code_domain_idx'),
+            models.Index(fields=['-clicks', '-id'], name='shorturl_clicks_idx'),  # default ordering of the listings
+            models.Index(fields=['user', '-clicks', '-id'], name='shorturl_user_clicks_idx'),  # a user's links by clicks
+            models.Index(fields=['-created_at', '-id'], name='shorturl_created_idx'),  # keyset pages by creation time
+            models.Index(fields=['user', '-created_at', '-id'], name='shorturl_user_created_idx'),
+            models.Index(fields=['expiration_date'], condition=Q(is_active=True), name='shorturl_active_expiry_idx'),  # expiry sweeps
+        ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the routing key as loaded, so a changed code or domain can be invalidated too."""
+        instance = super().from_db(db, field_names, values)
+        short_code = instance.__dict__.get('short_code')
+        instance._loaded_key = short_code and routing_key(instance.__dict__.get('domain_id'), short_code)
+        return instance
+
+    @property
+    def routing_key(self):
+        """Key of the link's mapping in the resolution cache, code filter and redirect snapshot."""
+        return routing_key(self.domain_id, self.short_code)
+
     def save(self, *args, **kwargs):
-        """Override the save method to generate a short code if not already set."""
-        is_new = self.pk is None
+        """Override the save method to generate a short code if not already set, before the row is written."""
+        if not self.short_code:
+            self.short_code = short_code_allocator.allocate()[0]  # single INSERT, no follow-up UPDATE
+        loaded_key = getattr(self, '_loaded_key', None)
+        adding = self._state.adding
         super().save(*args, **kwargs)
-        if is_new and not self.short_code:
-            self.short_code = hashids.encode(self.id)
-            super().save(update_fields=['short_code'])
+        if loaded_key and loaded_key != self.routing_key:
+            record_rename()  # other processes rebuild their code filters
+        if not adding:
+            record_changes(self.routing_key, loaded_key)  # redirect snapshots may hold the previous mapping
+        code_filter.add(self.routing_key)  # known to exist from now on in this process
+        self.invalidate_cache(publish=True)
+
+    def invalidate_cache(self, publish=False):
+        """
+        Invalidate cached mappings for the current and previously loaded routing key, now and on commit.
+        With `publish`, the saved mapping is then written to the cache, so other processes find a new
+        code before their code filters catch up.
+        """
+        keys = {self.routing_key, getattr(self, '_loaded_key', None)}
+        key, entry = self.routing_key, ResolvedURL(self.pk, self.original_url, self.is_active, self.expiration_date)
+        resolution_cache.invalidate(*keys)
+
+        def on_commit():
+            resolution_cache.invalidate(*keys)  # a concurrent lookup may have re-cached the old row
+            if publish:
+                resolution_cache.store(key, entry)
+
+        transaction.on_commit(on_commit)
+        self._loaded_key = self.routing_key
 
     def __str__(self):
         return f"{self.short_code} → {self.original_url}"
     
 
+class Device(models.Model):
+    browser = models.CharField(max_length=50)  # Browser family parsed from the user agent, e.g. 'Chrome'
+    os = models.CharField(max_length=50)  # Operating system family, e.g. 'Android'
+    device_type = models.CharField(max_length=10)  # 'desktop', 'mobile', 'tablet', 'bot' or 'unknown'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['browser', 'os', 'device_type'], name='unique_device'),
+        ]
+
+    def __str__(self):
+        return f"{self.browser} on {self.os} ({self.device_type})"
+
+
+class UserAgent(models.Model):
+    value = models.CharField(max_length=255, unique=True)  # User-Agent header, stored once however many clicks share it
+
+    def __str__(self):
+        return self.value
+
+
 class ClickEvent(models.Model):
     short_url = models.ForeignKey(ShortURL, on_delete=models.CASCADE)  # Foreign key to ShortURL model
-    clicked_at = models.DateTimeField(auto_now_add=True)  # Timestamp of when the URL was clicked
+    clicked_at = models.DateTimeField(default=timezone.now, editable=False)  # Timestamp of when the URL was clicked (set by the click buffer)
     ip_address = models.CharField(max_length=45)  # Field to store the IP address of the user who clicked the URL
-    user_agent = models.CharField(max_length=255, null=True, blank=True)  # Optional field for user agent information
+    user_agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT, null=True, blank=True)  # Interned user agent, NULL without a User-Agent header
+    referrer = models.CharField(max_length=255, null=True, blank=True)  # Optional Referer header of the click
+    device = models.ForeignKey(Device, on_delete=models.PROTECT, null=True, blank=True)  # Parsed user agent, NULL until the enrichment stage ran
+    country = models.CharField(max_length=2, blank=True, default='')  # ISO country code of the IP address, set by the enrichment stage
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['short_url', 'clicked_at'], name='clickevent_link_time_idx'),  # a link's clicks in a time range
+            models.Index(fields=['id'], condition=Q(device__isnull=True), name='clickevent_unenriched_idx'),  # work queue of the enrichment stage
+        ]
 
     def __str__(self):
         return f"Click on {self.short_url.short_code} at {self.clicked_at}"
- 
\ No newline at end of file
+ 
+
+
+class ClickRollup(models.Model):
+    GRANULARITY_CHOICES = [('hour', 'Hour'), ('day', 'Day')]
+
+    short_url = models.ForeignKey(ShortURL, on_delete=models.CASCADE, related_name='rollups')  # Link the clicks belong to
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)  # Length of the bucket
+    bucket_start = models.DateTimeField()  # Start of the UTC hour or day
+    clicks = models.PositiveIntegerField(default=0)  # Clicks in the bucket
+    unique_ips = models.PositiveIntegerField(default=0)  # Estimated distinct IP addresses in the bucket
+    ip_sketch = models.BinaryField(default=bytes)  # HyperLogLog sketch behind unique_ips
+    top_referrers = models.JSONField(default=dict)  # Most frequent referrers -> clicks
+    top_user_agents = models.JSONField(default=dict)  # Most frequent user agents -> clicks
+    top_countries = models.JSONField(default=dict)  # Most frequent countries -> clicks, added by the enrichment stage
+    top_browsers = models.JSONField(default=dict)  # Most frequent browser families -> clicks, added by the enrichment stage
+    top_os = models.JSONField(default=dict)  # Most frequent operating systems -> clicks, added by the enrichment stage
+    device_types = models.JSONField(default=dict)  # Device types -> clicks, added by the enrichment stage
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['short_url', 'granularity', 'bucket_start'], name='unique_rollup_bucket'),  # also serves range reads
+        ]
+
+    def __str__(self):
+        return f"{self.short_url_id} {self.granularity} {self.bucket_start}: {self.clicks}"
+
+
+class VisitorSketch(models.Model):
+    short_url = models.OneToOneField(ShortURL, on_delete=models.CASCADE, primary_key=True, related_name='visitor_sketch')  # Link the sketch belongs to
+    registers = models.BinaryField()  # Serialized HyperLogLog of visitor IP addresses, a few KB whatever the traffic
+
+    def __str__(self):
+        return f"Visitor sketch of {self.short_url_id}"
+
+
+class ClickCounterShard(models.Model):
+    short_url = models.ForeignKey(ShortURL, on_delete=models.CASCADE, related_name='counter_shards')  # Hot link the clicks belong to
+    shard = models.PositiveSmallIntegerField()  # Shard number, picked at random by each write
+    clicks = models.BigIntegerField(default=0)  # Clicks not folded into ShortURL.clicks yet
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['short_url', 'shard'], name='unique_counter_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.short_url_id} shard {self.shard}: {self.clicks}"
+
+
+class ShortCodeSequence(models.Model):
+    name = models.CharField(max_length=50, unique=True)  # Name of the counter, 'short_code' for generated short codes
+    next_value = models.BigIntegerField()  # First number not reserved by any process yet
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+class ChangeCounter(models.Model):
+    name = models.CharField(max_length=50, unique=True)  # What the counter counts, e.g. 'domain_changes'
+    value = models.BigIntegerField(default=0)  # Bumped on every change, processes compare it with the value they last read
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class RedirectChange(models.Model):
+    short_code = models.CharField(max_length=24)  # Routing key (see domains.routing_key) whose mapping changed, no longer answered from redirect snapshots
+    changed_at = models.DateTimeField(default=timezone.now, db_index=True)  # Markers a rebuild covers are dropped once older than REFRESH_MARGIN
+
+    def __str__(self):
+        return f"{self.short_code} changed at {self.changed_at}"
+
+
+@receiver(post_delete, sender=ShortURL)
+def forget_deleted_link(sender, instance, **kwargs):
+    """
+    Drop the cached redirect mapping and mark the code for redirect snapshots along with the row,
+    including rows deleted in bulk by QuerySet.delete() or by a cascade, which skip Model.delete().
+    """
+    record_changes(instance.routing_key)
+    instance.invalidate_cache()
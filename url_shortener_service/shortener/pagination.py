@@ -0,0 +1,160 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a (value, id) key: each page is read with `WHERE (value, id) < cursor
+    ORDER BY value, id LIMIT n` through an index, so deep pages cost the same as the first one
+    and rows never repeat or shift when other rows are inserted or deleted.
+
+    Clicks only grow, so with the default (-clicks, -id) key a link returned on an earlier page can
+    never come back on a later one; a link clicked past the cursor meanwhile is skipped instead.
+    The (created_at, id) key never changes, so those pages stay exact under concurrent clicks.
+    The total count is only computed when the client asks for it with ?count=true.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+    orderings = {  # supported ?ordering= values -> key columns, the id makes every key unique
+        '-clicks': ('-clicks', '-id'),
+        'clicks': ('clicks', 'id'),
+        '-created_at': ('-created_at', '-id'),
+        'created_at': ('created_at', 'id'),
+    }
+    default_ordering = '-clicks'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        keys = self.orderings[self.ordering]
+        if reverse:  # previous page: read backwards from the cursor, then restore the order
+            keys = tuple(key[1:] if key.startswith('-') else '-' + key for key in keys)
+        self.count = queryset.count() if self.count_requested(request) else None
+
+        page = queryset.order_by(*keys)
+        if position is not None:
+            page = page.filter(self.after(keys, position))
+        rows = list(page[:self.page_size + 1])  # one extra row tells whether there is more
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        self.first = self.position(rows[0]) if rows else None
+        self.last = self.position(rows[-1]) if rows else None
+        return rows
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE or 10
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, view):
+        """
+        The ?ordering= value when keyset pagination supports it, else the view's default ordering.
+        """
+        requested = request.query_params.get('ordering')
+        if requested in self.orderings:
+            return requested
+        view_ordering = getattr(view, 'ordering', None) or [self.default_ordering]
+        return view_ordering[0] if view_ordering[0] in self.orderings else self.default_ordering
+
+    def count_requested(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def position(self, obj):
+        return [getattr(obj, key.lstrip('-')) for key in self.orderings[self.ordering]]
+
+    def after(self, keys, position):
+        """
+        Rows strictly after `position` in the order of `keys`, as (a > x) OR (a = x AND b > y).
+        """
+        (first, second), (first_value, second_value) = keys, position
+        first_op = '__lt' if first.startswith('-') else '__gt'
+        second_op = '__lt' if second.startswith('-') else '__gt'
+        first, second = first.lstrip('-'), second.lstrip('-')
+        return Q(**{first + first_op: first_value}) | Q(**{first: first_value, second + second_op: second_value})
+
+    def encode_cursor(self, position, reverse):
+        """
+        Opaque cursor: base64 of the ordering, the key values of the boundary row and the direction.
+        """
+        position = [value.isoformat() if isinstance(value, datetime) else value for value in position]  # keeps the microseconds
+        data = json.dumps({'o': self.ordering, 'p': position, 'r': reverse}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        """
+        Return (position, reverse) from the request's cursor, or (None, False) for the first page.
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if data['o'] != self.ordering or len(data['p']) != 2:  # cursor of another ordering
+                raise ValueError(cursor)
+            fields = [model._meta.get_field(key.lstrip('-')) for key in self.orderings[self.ordering]]
+            position = [field.to_python(value) for field, value in zip(fields, data['p'])]
+            return position, bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first is None:  # past the end, go back to the first page
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.first, reverse=True)
+
+
+class ShortURLPagination(PageNumberPagination):
+    """
+    Page number pagination by default; keyset pagination when the client sends ?paginate=cursor
+    or a cursor from a previous keyset page.
+    """
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        use_keyset = request.query_params.get('paginate') == 'cursor' or self.keyset_class.cursor_query_param in request.query_params
+        if use_keyset:
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,28 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .conf import get_setting
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON (one object per line) into a list, reading the body line by line.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        max_items = get_setting('BULK')['MAX_ITEMS']
+        items = []
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line: # allow blank lines, e.g. a trailing newline
+                continue
+            if len(items) >= max_items: # stop reading instead of buffering an oversized body
+                raise ParseError(f'Too many items, the limit is {max_items}.')
+            try:
+                items.append(json.loads(line))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error on line {number}: {exc}')
+        return items
@@ -0,0 +1,200 @@
+import csv
+import gzip
+import os
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Max, Min, Sum
+
+PARENT_TABLE = 'shortener_clickevent_archive'  # Postgres parent of the monthly partitions
+PARTITION_PATTERN = re.compile(r'^shortener_clickevent_y(\d{4})m(\d{2})$')
+# Raw values, no foreign keys: the user agent string and the enriched device as its browser, OS and type
+ARCHIVE_COLUMNS = ['id', 'short_url_id', 'clicked_at', 'ip_address', 'user_agent', 'referrer', 'country', 'browser', 'os', 'device_type']
+SOURCE_FIELDS = ['id', 'short_url_id', 'clicked_at', 'ip_address', 'user_agent__value', 'referrer', 'country',
+                 'device__browser', 'device__os', 'device__device_type']  # ClickEvent values of ARCHIVE_COLUMNS
+
+# Columns added after the first partitions were created, added to older tables by ensure_partition()
+ENRICHMENT_COLUMN_SQL = {
+    'country': "varchar(2) NOT NULL DEFAULT ''",
+    'browser': 'varchar(50) NULL',  # NULL for events rotated before the enrichment stage ran
+    'os': 'varchar(50) NULL',
+    'device_type': 'varchar(10) NULL',
+}
+ENRICHMENT_SQL = ', '.join(f'{column} {definition}' for column, definition in ENRICHMENT_COLUMN_SQL.items())
+
+# Column definitions per database vendor. Archived rows outlive their ShortURL, so there is no FK.
+COLUMN_SQL = {
+    'sqlite': 'id integer NOT NULL PRIMARY KEY, short_url_id bigint NOT NULL, clicked_at datetime NOT NULL, '
+              f'ip_address varchar(45) NOT NULL, user_agent varchar(255) NULL, referrer varchar(255) NULL, {ENRICHMENT_SQL}',
+    'postgresql': 'id bigint NOT NULL, short_url_id bigint NOT NULL, clicked_at timestamp with time zone NOT NULL, '
+                  f'ip_address varchar(45) NOT NULL, user_agent varchar(255) NULL, referrer varchar(255) NULL, {ENRICHMENT_SQL}, '
+                  'PRIMARY KEY (id, clicked_at)',
+}
+
+
+def month_start(year, month):
+    return datetime(year, month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def partition_name(year, month):
+    return f'shortener_clickevent_y{year:04d}m{month:02d}'
+
+
+def list_partitions():
+    """
+    Existing monthly partitions as sorted (year, month, table name) tuples.
+    """
+    partitions = []
+    for table in connection.introspection.table_names():
+        match = PARTITION_PATTERN.match(table)
+        if match:
+            partitions.append((int(match.group(1)), int(match.group(2)), table))
+    return sorted(partitions)
+
+
+def ensure_partition(year, month):
+    """
+    Create the partition for a month if needed: a native range partition on Postgres,
+    a plain routed table on other databases.
+    """
+    name = connection.ops.quote_name(partition_name(year, month))
+    index = connection.ops.quote_name(partition_name(year, month) + '_link_time')
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            parent = connection.ops.quote_name(PARENT_TABLE)
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {parent} ({COLUMN_SQL["postgresql"]}) PARTITION BY RANGE (clicked_at)')
+            add_enrichment_columns(cursor, PARENT_TABLE)  # partitions inherit the parent's columns
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {connection.ops.quote_name(PARENT_TABLE + "_link_time")} ON {parent} (short_url_id, clicked_at)')
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} FOR VALUES FROM (%s) TO (%s)',
+                [month_start(year, month), month_start(*next_month(year, month))],
+            )
+        else:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {name} ({COLUMN_SQL["sqlite"]})')
+            add_enrichment_columns(cursor, partition_name(year, month))
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {name} (short_url_id, clicked_at)')
+
+
+def add_enrichment_columns(cursor, table):
+    """
+    Add the enrichment columns to a table created before they were archived.
+    """
+    existing = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+    for column, definition in ENRICHMENT_COLUMN_SQL.items():
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE {connection.ops.quote_name(table)} ADD COLUMN {column} {definition}')
+
+
+def rotate(cutoff, batch_size=5000):
+    """
+    Move click events older than `cutoff` from the ClickEvent table into their monthly partitions.
+
+    Walks the table in primary key windows of `batch_size`, each moved in its own transaction,
+    so the job never holds long locks or scans the whole table per month. Returns {partition: rows moved}.
+    """
+    from .models import ClickEvent  # imported here because models.py is loaded after this module
+
+    bounds = ClickEvent.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return {}
+    moved = {}
+    insert_columns = ', '.join(ARCHIVE_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(ARCHIVE_COLUMNS))
+    for window_start in range(bounds['low'] - 1, bounds['high'], batch_size):
+        window_end = min(window_start + batch_size, bounds['high'])  # rows inserted meanwhile have larger ids
+        window = ClickEvent.objects.filter(id__gt=window_start, id__lte=window_end, clicked_at__lt=cutoff)
+        with transaction.atomic():
+            rows = list(window.values_list(*SOURCE_FIELDS))  # archives keep the strings
+            if not rows:
+                continue
+            by_month = {}
+            for row in rows:
+                clicked_at = row[2].astimezone(dt_timezone.utc)
+                by_month.setdefault((clicked_at.year, clicked_at.month), []).append(
+                    row[:2] + (connection.ops.adapt_datetimefield_value(row[2]),) + row[3:]
+                )
+            with connection.cursor() as cursor:
+                for (year, month), month_rows in by_month.items():
+                    ensure_partition(year, month)
+                    name = partition_name(year, month)
+                    cursor.executemany(f'INSERT INTO {connection.ops.quote_name(name)} ({insert_columns}) VALUES ({placeholders})', month_rows)
+                    moved[name] = moved.get(name, 0) + len(month_rows)
+            window.delete()  # same rows as selected above, removed in the same transaction
+    return moved
+
+
+def count_rows(name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(name)}')
+        return cursor.fetchone()[0]
+
+
+def iter_rows(name, chunk_size=2000):
+    """
+    Yield the rows of a partition in ARCHIVE_COLUMNS order, fetching `chunk_size` rows at a time.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {", ".join(ARCHIVE_COLUMNS)} FROM {connection.ops.quote_name(name)} ORDER BY id')
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+
+
+def export_partition(name, directory):
+    """
+    Write a partition to `<directory>/<name>.csv.gz` (written to a temp file, then renamed). Returns the path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}.csv.gz')
+    temp_path = path + '.tmp'
+    with gzip.open(temp_path, 'wt', newline='', encoding='utf-8') as archive:
+        writer = csv.writer(archive)
+        writer.writerow(ARCHIVE_COLUMNS)
+        for row in iter_rows(name):
+            writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row])
+    os.replace(temp_path, path)  # never leave a truncated archive under the final name
+    return path
+
+
+def uncovered_links(name, year, month, chunk_size=500):
+    """
+    Ids of the links whose daily rollups for a month count fewer clicks than the month's partition
+    holds for them, i.e. whose statistics dropping the partition would lose. Links deleted since
+    (their rollups went with them) are left out.
+    """
+    from .models import ClickRollup, ShortURL
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT short_url_id, COUNT(*) FROM {connection.ops.quote_name(name)} GROUP BY short_url_id')
+        events = dict(cursor.fetchall())
+    start, end = month_start(year, month), month_start(*next_month(year, month))
+    rollups = ClickRollup.objects.filter(granularity='day', bucket_start__gte=start, bucket_start__lt=end)
+    totals = dict(rollups.values('short_url_id').annotate(total=Sum('clicks')).values_list('short_url_id', 'total'))
+    short = [link_id for link_id, count in events.items() if totals.get(link_id, 0) < count]
+    uncovered = []
+    for offset in range(0, len(short), chunk_size):
+        uncovered.extend(ShortURL.objects.filter(id__in=short[offset:offset + chunk_size]).values_list('id', flat=True))
+    return sorted(uncovered)
+
+
+def drop_partition(name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {connection.ops.quote_name(name)}')
+
+
+def compact():
+    """
+    Reclaim the space freed by rotation and dropped partitions.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('VACUUM ANALYZE shortener_clickevent')
+        else:
+            cursor.execute('VACUUM')
@@ -12,4 +12,20 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
             return True
 
         # Write permissions are only allowed to the owner of the object.
-        return obj.user == request.user
\ No newline at end of file
+        return obj.user == request.user
+
+
+class IsOwnerOrStaff(permissions.BasePermission):
+    """
+    Custom permission to only allow the owner of an object, or staff, to access it, reads included.
+    Objects without an owner (links shortened anonymously) are only accessible to staff.
+    """
+    message = 'Only the owner of the link can access this.'
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated)
+
+    def has_object_permission(self, request, view, obj):
+        if request.user.is_staff:
+            return True
+        return obj.user_id is not None and obj.user_id == request.user.id
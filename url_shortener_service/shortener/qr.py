@@ -0,0 +1,60 @@
+import base64
+import hashlib
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from django.core.cache import caches
+
+from .conf import get_setting
+
+# Supported image types and their content types
+IMAGE_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def qr_etag(short_link, size, image_type):
+    """
+    ETag of the QR image for (short_link, size, type). The image only depends on these,
+    so the tag can be computed and compared without rendering anything.
+    """
+    digest = hashlib.sha1(f'{short_link}|{size}|{image_type}'.encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+
+def render_qr(short_link, size, image_type):
+    """
+    Render the QR image for a short link. `size` is the pixel size of one QR module.
+    """
+    buffer = BytesIO()  # Create a bytes buffer to hold the image
+    if image_type == 'svg':
+        qrcode.make(short_link, image_factory=qrcode.image.svg.SvgPathImage, box_size=size).save(buffer)
+    else:
+        qrcode.make(short_link, box_size=size).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def get_qr_image(short_link, size=None, image_type='png'):
+    """
+    Return the QR image bytes for a short link, rendering it only on the first request
+    for a given (short_link, size, type) and serving it from the cache afterwards.
+    """
+    config = get_setting('QR_CODES')
+    size = size or config['DEFAULT_SIZE']
+    backend = caches[config['CACHE_ALIAS']]
+    key = 'shortener:qr:' + qr_etag(short_link, size, image_type).strip('"')
+    image = backend.get(key)
+    if image is None:
+        image = render_qr(short_link, size, image_type)
+        backend.set(key, image, config['TIMEOUT'])
+    return image
+
+
+def qr_data_uri(short_link):
+    """
+    Return the default PNG QR image for a short link as a base64 data URI.
+    """
+    base64_qr = base64.b64encode(get_qr_image(short_link)).decode('utf-8')  # Encode the image to base64
+    return f'data:image/png;base64,{base64_qr}'
@@ -0,0 +1,377 @@
+import base64
+import json
+import os
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from django.db import connections, transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from .clicks import click_buffer
+from .conf import get_setting
+from .hll import HyperLogLog
+from .rollups import DAY, DIMENSION_FIELDS, GRANULARITIES, bucket_start
+
+# ClickEvent columns read by the pass, joined to the interned user agent and the parsed device
+EVENT_FIELDS = ['short_url_id', 'clicked_at', 'ip_address', 'user_agent__value', 'referrer', 'country', 'device__browser', 'device__os', 'device__device_type']
+TOP_FIELDS = ['top_referrers', 'top_user_agents', *DIMENSION_FIELDS]
+
+
+class Bucket:
+    """Exact contents of one rollup bucket: full value counts, truncated to TOP_N only when written."""
+    __slots__ = ('clicks', 'sketch', 'counts')
+
+    def __init__(self, precision):
+        self.clicks = 0
+        self.sketch = HyperLogLog(precision)
+        self.counts = {field: Counter() for field in TOP_FIELDS}
+
+
+class ClickAggregate:
+    """
+    Click counts per link and rollup buckets per (link, granularity, bucket start), built from
+    the ClickEvent rows of a range of links.
+    """
+
+    def __init__(self, precision):
+        self.precision = precision
+        self.clicks = Counter()  # short_url_id -> clicks
+        self.buckets = defaultdict(dict)  # short_url_id -> {(granularity, bucket_start): Bucket}
+
+    def bucket(self, short_url_id, key):
+        buckets = self.buckets[short_url_id]
+        if key not in buckets:
+            buckets[key] = Bucket(self.precision)
+        return buckets[key]
+
+    def add(self, row):
+        short_url_id, clicked_at, ip_address, user_agent, referrer, country, browser, os_name, device_type = row
+        self.clicks[short_url_id] += 1
+        for granularity in GRANULARITIES:
+            bucket = self.bucket(short_url_id, (granularity, bucket_start(clicked_at, granularity)))
+            bucket.clicks += 1
+            bucket.sketch.add(ip_address)
+            counts = bucket.counts
+            if referrer:
+                counts['top_referrers'][referrer] += 1
+            if user_agent:
+                counts['top_user_agents'][user_agent] += 1
+            if browser is not None:  # enriched events only, as in rollups.update_dimensions
+                if country:
+                    counts['top_countries'][country] += 1
+                counts['top_browsers'][browser] += 1
+                counts['top_os'][os_name] += 1
+                counts['device_types'][device_type] += 1
+
+    def to_dict(self):
+        """JSON-serializable form, used to return results from worker processes."""
+        return {
+            'precision': self.precision,
+            'clicks': {str(short_url_id): clicks for short_url_id, clicks in self.clicks.items()},
+            'buckets': [
+                [short_url_id, granularity, started.isoformat(), bucket.clicks,
+                 base64.b64encode(bytes(bucket.sketch.registers)).decode('ascii'), bucket.counts]
+                for short_url_id, buckets in self.buckets.items()
+                for (granularity, started), bucket in buckets.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls(data['precision'])
+        aggregate.clicks.update({int(short_url_id): clicks for short_url_id, clicks in data['clicks'].items()})
+        for short_url_id, granularity, started, clicks, registers, counts in data['buckets']:
+            bucket = aggregate.bucket(short_url_id, (granularity, datetime.fromisoformat(started)))
+            bucket.clicks = clicks
+            bucket.sketch = HyperLogLog(data['precision'], base64.b64decode(registers))
+            bucket.counts = {field: Counter(counts[field]) for field in TOP_FIELDS}
+        return aggregate
+
+
+def scan_range(low, high, max_id, chunk_size, precision):
+    """
+    Aggregate the click events (up to id max_id) of the links with low <= id < high, read
+    chunk_size rows at a time through the (short_url, clicked_at) index.
+    """
+    from .models import ClickEvent  # imported here because models.py is loaded after this module
+
+    aggregate = ClickAggregate(precision)
+    rows = ClickEvent.objects.filter(short_url_id__gte=low, short_url_id__lt=high, id__lte=max_id).values_list(*EVENT_FIELDS)
+    for row in rows.iterator(chunk_size=chunk_size):
+        aggregate.add(row)
+    return aggregate
+
+
+def init_worker():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:  # spawned or forkserver processes start without Django
+        django.setup()
+
+
+def scan_range_task(low, high, max_id, chunk_size, precision):
+    """scan_range() in a pool process, returning the picklable dict form."""
+    return scan_range(low, high, max_id, chunk_size, precision).to_dict()
+
+
+class RebuildReport:
+    """Differences found (and written, unless it was a dry run) by ClickRebuild.apply()."""
+
+    def __init__(self):
+        self.links = 0
+        self.changed = []  # (short_url_id, short code, stored clicks, rebuilt clicks)
+        self.drift = 0  # sum of rebuilt - stored clicks
+        self.buckets_created = 0
+        self.buckets_updated = 0
+        self.buckets_deleted = 0
+
+
+class ClickRebuild:
+    """
+    Rebuild ShortURL.clicks and the ClickRollup buckets from ClickEvent in one streaming pass.
+
+    1. Links are split into ID ranges of RANGE_SIZE. The events of each range are aggregated
+       (CHUNK_SIZE rows fetched at a time), by up to WORKERS processes scanning ranges ahead,
+       so only the buckets of a few ranges are ever held in memory.
+    2. The links of a range are corrected before the next range is taken, BATCH_SIZE at a time,
+       each batch in one transaction with its ShortURL, counter shard and rollup rows locked.
+       Events logged after the pass started (id above the high mark) are aggregated at that
+       point, so the run needs no downtime. The last corrected link id is written to
+       CHECKPOINT_DIR after each batch, so an interrupted run resumes after it.
+
+    Clicks older than the oldest remaining event (moved out by archive_clicks) are only known
+    from the daily rollups: they are added to the counters and their buckets are left as they are.
+    Counter shard clicks not folded yet are subtracted, as the API adds them on read.
+    In 'sync' click mode the rollups of written clicks are applied by the next flush, which would
+    add them a second time on top of the rebuilt buckets: the clicks queued in this process are
+    flushed before the pass, and the flushers of the web workers must be stopped and drained first.
+    """
+
+    def __init__(self, workers=None, range_size=None, chunk_size=None, batch_size=None, checkpoint_dir=None, log=None):
+        config = get_setting('CLICK_REBUILD')
+        self.workers = workers or config['WORKERS']
+        self.range_size = range_size or config['RANGE_SIZE']
+        self.chunk_size = chunk_size or config['CHUNK_SIZE']
+        self.batch_size = batch_size or config['BATCH_SIZE']
+        self.checkpoint_dir = checkpoint_dir or config['CHECKPOINT_DIR']
+        self.log = log or (lambda message: None)
+        self.rollups = get_setting('ROLLUPS')['ENABLED']
+        self.precision = get_setting('ROLLUPS')['HLL_PRECISION']
+        self.state = None
+
+    # checkpoints
+
+    def _path(self, name):
+        return os.path.join(self.checkpoint_dir, name)
+
+    def _write_json(self, name, data):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        temp_path = self._path(f'{name}.tmp')
+        with open(temp_path, 'w') as handle:
+            handle.write(json.dumps(data))  # the C encoder, json.dump() streams through the Python one
+        os.replace(temp_path, self._path(name))  # a crash never leaves a half written checkpoint
+
+    def _read_json(self, name):
+        try:
+            with open(self._path(name)) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def clear_checkpoints(self):
+        if not self.checkpoint_dir or not os.path.isdir(self.checkpoint_dir):
+            return
+        for name in os.listdir(self.checkpoint_dir):
+            if name == 'state.json':
+                os.remove(self._path(name))
+
+    # the pass
+
+    def plan(self, resume=False, dry_run=False):
+        """
+        Fix the bounds of the pass: the high event id, the start of the rebuilt buckets (`since`)
+        and the link ID ranges. Reuses the bounds and progress of an unfinished run with `resume`.
+        A dry run leaves the checkpoints of an unfinished run alone.
+        """
+        from .models import ClickEvent, ShortURL
+
+        if resume and self.checkpoint_dir:
+            self.state = self._read_json('state.json')
+            if self.state is not None and self.state['precision'] == self.precision:
+                self.log(f'Resuming the run started at event id {self.state["high"]}, '
+                         f'links up to id {self.state["applied_through"]} are corrected.')
+                return self.state
+        if not dry_run:
+            self.clear_checkpoints()
+        bounds = ClickEvent.objects.aggregate(high=Max('id'), first=Min('clicked_at'))
+        links = ShortURL.objects.aggregate(low=Min('id'), high=Max('id'))
+        low, high = links['low'] or 1, links['high'] or 0
+        since = bucket_start(bounds['first'] or timezone.now(), DAY)  # start of the day of the oldest event
+        self.state = {
+            'high': bounds['high'] or 0,
+            'since': since.isoformat(),
+            'precision': self.precision,
+            'links': [low, high],  # ids of the links to check, links created later are left alone
+            'range_size': self.range_size,
+            'applied_through': 0,  # links up to this id were corrected
+        }
+        if self.checkpoint_dir and not dry_run:
+            self._write_json('state.json', self.state)
+        return self.state
+
+    def scan(self):
+        """
+        Yield (low, high, aggregate) for every link range of the plan not corrected yet, in order.
+        With several workers, at most WORKERS ranges are scanned ahead of the one yielded.
+        """
+        first, last = self.state['links']
+        size = self.state['range_size']
+        ranges = [(low, min(low + size, last + 1)) for low in range(first, last + 1, size)]
+        missing = [(low, high) for low, high in ranges if high - 1 > self.state['applied_through']]
+        if self.workers <= 1 or len(missing) <= 1:
+            for low, high in missing:
+                yield low, high, scan_range(low, high, self.state['high'], self.chunk_size, self.precision)
+            return
+        connections.close_all()  # pool processes must open their own connections, not share this one
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker) as pool:
+            queued = deque()
+            for low, high in missing:
+                queued.append((low, high, pool.submit(scan_range_task, low, high, self.state['high'], self.chunk_size, self.precision)))
+                if len(queued) > self.workers:
+                    low, high, future = queued.popleft()
+                    yield low, high, ClickAggregate.from_dict(future.result())
+            while queued:
+                low, high, future = queued.popleft()
+                yield low, high, ClickAggregate.from_dict(future.result())
+
+    def apply(self, aggregate, low, high, report, dry_run=False):
+        """
+        Compare (and unless dry_run, correct) the links with low <= id < high against their
+        aggregate, BATCH_SIZE links per transaction, recording the progress after each one.
+        """
+        from .models import ShortURL
+
+        last = max(low - 1, self.state['applied_through'])
+        while True:
+            ids = list(ShortURL.objects.filter(pk__gt=last, pk__lt=high).order_by('pk').values_list('pk', flat=True)[:self.batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                self.apply_batch(ids, aggregate, report, dry_run)
+            last = ids[-1]
+            if not dry_run and self.checkpoint_dir:
+                self.state['applied_through'] = last
+                self._write_json('state.json', self.state)
+        self.log(f'Checked the links with ids {low} to {high - 1}.')
+        return report
+
+    def apply_batch(self, ids, aggregate, report, dry_run):
+        from .models import ClickCounterShard, ClickEvent, ClickRollup, ShortURL
+
+        since = datetime.fromisoformat(self.state['since'])
+        links = ShortURL.objects.filter(pk__in=ids)
+        shards = ClickCounterShard.objects.filter(short_url_id__in=ids)
+        rollups = ClickRollup.objects.filter(short_url_id__in=ids)
+        if not dry_run:  # events written meanwhile wait for the locks, or are already visible below
+            links, shards, rollups = links.select_for_update(), shards.select_for_update(), rollups.select_for_update()
+        stored = {pk: (short_code, clicks) for pk, short_code, clicks in links.values_list('pk', 'short_code', 'clicks')}
+        pending = Counter(dict(shards.values('short_url_id').annotate(total=Sum('clicks')).values_list('short_url_id', 'total')))
+        tail = ClickAggregate(self.precision)  # events logged after the pass started
+        for row in ClickEvent.objects.filter(id__gt=self.state['high'], short_url_id__in=ids, clicked_at__gte=since).values_list(*EVENT_FIELDS):
+            tail.add(row)
+        archived = Counter()
+        if self.rollups:
+            archived.update(dict(
+                rollups.filter(granularity=DAY, bucket_start__lt=since).values('short_url_id')
+                .annotate(total=Sum('clicks')).values_list('short_url_id', 'total')
+            ))
+
+        changed = []
+        for pk in ids:
+            if pk not in stored:  # deleted meanwhile
+                continue
+            short_code, before = stored[pk]
+            after = aggregate.clicks[pk] + tail.clicks[pk] + archived[pk] - pending[pk]
+            report.links += 1
+            if after != before:
+                report.changed.append((pk, short_code, before, after))
+                report.drift += after - before
+                changed.append(ShortURL(pk=pk, clicks=after))
+        if changed and not dry_run:
+            ShortURL.objects.bulk_update(changed, ['clicks'])  # no save(): a counter fix needs no cache invalidation
+        if self.rollups:
+            self.apply_rollups(ids, aggregate, tail, rollups.filter(bucket_start__gte=since), report, dry_run)
+        for pk in ids:  # the batch is done, free its buckets
+            aggregate.buckets.pop(pk, None)
+
+    def apply_rollups(self, ids, aggregate, tail, rollups, report, dry_run):
+        from .models import ClickRollup
+
+        top_n = get_setting('ROLLUPS')['TOP_N']
+        expected = {}
+        for pk in ids:
+            for source in (aggregate, tail):
+                for (granularity, started), bucket in source.buckets.get(pk, {}).items():
+                    key = (pk, granularity, started)
+                    if key in expected:  # a bucket with events from the pass and from the tail
+                        merged = expected[key]
+                        merged.clicks += bucket.clicks
+                        merged.sketch.merge(bucket.sketch)
+                        for field in TOP_FIELDS:
+                            merged.counts[field].update(bucket.counts[field])
+                    else:
+                        expected[key] = bucket
+
+        def values(bucket):
+            row = {'clicks': bucket.clicks, 'unique_ips': bucket.sketch.count(), 'ip_sketch': bucket.sketch.to_bytes()}
+            row.update({field: dict(bucket.counts[field].most_common(top_n)) for field in TOP_FIELDS})
+            return row
+
+        fields = ['clicks', 'unique_ips', 'ip_sketch', *TOP_FIELDS]
+        to_update, to_delete = [], []
+        for row in rollups:
+            bucket = expected.pop((row.short_url_id, row.granularity, row.bucket_start), None)
+            if bucket is None:
+                to_delete.append(row.pk)  # no event in the bucket any more
+                continue
+            rebuilt = values(bucket)
+            current = {field: getattr(row, field) for field in fields}
+            current['ip_sketch'] = bytes(current['ip_sketch'])  # BinaryField may be a memoryview
+            if current != rebuilt:
+                for field, value in rebuilt.items():
+                    setattr(row, field, value)
+                to_update.append(row)
+        to_create = [ClickRollup(short_url_id=pk, granularity=granularity, bucket_start=started, **values(bucket))
+                     for (pk, granularity, started), bucket in expected.items()]
+        report.buckets_updated += len(to_update)
+        report.buckets_created += len(to_create)
+        report.buckets_deleted += len(to_delete)
+        if dry_run:
+            return
+        if to_update:
+            ClickRollup.objects.bulk_update(to_update, fields)
+        if to_create:
+            ClickRollup.objects.bulk_create(to_create)
+        if to_delete:
+            ClickRollup.objects.filter(pk__in=to_delete).delete()
+
+    def drain(self):
+        """Flush the clicks queued in this process, with the pending aggregates of 'sync' clicks."""
+        queued, aggregates = click_buffer.pending(), click_buffer.pending_aggregates()
+        if queued or aggregates:
+            click_buffer.flush()
+            self.log(f'Flushed {queued} queued clicks and the aggregates of {aggregates} written clicks first.')
+
+    def run(self, dry_run=False, resume=False):
+        if not dry_run:
+            self.drain()  # their events would be rebuilt, then counted again by the flush
+        self.plan(resume=resume, dry_run=dry_run)
+        report = RebuildReport()
+        for low, high, aggregate in self.scan():
+            self.apply(aggregate, low, high, report, dry_run=dry_run)
+        if not dry_run:
+            self.clear_checkpoints()  # finished, the next run starts from scratch
+        return report
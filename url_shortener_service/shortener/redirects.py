@@ -0,0 +1,93 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseGone, HttpResponseNotFound, HttpResponseRedirect
+from django.utils import timezone
+
+from .cache import resolution_cache
+from .clicks import click_buffer, ClickRecord
+from .domains import domain_router, request_host
+from .throttling import client_ident, rate_limiter, retry_after_seconds
+
+
+def detail_response(response_class, detail):
+    """
+    JSON error body in the same shape as DRF's, without going through DRF.
+    """
+    return response_class(json.dumps({'detail': detail}), content_type='application/json')
+
+
+def throttled_response(wait):
+    """
+    429 response for a client over its redirect limit, with the same body and header as DRF's.
+    """
+    wait = retry_after_seconds(wait)
+    response = detail_response(HttpResponse, f'Request was throttled. Expected available in {wait} seconds.')
+    response.status_code = 429
+    response['Retry-After'] = str(wait)
+    return response
+
+
+def not_found_response():
+    return detail_response(HttpResponseNotFound, 'No ShortURL matches the given query.')
+
+
+def check_entry(entry):
+    """
+    Error response for a missing, inactive or expired mapping, or None when it can be followed.
+    """
+    if entry is not None and entry.expiration_date and entry.expiration_date < timezone.now():
+        return detail_response(HttpResponseGone, 'URL has expired.')  # also once the sweeper deactivated it
+    if entry is None or not entry.is_active:
+        return not_found_response()
+    return None
+
+
+def click_record(request, entry):
+    return ClickRecord(
+        short_url_id=entry.id,  # the resolved ShortURL
+        clicked_at=timezone.now(),  # time of the click
+        ip_address=request.META.get('REMOTE_ADDR', ''),  # Get the user's IP address
+        user_agent=request.META.get('HTTP_USER_AGENT', '')[:255],  # Get the user's user agent (column holds 255 chars)
+        referrer=request.META.get('HTTP_REFERER', '')[:255] or None,  # Get the referring page, if any
+    )
+
+
+def follow(request, short_code):
+    """
+    Resolve a short code in the namespace of the requested host, log the click and redirect, with
+    nothing but the domain map, the cache and the click buffer. The client's redirect limit is checked
+    first, so scans of unknown codes are limited as well.
+    """
+    allowed, wait = rate_limiter.check('redirect', client_ident(request))
+    if not allowed:
+        return throttled_response(wait)
+    domain = domain_router.get(request_host(request))
+    if domain is not None and not domain.is_active:  # an inactive domain serves nothing, not the default host's codes
+        return not_found_response()
+    entry = resolution_cache.resolve(short_code, domain.id if domain else None)
+    error = check_entry(entry)
+    if error is not None:
+        return error
+    click_buffer.add(click_record(request, entry))
+    return HttpResponseRedirect(entry.original_url)
+
+
+async def afollow(request, short_code):
+    """
+    Async version of follow() for ASGI: async cache lookups, clicks handed to the flusher thread.
+    """
+    allowed, wait = await rate_limiter.acheck('redirect', client_ident(request))
+    if not allowed:
+        return throttled_response(wait)
+    if domain_router.due():
+        await sync_to_async(domain_router.refresh)()  # reading the change counter queries the database
+    domain = domain_router.lookup(request_host(request))
+    if domain is not None and not domain.is_active:
+        return not_found_response()
+    entry = await resolution_cache.aresolve(short_code, domain.id if domain else None)
+    error = check_entry(entry)
+    if error is not None:
+        return error
+    await click_buffer.aadd(click_record(request, entry))
+    return HttpResponseRedirect(entry.original_url)
@@ -0,0 +1,212 @@
+from collections import Counter, defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+
+from .conf import get_setting
+from .hll import HyperLogLog
+
+HOUR = 'hour'
+DAY = 'day'
+GRANULARITIES = {HOUR: timedelta(hours=1), DAY: timedelta(days=1)}
+DIMENSION_FIELDS = ['top_countries', 'top_browsers', 'top_os', 'device_types']  # filled in by the enrichment stage
+
+
+def bucket_start(moment, granularity):
+    """
+    Start of the UTC hour or day containing `moment`.
+    """
+    moment = moment.astimezone(dt_timezone.utc)
+    if granularity == DAY:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def merge_top(stored, counts, top_n):
+    """
+    Add `counts` to a stored {value: count} dict and keep only the `top_n` largest entries.
+    Truncating makes the counts approximate for values near the cut-off.
+    """
+    merged = Counter(stored)
+    merged.update(counts)
+    return dict(merged.most_common(top_n))
+
+
+class BucketDelta:
+    """
+    Changes to apply to one rollup row, aggregated from a batch of clicks.
+    """
+
+    def __init__(self):
+        self.clicks = 0
+        self.ips = set()
+        self.referrers = Counter()
+        self.user_agents = Counter()
+
+    def add(self, record):
+        self.clicks += 1
+        self.ips.add(record.ip_address)
+        if record.referrer:
+            self.referrers[record.referrer] += 1
+        if record.user_agent:
+            self.user_agents[record.user_agent] += 1
+
+
+def aggregate(records):
+    """
+    Group click records into {(short_url_id, granularity, bucket_start): BucketDelta}.
+    """
+    deltas = defaultdict(BucketDelta)
+    for record in records:
+        for granularity in GRANULARITIES:
+            deltas[(record.short_url_id, granularity, bucket_start(record.clicked_at, granularity))].add(record)
+    return deltas
+
+
+def apply_deltas(deltas):
+    """
+    Merge aggregated deltas into the ClickRollup table: one SELECT for the touched rows,
+    then one bulk UPDATE and one bulk INSERT.
+    """
+    from .models import ClickRollup  # imported here because models.py is loaded after this module
+
+    config = get_setting('ROLLUPS')
+    existing = {
+        (row.short_url_id, row.granularity, row.bucket_start): row
+        for row in ClickRollup.objects.select_for_update().filter(
+            short_url_id__in={key[0] for key in deltas},
+            bucket_start__in={key[2] for key in deltas},
+        )
+    }
+    to_update, to_create = [], []
+    for key, delta in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            row = ClickRollup(short_url_id=key[0], granularity=key[1], bucket_start=key[2])
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        sketch = HyperLogLog.from_bytes(row.ip_sketch, config['HLL_PRECISION'])
+        for ip in delta.ips:
+            sketch.add(ip)
+        row.clicks += delta.clicks
+        row.ip_sketch = sketch.to_bytes()
+        row.unique_ips = sketch.count()
+        row.top_referrers = merge_top(row.top_referrers, delta.referrers, config['TOP_N'])
+        row.top_user_agents = merge_top(row.top_user_agents, delta.user_agents, config['TOP_N'])
+
+    if to_update:
+        ClickRollup.objects.bulk_update(to_update, ['clicks', 'unique_ips', 'ip_sketch', 'top_referrers', 'top_user_agents'])
+    if to_create:
+        ClickRollup.objects.bulk_create(to_create)
+
+
+def update_rollups(records):
+    """
+    Fold a batch of click records into the hourly and daily rollups. Called by persist_clicks
+    inside its transaction, so rollups and raw events are written together.
+    """
+    if not records or not get_setting('ROLLUPS')['ENABLED']:
+        return
+    deltas = aggregate(records)
+    try:
+        with transaction.atomic():
+            apply_deltas(deltas)
+    except IntegrityError:
+        # another worker created one of the new buckets first, the retry updates it instead
+        with transaction.atomic():
+            apply_deltas(deltas)
+
+
+def apply_dimensions(deltas):
+    """
+    Merge aggregated country and device counts into the ClickRollup table, creating the buckets
+    that have no row yet (their clicks are added when the click flush reaches them).
+    """
+    from .models import ClickRollup
+
+    top_n = get_setting('ROLLUPS')['TOP_N']
+    existing = {
+        (row.short_url_id, row.granularity, row.bucket_start): row
+        for row in ClickRollup.objects.select_for_update().filter(
+            short_url_id__in={key[0] for key in deltas},
+            bucket_start__in={key[2] for key in deltas},
+        )
+    }
+    to_update, to_create = [], []
+    for key, delta in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            row = ClickRollup(short_url_id=key[0], granularity=key[1], bucket_start=key[2])
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        for field, counts in delta.items():
+            setattr(row, field, merge_top(getattr(row, field), counts, top_n))
+    if to_update:
+        ClickRollup.objects.bulk_update(to_update, DIMENSION_FIELDS)
+    if to_create:
+        ClickRollup.objects.bulk_create(to_create)
+
+
+def update_dimensions(rows):
+    """
+    Add the countries and devices of enriched click events, as (short_url_id, clicked_at, country,
+    UserAgentInfo) rows, to the rollup buckets of their clicks. Called by the enrichment stage,
+    which handles every event once. The click counts of a bucket may not be written yet (the
+    rollups of 'sync' clicks follow at the next flush), so missing buckets are created.
+    """
+    if not rows or not get_setting('ROLLUPS')['ENABLED']:
+        return
+    deltas = defaultdict(lambda: {field: Counter() for field in DIMENSION_FIELDS})
+    for short_url_id, clicked_at, country, device in rows:
+        for granularity in GRANULARITIES:
+            delta = deltas[(short_url_id, granularity, bucket_start(clicked_at, granularity))]
+            if country:
+                delta['top_countries'][country] += 1
+            delta['top_browsers'][device.browser] += 1
+            delta['top_os'][device.os] += 1
+            delta['device_types'][device.device_type] += 1
+    try:
+        with transaction.atomic():
+            apply_dimensions(deltas)
+    except IntegrityError:
+        # a click flush created one of the new buckets first, the retry updates it instead
+        with transaction.atomic():
+            apply_dimensions(deltas)
+
+
+def read_stats(short_url, granularity, start, end):
+    """
+    Rollup buckets of a short URL in [start, end), oldest first. Reads only the rollup table,
+    so the cost depends on the number of buckets and not on the number of raw click events.
+    """
+    from .models import ClickRollup
+
+    rows = ClickRollup.objects.filter(
+        short_url=short_url, granularity=granularity, bucket_start__gte=start, bucket_start__lt=end,
+    ).order_by('bucket_start').values_list('bucket_start', 'clicks', 'unique_ips', 'top_referrers', 'top_user_agents', 'ip_sketch', *DIMENSION_FIELDS)
+    buckets = []
+    visitors = HyperLogLog(get_setting('ROLLUPS')['HLL_PRECISION'])  # union of the bucket sketches
+    for started, clicks, unique_ips, referrers, user_agents, ip_sketch, *dimensions in rows:
+        bucket = {
+            'start': started,
+            'clicks': clicks,
+            'unique_ips': unique_ips,
+            'top_referrers': sorted(referrers.items(), key=lambda item: -item[1]),
+            'top_user_agents': sorted(user_agents.items(), key=lambda item: -item[1]),
+        }
+        for field, counts in zip(DIMENSION_FIELDS, dimensions):
+            bucket[field] = sorted(counts.items(), key=lambda item: -item[1])
+        buckets.append(bucket)
+        sketch = HyperLogLog.from_bytes(ip_sketch)
+        if sketch.precision == visitors.precision:  # buckets written before a precision change cannot be merged
+            visitors.merge(sketch)
+    return {
+        'granularity': granularity,
+        'from': start,
+        'to': end,
+        'total_clicks': sum(bucket['clicks'] for bucket in buckets),
+        'unique_ips': {'estimate': visitors.count(), 'relative_error': visitors.relative_error},  # over the whole range
+        'buckets': buckets,
+    }
@@ -1,29 +1,94 @@
 from rest_framework import serializers
+from .domains import domain_router, normalize_host, short_link_base
 from .models import ShortURL
 from urllib.parse import urlparse
-import qrcode
-import base64
-from io import BytesIO
-from rest_framework.validators import UniqueValidator
+from rest_framework.reverse import reverse
+from .qr import qr_data_uri
+from .visitors import unique_visitors
 from django.utils import timezone
+from django.utils.functional import cached_property
+
+DUPLICATE_CODE_ERROR = "This short code is already in use. Please choose a different one."
+PK_PLACEHOLDER = '__pk__'  # reversed in place of a link id, then replaced by each row's id
+
+
+class DomainField(serializers.Field):
+    """
+    A link's custom domain as its host name (null for the default host), read from the in-memory
+    domain map instead of the database, so listing links on many domains adds no query.
+    """
+    default_error_messages = {
+        'unknown': 'Unknown domain "{hostname}".',
+        'inactive': 'The domain "{hostname}" is no longer active.',
+        'forbidden': 'You can only create links on your own domains.',
+    }
+
+    def to_representation(self, domain_id):
+        return domain_router.hostname(domain_id)
+
+    def to_internal_value(self, data):
+        hostname = normalize_host(str(data))
+        entry = domain_router.get(hostname)
+        if entry is None:
+            self.fail('unknown', hostname=hostname)
+        request = self.context.get('request')
+        user = self.context.get('user') or (request.user if request else None)  # the bulk view passes the user
+        if not (user and (user.is_staff or user.id == entry.owner_id)):
+            self.fail('forbidden')
+        if not entry.is_active:
+            self.fail('inactive', hostname=hostname)
+        return entry.id
+
 
 class ShortURLSerializer(serializers.ModelSerializer):
-    short_code = serializers.CharField(
-        required=False,
-        validators=[
-            UniqueValidator(queryset=ShortURL.objects.all(), message="This short code is already in use. Please choose a different one.")
-        ]
-    )  # Allow custom short codes, but ensure they are unique
-    clicks = serializers.ReadOnlyField()  # Make clicks read-only since it's managed by the application
+    short_code = serializers.CharField(required=False, max_length=10)  # Allow custom short codes, validate() ensures they are unique on their domain
+    domain = DomainField(source='domain_id', required=False, allow_null=True)  # Custom domain host name, null for the default host
+    clicks = serializers.SerializerMethodField()  # Make clicks read-only since it's managed by the application
+    unique_visitors = serializers.SerializerMethodField()  # Estimated unique visitors with the estimate's error bound
     created_at = serializers.ReadOnlyField()  # Make created_at read-only since it's set automatically
 
     # for generating a  QR code
     short_link = serializers.SerializerMethodField()  # Custom field to generate the short link
-    qr_code = serializers.SerializerMethodField() # Custom field to generate QR code
+    qr_code = serializers.SerializerMethodField() # Custom field to generate QR code, only when requested
+    qr_code_url = serializers.SerializerMethodField() # Link to the QR code image endpoint
 
     class Meta:
         model = ShortURL # Define the model to serialize
-        fields = ['id', 'user', 'original_url', 'short_code','short_link', 'clicks', 'created_at', 'expiration_date', 'is_active', 'qr_code'] # Specify the fields to include in the serialized output, including qr_code
+        fields = ['id', 'user', 'original_url', 'domain', 'short_code','short_link', 'clicks', 'unique_visitors', 'created_at', 'expiration_date', 'is_active', 'qr_code', 'qr_code_url'] # Specify the fields to include in the serialized output, including qr_code
+        validators = [] # the per-domain uniqueness of short codes is checked by validate(), without making both fields required
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.context.get('include_qr_code'):
+            self.fields.pop('qr_code', None) # skip the inline image unless the view asked for it
+
+    @cached_property
+    def link_base(self):
+        """
+        Absolute URL every short link starts with, built once per serializer (the child serializer
+        of a list is shared by all its rows, so once per response).
+        """
+        return short_link_base(self.context.get('request'), None)
+
+    @cached_property
+    def qr_code_url_parts(self):
+        """
+        The QR image endpoint URL split around the link id, so the URL is reversed once per response.
+        """
+        return reverse('shorturl-qr', args=[PK_PLACEHOLDER], request=self.context.get('request')).rsplit(PK_PLACEHOLDER, 1)
+
+    def validate(self, attrs):
+        """
+        Validate that a custom short code is not in use on its domain. Keeping a link's own code and domain on update needs no query.
+        """
+        instance = self.instance
+        short_code = attrs.get('short_code', instance.short_code if instance else None)
+        domain_id = attrs.get('domain_id', instance.domain_id if instance else None)
+        if not short_code or (instance is not None and (short_code, domain_id) == (instance.short_code, instance.domain_id)):
+            return attrs
+        if ShortURL.objects.filter(short_code=short_code, domain_id=domain_id).exists():
+            raise serializers.ValidationError({'short_code': DUPLICATE_CODE_ERROR})
+        return attrs
 
     def validate_original_url(self, value):
         """
@@ -36,23 +101,38 @@ class ShortURLSerializer(serializers.ModelSerializer):
     
     def get_short_link(self, obj):
         """
-        Generate the short link for the URL.
+        Generate the short link for the URL, on its custom domain if it has one.
         """
-        request = self.context.get('request')
-        path = f'/r/{obj.short_code}/'
-        return request.build_absolute_uri(path) if request else path
+        if obj.domain_id is None:
+            return f'{self.link_base}{obj.short_code}/'
+        base = short_link_base(self.context.get('request'), obj.domain_id)  # host name from the domain map
+        return f'{base}{obj.short_code}/'
 
 
+    def get_clicks(self, obj):
+        """
+        Return the click count, including clicks of a hot link still in its counter shards.
+        """
+        return obj.clicks + (getattr(obj, 'pending_clicks', 0) or 0)
+
+    def get_unique_visitors(self, obj):
+        """
+        Return the HyperLogLog estimate of unique visitors and its relative standard error.
+        """
+        return unique_visitors(obj.unique_visitors)
+
     def get_qr_code(self, obj):
         """
-        Generate a QR code for the short URL and return it as a base64-encoded string.
+        Return the QR code for the short URL as a base64-encoded PNG, rendered once and then served from the cache.
+        """
+        return qr_data_uri(self.get_short_link(obj))
+
+    def get_qr_code_url(self, obj):
+        """
+        Generate the URL of the QR code image endpoint for the URL.
         """
-        short_url = self.get_short_link(obj)
-        qr = qrcode.make(short_url)  # Generate the QR code image
-        buffer = BytesIO()  # Create a bytes buffer to hold the image
-        qr.save(buffer, format='PNG')
-        base64_qr = base64.b64encode(buffer.getvalue()).decode('utf-8')  # Encode the image to base64
-        return f'data:image/png;base64,{base64_qr}'
+        prefix, suffix = self.qr_code_url_parts
+        return f'{prefix}{obj.pk}{suffix}'
     
     def validate_expiration_date(self, value):
         """
@@ -62,3 +142,31 @@ class ShortURLSerializer(serializers.ModelSerializer):
         if value and value <= timezone.now():
             raise serializers.ValidationError("Expiration date must be in the future.") # raise an error then
         return value # return the value if valid
+
+
+class ShortURLReadSerializer(ShortURLSerializer):
+    """
+    Serializes links for the list and retrieve endpoints. Every field is read-only, so no
+    validators or related-field querysets are set up for a response.
+    """
+    short_code = serializers.CharField(read_only=True)
+    domain = DomainField(source='domain_id', read_only=True)
+
+    class Meta(ShortURLSerializer.Meta):
+        read_only_fields = ShortURLSerializer.Meta.fields
+
+
+class BulkShortURLSerializer(ShortURLSerializer):
+    """
+    Validates one item of a bulk shortening request. Custom short codes are checked
+    for uniqueness by the bulk view with one query for the whole batch.
+    """
+    short_code = serializers.CharField(required=False, max_length=10) # no per-item uniqueness query, see above
+
+    def validate(self, attrs):
+        return attrs
+
+    class Meta:
+        model = ShortURL
+        fields = ['original_url', 'domain', 'short_code', 'expiration_date']
+        validators = []
@@ -0,0 +1,223 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from .conf import get_setting
+from .cursors import IdCursor
+from .domains import routing_key
+
+SNAPSHOT_MAGIC = b'RDS3'
+HEADER = struct.Struct('>4sIdQq')  # magic, record count, generated at (epoch seconds), offset of the records, last change marker id reflected
+RECORD = struct.Struct('>24sQIIq')  # routing key (NUL padded), ShortURL id, URL offset, URL length, expiry (epoch microseconds, 0 = never)
+CODE_BYTES = 24  # routing keys: a namespace ('/' or '<domain id>/') and a code of up to 10 characters
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def code_key(short_code):
+    """The padded bytes a code is sorted and searched by, None for codes that do not fit a record."""
+    key = short_code.encode('utf-8')
+    return key.ljust(CODE_BYTES, b'\0') if len(key) <= CODE_BYTES else None
+
+
+def to_micros(value):
+    return 0 if value is None else (value - EPOCH) // timedelta(microseconds=1)
+
+
+class RedirectSnapshot:
+    """
+    Read-only table of the active short codes, by routing key, at the time it was written (see write()).
+
+    Laid out as the header, the destination URLs, then fixed-size records sorted by code.
+    The file is memory-mapped, so every worker process shares the same page cache pages, and a
+    lookup is a binary search over the records followed by one read of the destination URL.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size or self._map[:4] != SNAPSHOT_MAGIC:
+            self._map.close()
+            raise ValueError(f'{path} is not a redirect snapshot.')
+        _, self.size, self.generated_at, self._records, self.change_id = HEADER.unpack_from(self._map)
+        if self._records + self.size * RECORD.size != len(self._map):  # truncated or not finished
+            self._map.close()
+            raise ValueError(f'{path} is not a redirect snapshot.')
+
+    def lookup(self, short_code):
+        """(id, original URL, is_active, expiration date) of an active code at snapshot time, None when the snapshot does not have it."""
+        key = code_key(short_code)
+        if key is None:
+            return None
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            offset = self._records + middle * RECORD.size
+            if self._map[offset:offset + CODE_BYTES] < key:
+                low = middle + 1
+            else:
+                high = middle
+        offset = self._records + low * RECORD.size
+        if low == self.size or self._map[offset:offset + CODE_BYTES] != key:
+            return None
+        _, pk, url_offset, url_length, expires = RECORD.unpack_from(self._map, offset)
+        original_url = self._map[url_offset:url_offset + url_length].decode('utf-8')
+        return (pk, original_url, True, EPOCH + timedelta(microseconds=expires) if expires else None)
+
+    def close(self):
+        self._map.close()
+
+    @staticmethod
+    def write(rows, path, generated_at, change_id=0):
+        """
+        Write (short code, id, original URL, expiration date) rows to a snapshot file, replacing
+        it atomically. URLs are streamed to the file; only the records are kept in memory to be sorted.
+        `change_id` is the RedirectChange id readers resume the marker catch-up after.
+        Returns the number of codes written.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        records = []
+        with open(temp_path, 'wb') as handle:
+            handle.write(HEADER.pack(SNAPSHOT_MAGIC, 0, 0, 0, 0))  # rewritten once the counts are known
+            offset = HEADER.size
+            for short_code, pk, original_url, expiration_date in rows:
+                key = code_key(short_code)
+                if key is None:  # answered from the database instead
+                    continue
+                url = original_url.encode('utf-8')
+                handle.write(url)
+                records.append((key, pk, offset, len(url), to_micros(expiration_date)))
+                offset += len(url)
+            records.sort()
+            for record in records:
+                handle.write(RECORD.pack(*record))
+            handle.seek(0)
+            handle.write(HEADER.pack(SNAPSHOT_MAGIC, len(records), generated_at, offset, change_id))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, path)  # workers reopen the snapshot when the file changes
+        return len(records)
+
+
+def build_snapshot(path):
+    """
+    Compile every active ShortURL into a snapshot at `path`, then drop the change markers the
+    new snapshot already reflects. Returns the number of codes written.
+
+    The markers are read first: readers of the snapshot resume after the last one (before the
+    first gap, a marker whose change may not be visible to the read of the links yet), so a change
+    committed while the links are read stays marked.
+    """
+    from .models import RedirectChange, ShortURL  # imported here because models.py imports this module
+
+    margin = get_setting('REDIRECT_SNAPSHOT')['REFRESH_MARGIN']
+    generated_at = time.time()
+    changes = IdCursor()
+    changes.advance(RedirectChange.objects.values_list('id', flat=True), margin)  # the table only holds recent markers
+    change_id = changes.resume_id()
+    rows = ShortURL.objects.filter(is_active=True).values_list('domain_id', 'short_code', 'id', 'original_url', 'expiration_date')
+    keyed = ((routing_key(domain_id, short_code), *row) for domain_id, short_code, *row in rows.iterator(chunk_size=10000))
+    count = RedirectSnapshot.write(keyed, path, generated_at, change_id)
+    # workers switch to the new file within RELOAD_INTERVAL, until then the previous snapshot still needs its markers
+    RedirectChange.objects.filter(id__lte=change_id, changed_at__lt=datetime.fromtimestamp(generated_at - margin, dt_timezone.utc)).delete()
+    return count
+
+
+def record_changes(*short_codes):
+    """
+    Mark routing keys whose mapping changed (updated, renamed or deleted links), so workers stop
+    answering them from the snapshot: this process right away, the others at their next refresh.
+    """
+    from .models import RedirectChange
+
+    # the current and the previous key of a link; keys too long for a record are never in a snapshot
+    short_codes = {short_code for short_code in short_codes if short_code and code_key(short_code) is not None}
+    if not short_codes or not get_setting('REDIRECT_SNAPSHOT')['FILE']:
+        return
+    RedirectChange.objects.bulk_create([RedirectChange(short_code=short_code) for short_code in short_codes])
+    redirect_snapshot.mark_dirty(*short_codes)
+
+
+class SnapshotReader:
+    """
+    Per-process access to the redirect snapshot at SHORTENER['REDIRECT_SNAPSHOT']['FILE'].
+
+    Every RELOAD_INTERVAL seconds the file is checked and reopened when it was replaced, and the
+    RedirectChange markers added since the last read (by id, see IdCursor, starting after the
+    snapshot's change_id) are read; codes with a marker are left to the cache and the database
+    until a newer snapshot includes them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._file = None  # (path, mtime, inode) of the open snapshot
+        self._dirty = set()  # codes changed since the snapshot was generated
+        self._changes = IdCursor()  # RedirectChange markers read
+        self._checked_at = float('-inf')  # monotonic time of the last refresh
+
+    def enabled(self):
+        return bool(get_setting('REDIRECT_SNAPSHOT')['FILE'])
+
+    def due(self):
+        """Whether refresh() should run before the snapshot is consulted."""
+        config = get_setting('REDIRECT_SNAPSHOT')
+        if not config['FILE']:
+            return False
+        return time.monotonic() - self._checked_at >= config['RELOAD_INTERVAL']
+
+    def get(self, short_code):
+        """The snapshot's mapping of a code, None when the snapshot is disabled, lacks the code or it changed since."""
+        if not self.enabled():
+            return None
+        if self.due():
+            self.refresh()
+        return self.lookup(short_code)
+
+    def lookup(self, short_code):
+        """get() without the refresh, for the async path which refreshes in a thread first."""
+        snapshot = self._snapshot
+        if snapshot is None or short_code in self._dirty:
+            return None
+        return snapshot.lookup(short_code)
+
+    def mark_dirty(self, *short_codes):
+        self._dirty.update(short_codes)
+
+    def refresh(self):
+        """Reopen the snapshot if the file was replaced, then read the change markers written since."""
+        from .models import RedirectChange
+
+        config = get_setting('REDIRECT_SNAPSHOT')
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                stat = os.stat(config['FILE'])
+                current = (config['FILE'], stat.st_mtime_ns, stat.st_ino)
+            except OSError:  # not built yet, or removed
+                self._snapshot, self._file = None, None
+                return
+            if current != self._file:
+                try:
+                    snapshot = RedirectSnapshot(config['FILE'])
+                except (OSError, ValueError):
+                    return  # keep serving the previous snapshot
+                # the old map is not closed: a concurrent lookup may still read it, it goes with its last reference
+                self._snapshot, self._file = snapshot, current
+                self._dirty = set()
+                self._changes = IdCursor(snapshot.change_id)
+            rows = list(self._changes.unread(RedirectChange.objects.all()).values_list('id', 'short_code'))
+            self._dirty.update(short_code for _, short_code in rows)
+            self._changes.advance([pk for pk, _ in rows], config['REFRESH_MARGIN'])
+
+    def clear(self):
+        with self._lock:
+            self._snapshot, self._file = None, None
+            self._dirty = set()
+            self._checked_at = float('-inf')
+
+
+redirect_snapshot = SnapshotReader()  # process-wide instance used by the resolution cache
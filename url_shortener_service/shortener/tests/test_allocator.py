@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from shortener.allocator import ShortCodeAllocator, short_code_allocator
+from shortener.models import ShortURL, ShortCodeSequence
+
+
+class ShortCodeAllocatorTest(TransactionTestCase):
+    """
+    Tests for the block-reserving short code allocator, run outside a test transaction
+    like a normal request would be.
+
+    This test class verifies:
+    - Creating a short URL is a single INSERT once a block is reserved
+    - A block is reserved with one counter update and then served from memory
+    - Separate processes (allocator instances) never hand out the same code
+    - Bulk allocation larger than a block returns unique codes
+    """
+
+    def setUp(self):
+        short_code_allocator.reset() # do not reuse a block from before the database was flushed
+
+    def tearDown(self):
+        short_code_allocator.reset() # the flush after this test drops the counter row
+
+    def test_create_is_a_single_insert(self):
+        """
+        Test that a short URL is written with one query once the allocator holds a block
+        """
+        ShortURL.objects.create(original_url="https://first.com") # reserves a block
+        with self.assertNumQueries(1): # only the INSERT
+            url = ShortURL.objects.create(original_url="https://second.com")
+        self.assertTrue(url.short_code) # check if the code was set before the insert
+        self.assertEqual(ShortURL.objects.get(pk=url.pk).short_code, url.short_code) # check if it was stored
+
+    @override_settings(SHORTENER={'SHORT_CODES': {'BLOCK_SIZE': 10}})
+    def test_block_is_reserved_once(self):
+        """
+        Test that a block of BLOCK_SIZE numbers costs one counter update
+        """
+        allocator = ShortCodeAllocator()
+        allocator.allocate() # reserve the block
+        before = ShortCodeSequence.objects.get(name="short_code").next_value
+        allocator.allocate(9) # the rest of the block
+        self.assertEqual(ShortCodeSequence.objects.get(name="short_code").next_value, before) # check if no new block
+
+    @override_settings(SHORTENER={'SHORT_CODES': {'BLOCK_SIZE': 5}})
+    def test_workers_never_share_codes(self):
+        """
+        Test that two allocators (standing in for two worker processes) hand out disjoint codes
+        """
+        worker_a, worker_b = ShortCodeAllocator(), ShortCodeAllocator()
+        codes = []
+        for _ in range(12): # interleave allocations across several blocks
+            codes += worker_a.allocate() + worker_b.allocate()
+        self.assertEqual(len(codes), len(set(codes))) # check if every code is unique
+
+    def test_bulk_allocation_is_unique(self):
+        """
+        Test that allocating more codes than a block holds returns unique codes
+        """
+        codes = ShortCodeAllocator().allocate(250)
+        self.assertEqual(len(set(codes)), 250) # check if every code is unique
+
+
+class ShortCodeAllocatorTransactionTest(TestCase):
+    """
+    Tests for allocating inside a surrounding transaction.
+
+    This test class verifies:
+    - Inside a transaction only the needed numbers are reserved, so a rollback leaks no block
+    """
+
+    def test_allocation_in_transaction_reserves_exactly(self):
+        """
+        Test that allocating inside a transaction moves the counter by exactly the allocated amount
+        """
+        allocator = ShortCodeAllocator()
+        before = ShortCodeSequence.objects.get(name="short_code").next_value
+        with transaction.atomic():
+            allocator.allocate(3)
+        self.assertEqual(ShortCodeSequence.objects.get(name="short_code").next_value, before + 3) # check if exact
+        self.assertEqual(allocator.allocate_numbers(1), [before + 3]) # check if no block was kept
@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from shortener.cache import resolution_cache
+from shortener.clicks import click_buffer
+from shortener.models import ShortURL, ClickEvent
+from shortener.views import AsyncRedirectView
+
+
+@override_settings(SHORTENER={'CLICK_LOGGING': {'MODE': 'memory', 'FLUSH_INTERVAL': None, 'BATCH_SIZE': 100}})
+class AsyncRedirectViewTest(TestCase):
+    """
+    Tests for the native async redirect view served under ASGI.
+
+    This test class verifies:
+    - Redirects resolve through the async cache path and queue the click without writing it
+    - A cached code is redirected without a database query
+    - Missing, inactive and expired codes return 404 and 410 like the DRF view
+    - No authentication runs, so a stale Authorization header does not break redirects
+    """
+
+    def setUp(self):
+        resolution_cache.clear() # start every test with an empty cache
+        self.short = ShortURL.objects.create(original_url="https://async.com") # create a dummy short URL
+        self.factory = RequestFactory()
+        self.view = async_to_sync(AsyncRedirectView.as_view()) # run the async view like the ASGI handler would
+
+    def get(self, short_code, **headers):
+        return self.view(self.factory.get(f"/r/{short_code}/", **headers), short_code=short_code)
+
+    def test_redirect_queues_click(self):
+        """
+        Test that the view redirects and leaves the click write to the buffer
+        """
+        response = self.get(self.short.short_code, HTTP_REFERER="https://ref.com")
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND) # check if status 302 Found
+        self.assertEqual(response["Location"], "https://async.com") # check if redirecting to the original URL
+        self.assertEqual(ClickEvent.objects.count(), 0) # nothing written in the request
+        self.assertEqual(click_buffer.pending(), 1) # check if the click is queued
+
+        click_buffer.flush() # write the queued click
+        self.assertEqual(ClickEvent.objects.get().referrer, "https://ref.com") # check if the click was recorded
+
+    def test_cached_code_skips_database(self):
+        """
+        Test that a second redirect is served from the cache
+        """
+        self.get(self.short.short_code) # first request fills the cache
+        with CaptureQueriesContext(connection) as captured:
+            response = self.get(self.short.short_code)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual([query["sql"] for query in captured if '"shortener_shorturl"' in query["sql"]], []) # check if no lookup ran
+        click_buffer.flush()
+
+    def test_missing_inactive_and_expired(self):
+        """
+        Test the 404 and 410 responses
+        """
+        inactive = ShortURL.objects.create(original_url="https://inactive.com", is_active=False)
+        expired = ShortURL.objects.create(original_url="https://expired.com", expiration_date=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(self.get("missing").status_code, status.HTTP_404_NOT_FOUND) # check unknown code
+        self.assertEqual(self.get(inactive.short_code).status_code, status.HTTP_404_NOT_FOUND) # check inactive link
+        response = self.get(expired.short_code)
+        self.assertEqual(response.status_code, status.HTTP_410_GONE) # check expired link
+        self.assertIn(b"URL has expired.", response.content)
+        self.assertEqual(click_buffer.pending(), 0) # check if no click was queued
+
+    def test_no_authentication(self):
+        """
+        Test that an invalid bearer token is ignored by the redirect
+        """
+        response = self.get(self.short.short_code, HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND) # check if the redirect still works
+        click_buffer.flush()
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+from benchmarks import harness, loadgen
+
+
+class BenchmarkHarnessTest(SimpleTestCase):
+    """
+    Tests for the benchmark harness used by benchmarks/micro.py and benchmarks/loadgen.py.
+
+    This test class verifies:
+    - Measurements report the time per call over the requested rounds
+    - Results survive a round trip through the JSON file
+    - Only benchmarks slower than the baseline by more than the threshold are flagged
+    - Load test results are flagged for a slower p99 or a lower throughput
+    """
+
+    def test_measure(self):
+        """
+        Test that every round runs the requested number of iterations after the warm-up
+        """
+        calls = []
+        result = harness.measure(lambda: calls.append(1), rounds=3, iterations=4, warmup=1)
+        self.assertEqual(len(calls), 16) # 1 warm-up round and 3 measured rounds of 4 calls
+        self.assertEqual((result["rounds"], result["iterations"]), (3, 4))
+        self.assertLessEqual(result["min_us"], result["median_us"])
+
+    def test_results_round_trip(self):
+        """
+        Test that written results load back without the environment metadata
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            harness.write_results(path, {"save": {"median_us": 10.0}})
+            self.assertEqual(harness.load_results(path), {"save": {"median_us": 10.0}})
+            with open(path) as handle:
+                self.assertIn("python", json.load(handle)["environment"])
+
+    def test_compare_flags_regressions(self):
+        """
+        Test that slowdowns beyond the threshold are flagged and new benchmarks are skipped
+        """
+        baseline = {"save": {"median_us": 100.0}, "resolve": {"median_us": 10.0}}
+        results = {"save": {"median_us": 119.0}, "resolve": {"median_us": 13.0}, "new": {"median_us": 5.0}}
+        regressions = harness.compare(results, baseline, threshold=0.2)
+        self.assertEqual(list(regressions), ["resolve"])
+        self.assertAlmostEqual(regressions["resolve"][2], 0.3)
+
+    def test_load_regressions(self):
+        """
+        Test that the load generator flags a slower p99 and a lower throughput
+        """
+        baseline = {"rps": 1000.0, "p99_ms": 10.0}
+        self.assertEqual(loadgen.regressions({"rps": 900.0, "p99_ms": 11.0}, baseline, 0.2), {})
+        self.assertEqual(set(loadgen.regressions({"rps": 700.0, "p99_ms": 13.0}, baseline, 0.2)), {"rps", "p99_ms"})
+        self.assertEqual(loadgen.regressions({"rps": 1.0, "p99_ms": 99.0}, {}, 0.2), {}) # no baseline for the scenario
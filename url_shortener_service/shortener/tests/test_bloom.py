@@ -0,0 +1,181 @@
+import os
+import tempfile
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from shortener.bloom import BloomFilter, code_filter
+from shortener.bulk import create_short_urls
+from shortener.cache import resolution_cache
+from shortener.models import ShortURL
+
+
+def shorturl_queries(captured):
+    return [query["sql"] for query in captured if '"shortener_shorturl"' in query["sql"]]
+
+
+class BloomFilterTest(TestCase):
+    """
+    Tests for the Bloom filter data structure.
+
+    This test class verifies:
+    - Added values are always reported as present
+    - The false positive rate stays close to the configured error rate
+    - A filter survives a round trip through bytes
+    """
+
+    def test_membership_and_error_rate(self):
+        """
+        Test that there are no false negatives and few false positives at capacity
+        """
+        bloom = BloomFilter(2000, 0.01)
+        for number in range(2000):
+            bloom.add(f"code{number}")
+        self.assertTrue(all(f"code{number}" in bloom for number in range(2000))) # check for false negatives
+        false_positives = sum(f"other{number}" in bloom for number in range(10000))
+        self.assertLess(false_positives, 250) # check the error rate (1% expected, 2.5% allowed)
+
+    def test_round_trip(self):
+        """
+        Test that to_bytes/from_bytes keep the contents
+        """
+        bloom = BloomFilter(100)
+        bloom.add("abc")
+        loaded = BloomFilter.from_bytes(bloom.to_bytes())
+        self.assertIn("abc", loaded) # check the added value
+        self.assertEqual((loaded.size, loaded.hashes, loaded.count), (bloom.size, bloom.hashes, bloom.count))
+
+
+class NegativeLookupTest(TestCase):
+    """
+    Tests for rejecting unknown short codes without the database.
+
+    This test class verifies:
+    - Codes ruled out by the code filter are answered 404 without a lookup query
+    - A code created by another process since the last catch-up is found, unless the shared tier already publishes it
+    - Codes that pass the filter but do not exist are cached as negative entries
+    - Codes created with save(), bulk creates and renames resolve right away
+    - The filter is saved to and loaded from its file
+    - Codes of rows written by other processes are caught up by id, whatever their creation time
+    """
+
+    def setUp(self):
+        resolution_cache.clear() # start every test with an empty cache
+        resolution_cache.reset_stats()
+        code_filter.reset() # rebuilt from this test's data on first use
+        self.short = ShortURL.objects.create(original_url="https://known.com") # create a dummy short URL
+
+    def test_unknown_code_rejected_in_memory(self):
+        """
+        Test that a code that never existed does not reach the database
+        """
+        code_filter.refresh() # builds the filter
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse("redirect", args=["nosuchcode"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND) # check if status 404 Not Found
+        self.assertFalse([sql for sql in shorturl_queries(captured) if "short_code" in sql.split("WHERE")[-1]]) # check if no lookup by code ran
+        self.assertEqual(resolution_cache.stats()["filter_rejects"], 1) # check if the code was rejected by the filter
+
+    def test_code_from_another_process_resolves(self):
+        """
+        Test that a code inserted by another worker (not added to this filter, not published) redirects before the next refresh
+        """
+        code_filter.refresh() # builds the filter
+        ShortURL.objects.bulk_create([ShortURL(original_url="https://elsewhere.com", short_code="elsewhere")]) # bypasses save() and publish()
+        self.assertNotIn("/elsewhere", code_filter)
+        response = self.client.get(reverse("redirect", args=["elsewhere"]))
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND) # check the filter caught up instead of rejecting it
+        self.assertEqual((resolution_cache.stats()["filter_catch_ups"], resolution_cache.stats()["filter_rejects"]), (1, 0))
+
+    def test_shared_tier_across_processes_skips_catch_up(self):
+        """
+        Test that with a cache shared by the workers, where new codes are published, the filter rejects on its own
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory}}):
+                code_filter.refresh()
+                with CaptureQueriesContext(connection) as captured:
+                    self.assertIsNone(resolution_cache.resolve("nosuchcode"))
+                self.assertEqual(shorturl_queries(captured), []) # check no catch-up ran
+        self.assertEqual(resolution_cache.stats()["filter_catch_ups"], 0)
+
+    def test_deleted_code_cached_as_negative(self):
+        """
+        Test that a code the filter still knows but the database does not is looked up once
+        """
+        code = self.short.short_code
+        code_filter.refresh() # builds the filter while the code exists
+        self.short.delete()
+        self.assertIsNone(resolution_cache.resolve(code)) # the filter cannot forget it, the database says no
+        with CaptureQueriesContext(connection) as captured:
+            self.assertIsNone(resolution_cache.resolve(code))
+        self.assertEqual(shorturl_queries(captured), []) # check if the negative entry answered
+        self.assertEqual(resolution_cache.stats()["negative_hits"], 1)
+
+    def test_new_codes_resolve_immediately(self):
+        """
+        Test that codes created or renamed after the filter was built are found
+        """
+        code_filter.refresh() # builds the filter
+        created = ShortURL.objects.create(original_url="https://new.com")
+        [(_, bulk_created)] = create_short_urls([{"original_url": "https://bulk.com"}], None)
+        self.short.short_code = "renamed1"
+        self.short.save()
+
+        for code in (created.short_code, bulk_created.short_code, "renamed1"):
+            self.assertIsNotNone(resolution_cache.resolve(code), code) # check if every new code resolves
+
+    def test_file_round_trip(self):
+        """
+        Test that a built filter is saved to its file and used for a warm start
+        """
+        path = os.path.join(tempfile.mkdtemp(), "code-filter.bin")
+        with override_settings(SHORTENER={'BLOOM_FILTER': {'FILE': path}}):
+            code_filter.refresh() # builds and saves the filter
+            self.assertTrue(os.path.exists(path)) # check if the file was written
+            code_filter.reset()
+            with CaptureQueriesContext(connection) as captured:
+                code_filter.refresh() # loads the file, then catches up with recent rows only
+            self.assertFalse([sql for sql in shorturl_queries(captured) if "COUNT(" in sql]) # check if no full rebuild ran
+            self.assertIn(self.short.routing_key, code_filter) # check the loaded contents
+
+    def test_catch_up_by_id(self):
+        """
+        Test that a row from another process is caught up even when its creation time is long past
+        """
+        code_filter.refresh() # builds the filter
+        ShortURL.objects.bulk_create([ShortURL(original_url="https://late.com", short_code="latecode", created_at=timezone.now() - timedelta(days=1))]) # bypasses save()
+        self.assertNotIn("/latecode", code_filter) # not added by this process
+        code_filter.refresh() # the next catch-up
+        self.assertIn("/latecode", code_filter) # check the row was read by its id
+
+
+class BackgroundBuildTest(TransactionTestCase):
+    """
+    Tests for building the code filter off the request path.
+
+    This test class verifies:
+    - The first lookup starts the build in a thread and passes codes through until it is done
+    """
+
+    def setUp(self):
+        code_filter.reset()
+        self.short = ShortURL.objects.create(original_url="https://built.com") # committed, so the builder thread sees it
+
+    def tearDown(self):
+        code_filter.reset()
+
+    def test_first_lookup_does_not_build(self):
+        """
+        Test that the lookup returns without reading the short codes, and the filter is installed by the thread
+        """
+        with CaptureQueriesContext(connection) as captured:
+            self.assertTrue(code_filter.might_contain("/nosuchcode")) # passed through while the filter is built
+        self.assertEqual(shorturl_queries(captured), []) # check if the request did not read the table
+        code_filter._builder.join() # wait for the builder thread
+        self.assertFalse(code_filter.might_contain("/nosuchcode")) # check if the built filter answers now
+        self.assertTrue(code_filter.might_contain(self.short.routing_key))
@@ -0,0 +1,109 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from shortener.models import ShortURL
+
+User = get_user_model()
+
+class BulkShortenTest(APITestCase):
+    """
+    Tests for the bulk shortening endpoint.
+
+    This test class verifies:
+    - A JSON array of URLs is created in one request and reported per item
+    - Invalid items and taken custom codes are reported without failing the rest of the batch
+    - The number of queries does not grow with the number of items
+    - NDJSON input is answered with NDJSON output
+    - Oversized batches and unauthenticated requests are rejected
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="bulkuser", password="bulkpass123") # create a dummy user
+        refresh = RefreshToken.for_user(self.user) # create a refresh token for the user
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(refresh.access_token)) # authenticate as the dummy user
+        self.bulk_url = reverse("shorturl-bulk") # /api/shorten/bulk/
+
+    def post_json(self, items):
+        """Send a JSON array and return the response with its parsed results"""
+        response = self.client.post(self.bulk_url, items, format="json")
+        return response, json.loads(b"".join(response.streaming_content))
+
+    def test_json_array_is_created(self):
+        """
+        Test that every item of a JSON array is created for the authenticated user
+        """
+        items = [{"original_url": f"https://site{i}.com"} for i in range(3)] + [{"original_url": "https://custom.com", "short_code": "bulk1"}]
+        response, results = self.post_json(items)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED) # check if status 201 Created
+        self.assertEqual([row["status"] for row in results], ["created"] * 4) # check if every item was created
+        self.assertEqual(results[3]["short_code"], "bulk1") # check if the custom code was kept
+        self.assertTrue(results[0]["short_link"].endswith(f"/r/{results[0]['short_code']}/")) # check the short link
+        self.assertEqual(ShortURL.objects.filter(user=self.user).count(), 4) # check if bound to the user
+
+    def test_partial_failure_is_reported_per_item(self):
+        """
+        Test that invalid URLs and taken codes fail only their own item
+        """
+        ShortURL.objects.create(original_url="https://taken.com", short_code="taken1") # existing custom code
+        items = [
+            {"original_url": "https://ok.com"},
+            {"original_url": "not-a-url"}, # invalid URL
+            {"original_url": "https://dup.com", "short_code": "taken1"}, # taken in the database
+            {"original_url": "https://a.com", "short_code": "twice1"},
+            {"original_url": "https://b.com", "short_code": "twice1"}, # taken earlier in the batch
+        ]
+        response, results = self.post_json(items)
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS) # check if status 207 Multi-Status
+        self.assertEqual([row["status"] for row in results], ["created", "error", "error", "created", "error"])
+        self.assertIn("original_url", results[1]["errors"]) # check the reported field
+        self.assertIn("short_code", results[2]["errors"])
+        self.assertIn("short_code", results[4]["errors"])
+        self.assertEqual(response["X-Bulk-Failed"], "3") # check the failure count header
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        """
+        Test that 5 and 50 items cost the same number of queries
+        """
+        counts = []
+        for size in (5, 50):
+            items = [{"original_url": f"https://n{size}-{i}.com"} for i in range(size)]
+            with CaptureQueriesContext(connection) as captured: # record the queries of one request
+                self.post_json(items)
+            counts.append(len(captured))
+        self.assertEqual(counts[0], counts[1]) # check if the batch size did not add queries
+
+    def test_ndjson_in_and_out(self):
+        """
+        Test that an NDJSON body is parsed line by line and answered with NDJSON
+        """
+        body = "\n".join(json.dumps({"original_url": f"https://nd{i}.com"}) for i in range(2)) + "\n"
+        response = self.client.post(self.bulk_url, body, content_type="application/x-ndjson")
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson") # check the response format
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["status"] for line in lines], ["created", "created"]) # check the results
+
+    @override_settings(SHORTENER={'BULK': {'MAX_ITEMS': 2}})
+    def test_too_many_items_returns_400(self):
+        """
+        Test that a batch above MAX_ITEMS is rejected
+        """
+        response = self.client.post(self.bulk_url, [{"original_url": "https://x.com"}] * 3, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST) # check if status 400 Bad Request
+
+    def test_unauthenticated_request_fails(self):
+        """
+        Test that an unauthenticated client cannot use the bulk endpoint
+        """
+        self.client.credentials() # remove the auth header
+        response = self.client.post(self.bulk_url, [{"original_url": "https://x.com"}], format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED) # check if status 401 Unauthorized
@@ -0,0 +1,115 @@
+from rest_framework.test import APITestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+from shortener.models import ShortURL
+from shortener.cache import ResolvedURL, SharedTier, resolution_cache
+
+User = get_user_model()
+
+class ResolutionCacheTest(APITestCase):
+    """
+    Tests for the short code resolution cache used by the redirect endpoint.
+
+    This test class verifies:
+    - Repeated redirects for the same code are served from the cache without a lookup query
+    - Updating a short URL through the API invalidates the cached mapping
+    - Deleting a short URL stops the code from redirecting
+    - The cache stats endpoint is only available to staff users
+    - Clearing the shared tier leaves the other keys of its cache alias alone
+    """
+
+    def setUp(self):
+        resolution_cache.clear() # start every test with an empty cache
+        resolution_cache.reset_stats() # and fresh counters
+        self.user = User.objects.create_user(username="cacheuser", password="cachepass123") # create a dummy user
+        refresh = RefreshToken.for_user(self.user) # create a refresh token for the user
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(refresh.access_token)) # authenticate as the dummy user
+        self.short = ShortURL.objects.create(user=self.user, original_url="https://cached.com") # create a dummy short URL
+        self.redirect_url = reverse("redirect", args=[self.short.short_code]) # reverse the redirect URL
+
+    def test_second_redirect_is_served_from_cache(self):
+        """
+        Test that the second redirect does not query the ShortURL table for the mapping
+        """
+        self.client.credentials() # anonymous visitor, so no user lookup for JWT auth
+        self.client.get(self.redirect_url) # first request fills the cache
+        with CaptureQueriesContext(connection) as captured: # record the queries of the second request
+            response = self.client.get(self.redirect_url)
+        lookups = [query["sql"] for query in captured if query["sql"].startswith('SELECT') and '"shortener_shorturl"' in query["sql"]]
+        self.assertEqual(lookups, []) # check if the mapping was not read from the database
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND) # check if status 302 Found
+        self.assertEqual(response["Location"], "https://cached.com") # check if redirecting to the original URL
+        self.assertEqual(resolution_cache.stats()["local_hits"], 1) # check if the hit was counted
+
+    def test_update_invalidates_cached_mapping(self):
+        """
+        Test that changing the destination through the API takes effect immediately
+        """
+        self.client.get(self.redirect_url) # cache the current mapping
+        url_detail = reverse("shorturl-detail", args=[self.short.id]) # detail URL of the short URL
+        self.client.patch(url_detail, {"original_url": "https://updated.com"}, format="json") # change the destination
+
+        response = self.client.get(self.redirect_url) # redirect again
+        self.assertEqual(response["Location"], "https://updated.com") # check if the new destination is used
+
+    def test_changed_short_code_stops_resolving(self):
+        """
+        Test that the old code returns 404 after the short code is changed on the model
+        """
+        self.client.get(self.redirect_url) # cache the current mapping
+        self.short = ShortURL.objects.get(pk=self.short.pk) # reload so the loaded code is tracked
+        self.short.short_code = "renamed1" # change the short code
+        self.short.save()
+
+        response = self.client.get(self.redirect_url) # old code
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND) # check if status 404 Not Found
+        response = self.client.get(reverse("redirect", args=["renamed1"])) # new code
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND) # check if status 302 Found
+
+    def test_delete_invalidates_cached_mapping(self):
+        """
+        Test that a deleted short URL stops redirecting even when it was cached
+        """
+        self.client.get(self.redirect_url) # cache the current mapping
+        self.client.delete(reverse("shorturl-detail", args=[self.short.id])) # delete the short URL
+
+        response = self.client.get(self.redirect_url) # redirect again
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND) # check if status 404 Not Found
+
+    def test_cache_stats_requires_staff(self):
+        """
+        Test that the cache stats endpoint rejects regular users and serves staff users
+        """
+        response = self.client.get(reverse("cache_stats")) # regular user
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN) # check if status 403 Forbidden
+
+        self.user.is_staff = True # promote the dummy user to staff
+        self.user.save()
+        response = self.client.get(reverse("cache_stats"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK) # check if status 200 OK
+        self.assertIn("hit_ratio", response.data) # check if the derived ratio is reported
+
+    @override_settings(SHORTENER={'RESOLUTION_CACHE': {'SHARED_CACHE_ALIAS': 'default', 'LOCAL_TIMEOUT': 0}})
+    def test_shared_clear_keeps_other_keys(self):
+        """
+        Test that clearing the shared tier drops its entries in every process but no other key of the alias
+        """
+        backend = caches['default']
+        backend.set('unrelated', 'kept') # a key written by another user of the alias
+        entry = ResolvedURL(1, "https://cached.com", True, None)
+        other = SharedTier() # the shared tier of another worker process
+        resolution_cache.shared.set('abc', entry, 60)
+        self.assertEqual(other.get('abc'), entry) # check if both processes share the entry
+
+        resolution_cache.shared.clear()
+        self.assertIsNone(resolution_cache.shared.get('abc')) # check if the entry is gone
+        self.assertIsNone(other.get('abc')) # for the other process too
+        self.assertEqual(backend.get('unrelated'), 'kept') # check if the other key survived
+        backend.delete('unrelated')
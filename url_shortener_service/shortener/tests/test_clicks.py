@@ -0,0 +1,175 @@
+import os
+import tempfile
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from shortener.clicks import ClickBuffer, ClickRecord, persist_clicks, journal_files
+from shortener.interning import user_agents
+from shortener.models import ShortURL, ClickEvent, ClickRollup
+
+
+class PersistClicksTest(TestCase):
+    """
+    Tests for the batched click writer.
+
+    This test class verifies:
+    - A batch updates each click counter once and inserts all click events
+    - The click time of each record is kept
+    - Records for deleted short URLs are dropped instead of failing the batch
+    """
+
+    def setUp(self):
+        self.first = ShortURL.objects.create(original_url="https://first.com") # create dummy short URL 1
+        self.second = ShortURL.objects.create(original_url="https://second.com") # create dummy short URL 2
+
+    def test_batch_aggregates_counter_updates(self):
+        """
+        Test that one batch writes one UPDATE per short URL and one INSERT for all events
+        """
+        now = timezone.now()
+        records = [ClickRecord(self.first.id, now, "1.1.1.1", "ua")] * 3 + [ClickRecord(self.second.id, now, "2.2.2.2", "ua")]
+
+        with CaptureQueriesContext(connection) as captured: # record the queries of the batch
+            persist_clicks(records)
+        statements = [query["sql"].split(" (")[0] for query in captured]
+        self.assertEqual(sum(sql.startswith('UPDATE "shortener_shorturl"') for sql in statements), 2) # one counter update per short URL
+        self.assertEqual(sum(sql.startswith('INSERT INTO "shortener_clickevent"') for sql in statements), 1) # one bulk insert
+
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.clicks, 3) # check if the clicks were aggregated
+        self.assertEqual(self.second.clicks, 1)
+        self.assertEqual(ClickEvent.objects.count(), 4) # check if every event was inserted
+
+    def test_click_time_is_kept(self):
+        """
+        Test that events are stored with the time of the click rather than the time of the flush
+        """
+        clicked_at = timezone.now() - timedelta(minutes=5) # a click queued five minutes ago
+        persist_clicks([ClickRecord(self.first.id, clicked_at, "1.1.1.1", "ua")])
+        self.assertEqual(ClickEvent.objects.get().clicked_at, clicked_at) # check if the timestamp is unchanged
+
+    def test_deleted_short_url_is_skipped(self):
+        """
+        Test that clicks for a short URL deleted before the flush are dropped
+        """
+        deleted_id = self.second.id
+        self.second.delete() # delete the short URL before the flush
+        now = timezone.now()
+        written = persist_clicks([ClickRecord(self.first.id, now, "1.1.1.1", "ua"), ClickRecord(deleted_id, now, "2.2.2.2", "ua")])
+
+        self.assertEqual(written, 1) # check if only the remaining click was written
+        self.assertEqual(ClickEvent.objects.get().short_url_id, self.first.id)
+
+
+class ClickBufferTest(TestCase):
+    """
+    Tests for the buffered click logging modes.
+
+    This test class verifies:
+    - In 'memory' mode, the default, redirects queue clicks until the buffer is flushed and write nothing themselves
+    - The buffer flushes inline once BATCH_SIZE clicks are queued and no flusher thread is configured
+    - In 'disk' mode clicks are journaled and `drain_clicks` replays the journal of a stopped process
+    - In 'sync' mode a click writes its counter and event only, its sketch and rollups follow at the next flush
+    """
+
+    def setUp(self):
+        self.short = ShortURL.objects.create(original_url="https://buffered.com") # create a dummy short URL
+        self.journal_dir = tempfile.mkdtemp() # temporary journal directory
+
+    def click_logging(self, **overrides):
+        """Settings override for the click logging section"""
+        config = {'MODE': 'memory', 'FLUSH_INTERVAL': None, 'BATCH_SIZE': 100, 'JOURNAL_DIR': self.journal_dir}
+        config.update(overrides)
+        return override_settings(SHORTENER={'CLICK_LOGGING': config})
+
+    def test_memory_mode_queues_until_flush(self):
+        """
+        Test that redirects in 'memory' mode do not write clicks until the buffer is flushed
+        """
+        from shortener.clicks import click_buffer
+
+        with self.click_logging():
+            for _ in range(3): # simulate multiple redirects
+                response = self.client.get(reverse("redirect", args=[self.short.short_code]))
+                self.assertEqual(response.status_code, status.HTTP_302_FOUND) # check if the redirect still works
+
+            self.assertEqual(ClickEvent.objects.count(), 0) # nothing written yet
+            self.assertEqual(click_buffer.pending(), 3) # check if the clicks are queued
+            click_buffer.flush() # write the queued clicks
+
+        self.short.refresh_from_db()
+        self.assertEqual(self.short.clicks, 3) # check if the counter was updated
+        self.assertEqual(ClickEvent.objects.count(), 3) # check if the events were written
+
+    def test_buffered_by_default(self):
+        """
+        Test that without a configured mode a redirect runs no INSERT or UPDATE, the flush writes its click
+        """
+        from shortener.clicks import click_buffer
+
+        with override_settings(SHORTENER={'CLICK_LOGGING': {'FLUSH_INTERVAL': None}}): # the default MODE
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(reverse("redirect", args=[self.short.short_code]))
+            self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+            self.assertEqual([query["sql"] for query in captured if query["sql"].startswith(("INSERT", "UPDATE"))], []) # check the request wrote nothing
+            click_buffer.flush()
+        self.short.refresh_from_db()
+        self.assertEqual(self.short.clicks, 1) # check the flush counted the click
+
+    def test_batch_size_triggers_flush(self):
+        """
+        Test that queuing BATCH_SIZE clicks writes them without an explicit flush
+        """
+        buffer = ClickBuffer()
+        with self.click_logging(BATCH_SIZE=2):
+            buffer.add(ClickRecord(self.short.id, timezone.now(), "1.1.1.1", "ua"))
+            self.assertEqual(ClickEvent.objects.count(), 0) # below the threshold
+            buffer.add(ClickRecord(self.short.id, timezone.now(), "1.1.1.1", "ua"))
+        self.assertEqual(ClickEvent.objects.count(), 2) # check if the full batch was written
+        self.assertEqual(buffer.pending(), 0)
+
+    def test_disk_mode_journal_is_drained(self):
+        """
+        Test that clicks journaled by a process that never flushed are written by drain_clicks
+        """
+        buffer = ClickBuffer() # stands in for a worker process that stops without flushing
+        with self.click_logging(MODE='disk'):
+            for _ in range(2):
+                buffer.add(ClickRecord(self.short.id, timezone.now(), "1.1.1.1", "ua"))
+            self.assertEqual(len(journal_files(self.journal_dir)), 1) # check if a journal file was written
+
+            call_command('drain_clicks', stdout=open(os.devnull, 'w')) # replay the journal
+
+        self.assertEqual(ClickEvent.objects.count(), 2) # check if the journaled clicks were written
+        self.assertEqual(journal_files(self.journal_dir), []) # check if the journal was removed
+
+    def test_sync_mode_defers_aggregates(self):
+        """
+        Test that a 'sync' click runs only the counter UPDATE and event INSERT, and the flush adds it to the rollups and visitors
+        """
+        buffer = ClickBuffer()
+        self.addCleanup(user_agents.clear) # the interned ids are rolled back with the test
+        with self.click_logging(MODE='sync'):
+            with self.captureOnCommitCallbacks(execute=True): # run the callbacks of a committed request
+                buffer.add(ClickRecord(self.short.id, timezone.now(), "1.1.1.1", "ua")) # also interns the user agent
+            with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as captured:
+                buffer.add(ClickRecord(self.short.id, timezone.now(), "2.2.2.2", "ua"))
+            statements = [query["sql"] for query in captured if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))]
+            self.assertEqual(len(statements), 2) # check if only the counter and the event were written
+            self.assertEqual(ClickEvent.objects.count(), 2) # both clicks are in the database right away
+            self.assertFalse(ClickRollup.objects.exists()) # their rollups are not
+            self.assertEqual(buffer.pending_aggregates(), 2) # check if both wait for the flush
+
+            buffer.flush()
+        self.assertEqual(buffer.pending_aggregates(), 0)
+        self.assertEqual(sum(ClickRollup.objects.filter(granularity="hour").values_list("clicks", flat=True)), 2) # check if the flush applied the queued clicks
+        self.short.refresh_from_db()
+        self.assertEqual(self.short.clicks, 2)
+        self.assertEqual(self.short.unique_visitors, 2)
@@ -0,0 +1,126 @@
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from shortener.clicks import ClickBuffer, ClickRecord, persist_clicks
+from shortener.counters import HotLinks, bump_counter, counter_value, fold_counters, hot_links
+from shortener.models import ChangeCounter, ClickCounterShard, ClickEvent, ShortCodeSequence, ShortURL
+
+HOT_SETTINGS = {'HOT_LINKS': {'THRESHOLD': 1, 'WINDOW': 3, 'COOLDOWN': 60}} # hot after 3 clicks
+
+
+class HotLinksTest(TestCase):
+    """
+    Tests for the per-process hot link detection.
+
+    This test class verifies:
+    - A link turns hot once its click rate reaches the threshold over the window
+    - It cools down after COOLDOWN seconds without reaching the rate again
+    """
+
+    @override_settings(SHORTENER={'HOT_LINKS': {'THRESHOLD': 2, 'WINDOW': 1, 'COOLDOWN': 10}})
+    def test_threshold_and_cooldown(self):
+        """
+        Test the hot state of a link across windows
+        """
+        links = HotLinks()
+        self.assertFalse(links.hit(1, now=100.0)) # one click in the window
+        self.assertTrue(links.hit(1, now=100.5)) # two clicks in a one second window reach the rate
+        self.assertFalse(links.hit(2, now=100.6)) # other links are unaffected
+        self.assertTrue(links.hit(1, now=105.0)) # a new window, still within the cooldown
+        self.assertTrue(links.is_hot(1, now=109.0))
+        self.assertFalse(links.is_hot(1, now=111.0)) # cooled down
+
+
+class ChangeCounterTest(TestCase):
+    """
+    Tests for the change counters other processes poll (renames, domain changes, enrichment batches).
+
+    This test class verifies:
+    - A counter reads 0 until it is first bumped, then counts every bump
+    - Counters live in their own table, apart from the short code sequence
+    """
+
+    def test_bump_and_read(self):
+        """
+        Test that bumping creates the counter row once and increments it afterwards
+        """
+        self.assertEqual(counter_value("domain_changes"), 0) # no row yet
+        bump_counter("domain_changes")
+        bump_counter("domain_changes")
+        self.assertEqual(counter_value("domain_changes"), 2) # check every bump was counted
+        self.assertEqual(ChangeCounter.objects.count(), 1) # check only one row was created
+        self.assertFalse(ShortCodeSequence.objects.filter(name="domain_changes").exists()) # not a short code sequence
+
+
+@override_settings(SHORTENER=HOT_SETTINGS)
+class ShardedCounterTest(APITestCase):
+    """
+    Tests for the sharded click counters of hot links.
+
+    This test class verifies:
+    - Clicks on hot links go to counter shards instead of the ShortURL row
+    - The API adds the unfolded shard clicks to the click count
+    - Folding moves the shard clicks and the unique visitor estimate to the ShortURL row
+    - In 'sync' mode, clicks on hot links are queued instead of written in the request
+    """
+
+    def setUp(self):
+        hot_links.reset() # hot links are tracked per process
+        self.short = ShortURL.objects.create(original_url="https://viral.com") # create a dummy short URL
+
+    def tearDown(self):
+        hot_links.reset()
+
+    def make_hot(self):
+        for _ in range(3):
+            hot_links.hit(self.short.id)
+
+    def test_hot_clicks_go_to_shards(self):
+        """
+        Test that a batch for a hot link leaves the ShortURL row alone and is counted in the API
+        """
+        self.make_hot()
+        records = [ClickRecord(self.short.id, timezone.now(), f"10.0.0.{i}", "ua") for i in range(5)]
+        with CaptureQueriesContext(connection) as captured:
+            persist_clicks(records)
+        self.assertFalse(any(query["sql"].startswith('UPDATE "shortener_shorturl"') for query in captured)) # check the hot row was not locked
+        self.assertEqual(ClickCounterShard.objects.aggregate(total=Sum("clicks"))["total"], 5) # check the shards
+        self.assertEqual(ClickEvent.objects.count(), 5) # events are written as usual
+
+        response = self.client.get(reverse("shorturl-detail", args=[self.short.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK) # check if status 200 OK
+        self.assertEqual(response.data["clicks"], 5) # check the shards are summed on read
+
+    def test_fold_moves_shards_to_the_row(self):
+        """
+        Test that folding adds the shard clicks to ShortURL.clicks and empties the shards
+        """
+        self.make_hot()
+        persist_clicks([ClickRecord(self.short.id, timezone.now(), f"10.0.0.{i}", "ua") for i in range(4)])
+        persist_clicks([ClickRecord(self.short.id, timezone.now(), "10.0.0.9", "ua")])
+
+        self.assertEqual(fold_counters(), 1) # check one link was folded
+        self.short.refresh_from_db()
+        self.assertEqual(self.short.clicks, 5) # check the clicks moved to the row
+        self.assertEqual(self.short.unique_visitors, 5) # check the estimate was refreshed from the sketch
+        self.assertEqual(ClickCounterShard.objects.aggregate(total=Sum("clicks"))["total"], 0) # check the shards are empty
+        response = self.client.get(reverse("shorturl-detail", args=[self.short.id]))
+        self.assertEqual(response.data["clicks"], 5) # check nothing is counted twice
+
+    def test_sync_mode_queues_hot_clicks(self):
+        """
+        Test that once a link is hot, 'sync' mode stops writing its clicks in the request
+        """
+        buffer = ClickBuffer()
+        with override_settings(SHORTENER={**HOT_SETTINGS, 'CLICK_LOGGING': {'MODE': 'sync', 'FLUSH_INTERVAL': None}}):
+            for i in range(4):
+                buffer.add(ClickRecord(self.short.id, timezone.now(), "1.1.1.1", "ua"))
+            self.assertEqual(ClickEvent.objects.count(), 2) # written in the request until the link turned hot
+            self.assertEqual(buffer.pending(), 2) # check the hot clicks are queued
+            buffer.flush()
+        self.assertEqual(ClickEvent.objects.count(), 4)
@@ -0,0 +1,29 @@
+from django.test import SimpleTestCase
+from shortener.cursors import IdCursor
+
+
+class IdCursorTest(SimpleTestCase):
+    """
+    Tests for the id cursor of the catch-up reads.
+
+    This test class verifies:
+    - The cursor moves past the highest id read
+    - Ids skipped over are read again until they show up or the margin runs out
+    """
+
+    def test_gaps_are_retried(self):
+        """
+        Test that an id committed after higher ids is still read by a later catch-up
+        """
+        cursor = IdCursor()
+        cursor.advance([1, 2, 4, 5], margin=60, now=100.0)
+        self.assertEqual(cursor.last_id, 5) # check the cursor moved past the highest id
+        self.assertEqual(cursor.gaps(), [3]) # check the skipped id is remembered
+
+        cursor.advance([3, 6], margin=60, now=110.0) # the slow transaction committed
+        self.assertEqual((cursor.last_id, cursor.gaps()), (6, []))
+
+        cursor.advance([8], margin=60, now=120.0)
+        self.assertEqual(cursor.gaps(), [7])
+        cursor.advance([], margin=60, now=181.0) # rolled back, given up after the margin
+        self.assertEqual(cursor.gaps(), [])
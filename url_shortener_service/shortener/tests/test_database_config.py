@@ -0,0 +1,64 @@
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from url_shortener.database import database_config
+
+
+class DatabaseConfigTest(SimpleTestCase):
+    """
+    Tests for the DATABASES settings built from the SHORTENER_DB_* environment variables.
+
+    This test class verifies:
+    - SQLite defaults to persistent, health checked connections with the WAL pragmas
+    - Per-request connections and SQLite's own defaults can be chosen
+    - PostgreSQL pools connections instead of keeping them, and pooling needs PostgreSQL
+    """
+
+    def test_sqlite_defaults(self):
+        """
+        Test the configuration without any variable set
+        """
+        config = database_config("/srv/app", {})
+        self.assertEqual(config["NAME"], "/srv/app/db.sqlite3")
+        self.assertEqual((config["CONN_MAX_AGE"], config["CONN_HEALTH_CHECKS"]), (600, True)) # check connections are reused
+        self.assertIn("PRAGMA journal_mode=WAL", config["OPTIONS"]["init_command"])
+        self.assertIn("PRAGMA mmap_size=268435456", config["OPTIONS"]["init_command"])
+
+        config = database_config("/srv/app", {"SHORTENER_DB_CONNECTIONS": "per-request", "SHORTENER_SQLITE_PRAGMAS": "0"})
+        self.assertEqual((config["CONN_MAX_AGE"], config["CONN_HEALTH_CHECKS"]), (0, False))
+        self.assertNotIn("init_command", config["OPTIONS"]) # check SQLite's defaults are kept
+
+    def test_postgresql_pool(self):
+        """
+        Test that the pool mode configures psycopg's pool with non-persistent connections
+        """
+        config = database_config("/srv/app", {"SHORTENER_DB_ENGINE": "postgresql", "SHORTENER_DB_CONNECTIONS": "pool",
+                                              "SHORTENER_DB_NAME": "links", "SHORTENER_DB_POOL_MAX_SIZE": "20"})
+        self.assertEqual(config["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(config["NAME"], "links")
+        self.assertEqual(config["CONN_MAX_AGE"], 0) # Django refuses persistent pooled connections
+        self.assertEqual(config["OPTIONS"]["pool"], {"min_size": 2, "max_size": 20, "timeout": 10})
+        self.assertEqual(database_config("/srv/app", {"SHORTENER_DB_ENGINE": "postgresql", "SHORTENER_DB_CONN_MAX_AGE": "none"})["CONN_MAX_AGE"], None)
+
+        with self.assertRaises(ValueError): # check SQLite cannot be pooled
+            database_config("/srv/app", {"SHORTENER_DB_CONNECTIONS": "pool"})
+        with self.assertRaises(ValueError):
+            database_config("/srv/app", {"SHORTENER_DB_ENGINE": "mysql"})
+
+
+class SqlitePragmaTest(TestCase):
+    """
+    Tests for the pragmas applied to the project's SQLite connections.
+
+    This test class verifies:
+    - New connections run the configured pragmas
+    """
+
+    def test_pragmas_applied(self):
+        """
+        Test that the connection uses synchronous=NORMAL and takes the write lock when a transaction starts
+        """
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            self.assertEqual(cursor.execute("PRAGMA synchronous").fetchone()[0], 1) # 1 = NORMAL
+            self.assertEqual(connection.transaction_mode, "IMMEDIATE")
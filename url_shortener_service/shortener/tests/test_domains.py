@@ -0,0 +1,178 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from shortener.cache import resolution_cache
+from shortener.clicks import click_buffer
+from shortener.domains import DomainRouter, domain_router, routing_key
+from shortener.models import Domain, ShortURL
+
+User = get_user_model()
+
+
+class DomainRoutingTest(TestCase):
+    """
+    Tests for redirects on custom domains.
+
+    This test class verifies:
+    - The same short code can exist once per domain, and each host only resolves its own codes
+    - A redirect on a custom domain costs the same queries as on the default host
+    - Domains added or deactivated by another process are picked up at its next refresh, and inactive hosts redirect nothing
+    """
+
+    def setUp(self):
+        domain_router.clear()
+        resolution_cache.clear()
+        self.brand = Domain.objects.create(hostname="Go.Brand.COM") # create a dummy domain
+        self.other = Domain.objects.create(hostname="links.other.org")
+        ShortURL.objects.create(original_url="https://default.com", short_code="promo")
+        ShortURL.objects.create(original_url="https://brand.com/sale", short_code="promo", domain=self.brand)
+        ShortURL.objects.create(original_url="https://other.org", short_code="only", domain=self.other)
+
+    def tearDown(self):
+        domain_router.clear()
+
+    def test_codes_per_host(self):
+        """
+        Test that a code resolves on the host it was created for
+        """
+        self.assertEqual(self.brand.hostname, "go.brand.com") # check the host name was normalized
+        response = self.client.get("/r/promo/", HTTP_HOST="go.brand.com:443")
+        self.assertEqual(response["Location"], "https://brand.com/sale")
+        self.assertEqual(self.client.get("/r/promo/")["Location"], "https://default.com") # default host
+        self.assertEqual(self.client.get("/r/promo/", HTTP_HOST="unknown.example")["Location"], "https://default.com")
+        self.assertEqual(self.client.get("/r/only/", HTTP_HOST="go.brand.com").status_code, status.HTTP_404_NOT_FOUND) # another domain's code
+        self.assertEqual(self.client.get("/r/only/").status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get("/r/only/", HTTP_HOST="links.other.org").status_code, status.HTTP_302_FOUND)
+
+    @override_settings(SHORTENER={"CLICK_LOGGING": {"MODE": "memory", "FLUSH_INTERVAL": None}})
+    def test_no_extra_queries(self):
+        """
+        Test that once the domain map is loaded, a custom domain redirect queries like a default host one
+        """
+        domain_router.refresh()
+        with self.assertNumQueries(1): # the database lookup of the code, nothing for the host
+            self.client.get("/r/promo/", HTTP_HOST="go.brand.com")
+        with self.assertNumQueries(1):
+            self.client.get("/r/promo/")
+        with self.assertNumQueries(0): # check both are cached under their own key
+            self.assertEqual(self.client.get("/r/promo/", HTTP_HOST="go.brand.com")["Location"], "https://brand.com/sale")
+            self.assertEqual(self.client.get("/r/promo/")["Location"], "https://default.com")
+        click_buffer.flush() # write the queued clicks while the test database exists
+
+    @override_settings(SHORTENER={"DOMAINS": {"REFRESH_INTERVAL": 0}})
+    def test_other_process_refresh(self):
+        """
+        Test that a domain router of another process follows the change counter
+        """
+        other = DomainRouter() # the domain map of another worker process
+        self.assertEqual(other.get("go.brand.com").id, self.brand.pk)
+        self.assertIsNone(other.get("new.brand.com"))
+
+        Domain.objects.create(hostname="new.brand.com")
+        self.brand.is_active = False
+        self.brand.save()
+        self.assertIsNotNone(other.get("new.brand.com")) # check the new domain routes
+        self.assertFalse(other.get("go.brand.com").is_active) # and the inactive one is known as such
+        self.assertEqual(other.hostname(self.brand.pk), "go.brand.com") # its links still show their host name
+        response = self.client.get("/r/promo/", HTTP_HOST="go.brand.com")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND) # check it does not fall back to the default host's code
+        self.assertEqual(self.client.get("/r/promo/", HTTP_HOST="new.brand.com").status_code, status.HTTP_404_NOT_FOUND) # an empty domain
+
+
+class DomainLinkApiTest(APITestCase):
+    """
+    Tests for creating links on custom domains through the API.
+
+    This test class verifies:
+    - Links are created on the user's own domains, with short links on that host
+    - Codes only have to be unique on their domain, in single and bulk creates
+    - Domains of other users and unknown domains are refused
+    - Any custom code of up to 10 characters is accepted, and the routing keys of two hosts never overlap
+    """
+
+    def setUp(self):
+        domain_router.clear()
+        self.user = User.objects.create_user(username="brand", password="brandpass123") # create a dummy user
+        self.stranger = User.objects.create_user(username="stranger", password="strangerpass123")
+        self.domain = Domain.objects.create(hostname="go.brand.com", user=self.user)
+        Domain.objects.create(hostname="go.stranger.com", user=self.stranger)
+        ShortURL.objects.create(original_url="https://default.com", short_code="sale")
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        domain_router.clear()
+
+    def test_create_on_domain(self):
+        """
+        Test that a taken default host code can be reused on a domain, once
+        """
+        url = reverse("shorturl-list")
+        response = self.client.post(url, {"original_url": "https://brand.com", "short_code": "sale", "domain": "go.brand.com"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED) # check if status 201 created
+        self.assertEqual(response.data["domain"], "go.brand.com")
+        self.assertEqual(response.data["short_link"], "http://go.brand.com/r/sale/") # check the link is on the domain
+        self.assertEqual(ShortURL.objects.get(pk=response.data["id"]).domain, self.domain)
+
+        response = self.client.post(url, {"original_url": "https://brand.com/2", "short_code": "sale", "domain": "go.brand.com"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST) # check the code is taken on the domain now
+        self.assertIn("short_code", response.data)
+
+        listed = self.client.get(reverse("user_urls")).data["results"]
+        self.assertEqual([(row["domain"], row["short_link"]) for row in listed], [("go.brand.com", "http://go.brand.com/r/sale/")])
+
+    def test_foreign_and_unknown_domains(self):
+        """
+        Test that links cannot be created on another user's domain, an unregistered one or an inactive one
+        """
+        url = reverse("shorturl-list")
+        for hostname in ("go.stranger.com", "nowhere.com"):
+            response = self.client.post(url, {"original_url": "https://brand.com", "domain": hostname}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("domain", response.data)
+
+        self.domain.is_active = False
+        self.domain.save()
+        response = self.client.post(url, {"original_url": "https://brand.com", "domain": "go.brand.com"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST) # check an inactive domain takes no new links
+        self.assertIn("no longer active", str(response.data["domain"]))
+
+    def test_bulk_on_domain(self):
+        """
+        Test that bulk creates check codes per domain, including within the batch
+        """
+        items = [
+            {"original_url": "https://a.com", "short_code": "sale", "domain": "go.brand.com"},
+            {"original_url": "https://b.com", "short_code": "sale"}, # taken on the default host
+            {"original_url": "https://c.com", "short_code": "sale", "domain": "go.brand.com"}, # taken earlier in the batch
+            {"original_url": "https://d.com", "domain": "go.stranger.com"},
+        ]
+        response = self.client.post(reverse("shorturl-bulk"), items, format="json")
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        rows = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([row["status"] for row in rows], ["created", "error", "error", "error"])
+        self.assertEqual(rows[0]["short_link"], "http://go.brand.com/r/sale/")
+        self.assertIn("domain", rows[3]["errors"])
+        self.assertEqual(self.client.get("/r/sale/", HTTP_HOST="go.brand.com")["Location"], "https://a.com") # check it redirects right away
+
+    def test_codes_cannot_reach_another_namespace(self):
+        """
+        Test that free-form codes are accepted by both entry points and keep to their own host's keys
+        """
+        domain_link = self.client.post(reverse("shorturl-list"), {"original_url": "https://brand.com", "short_code": "sale", "domain": "go.brand.com"}, format="json")
+        code = f"{self.domain.pk}/sale" # would have been the key of "sale" on the domain without the default host prefix
+        response = self.client.post(reverse("shorturl-list"), {"original_url": "https://evil.com", "short_code": code}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(routing_key(None, code), routing_key(self.domain.pk, "sale")) # check the keys differ
+        self.assertEqual(resolution_cache.resolve("sale", self.domain.pk).id, domain_link.data["id"]) # check the domain's link is not shadowed
+        self.assertEqual(resolution_cache.resolve(code).original_url, "https://evil.com")
+
+        response = self.client.post(reverse("shorturl-bulk"), [{"original_url": "https://a.com", "short_code": "q3_promo"}, {"original_url": "https://b.com", "short_code": "sale-2024"}], format="json")
+        self.assertEqual([row["status"] for row in json.loads(b"".join(response.streaming_content))], ["created", "created"])
+        item = {"original_url": "https://c.com", "short_code": "elevenchars"} # check both entry points limit codes to the column size
+        self.assertIn("short_code", self.client.post(reverse("shorturl-list"), item, format="json").data)
+        response = self.client.post(reverse("shorturl-bulk"), [item], format="json")
+        self.assertIn("short_code", json.loads(b"".join(response.streaming_content))[0]["errors"])
@@ -88,14 +88,14 @@ class ShortURLEdgeCaseTests(APITestCase):
         payload = {
             "clicks": 999,
             "created_at": timezone.now().isoformat(),
-            "short_code": "updatedcode"
+            "short_code": "updatedcd"  # the model holds 10 characters at most
         }
 
         response = self.client.patch(url_detail, payload, format="json") # send a PATCH request to update the short URL
         self.assertEqual(response.status_code, status.HTTP_200_OK) # check if status 200 OK
 
         shorturl.refresh_from_db() # Refresh the short URL instance from the database
-        self.assertEqual(shorturl.short_code, "updatedcode")  # updating short code should be allowed
+        self.assertEqual(shorturl.short_code, "updatedcd")  # updating short code should be allowed
         self.assertNotEqual(shorturl.clicks, 999)  # updating clicks should not change
         self.assertEqual(shorturl.clicks, 0) # Should remain unchanged
         self.assertEqual(shorturl.created_at, original_created_at)  # Should remain unchanged
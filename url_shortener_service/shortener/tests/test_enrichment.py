@@ -0,0 +1,166 @@
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from shortener.clicks import ClickBuffer, ClickRecord, persist_clicks
+from shortener.enrichment import IPRangeTable, UNKNOWN_DEVICE, enrich_pending, parse_user_agent
+from shortener.interning import user_agents
+from shortener.models import ClickEvent, ClickRollup, Device, ShortURL
+
+CHROME_WINDOWS = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+SAFARI_IPHONE = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1"
+GOOGLEBOT = "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"
+
+
+class ParserTest(SimpleTestCase):
+    """
+    Tests for the user agent parser and the IP range table.
+
+    This test class verifies:
+    - User agents are reduced to browser, OS and device type, and parsed once per string
+    - Addresses inside a range map to its country, others to ''
+    - The build_ip_table command reads integer and dotted address ranges
+    """
+
+    def test_parse_user_agent(self):
+        """
+        Test the browser, OS and device type of common user agents
+        """
+        self.assertEqual(tuple(parse_user_agent(CHROME_WINDOWS)), ("Chrome", "Windows", "desktop"))
+        self.assertEqual(tuple(parse_user_agent(SAFARI_IPHONE)), ("Safari", "iOS", "mobile"))
+        self.assertEqual(parse_user_agent(GOOGLEBOT).device_type, "bot")
+        self.assertEqual(parse_user_agent(""), UNKNOWN_DEVICE) # no User-Agent header
+
+        hits = parse_user_agent.cache_info().hits
+        parse_user_agent(CHROME_WINDOWS)
+        self.assertEqual(parse_user_agent.cache_info().hits, hits + 1) # check the memoized result is reused
+
+    def test_ip_range_lookup(self):
+        """
+        Test lookups inside, between and outside the ranges, for IPv4 and IPv6
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ip.bin")
+            IPRangeTable.write([("10.0.0.0", "10.0.0.255", "fr"), ("1.0.0.0", "1.0.0.255", "AU"), ("2001:db8::", "2001:db8::ffff", "DE")], path)
+            table = IPRangeTable(path)
+            self.assertEqual(table.lookup("10.0.0.7"), "FR") # ranges are sorted on write, codes upper-cased
+            self.assertEqual(table.lookup("1.0.0.0"), "AU") # first address of a range
+            self.assertEqual(table.lookup("2001:db8::1"), "DE")
+            self.assertEqual(table.lookup("10.0.1.0"), "") # after the last IPv4 range
+            self.assertEqual(table.lookup("0.0.0.1"), "") # before the first range
+            self.assertEqual(table.lookup("not an ip"), "")
+            table.close()
+
+    def test_build_ip_table_command(self):
+        """
+        Test that the command converts a CSV with integer and dotted addresses, skipping the header
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path, output = os.path.join(directory, "ranges.csv"), os.path.join(directory, "ip.bin")
+            with open(csv_path, "w") as handle:
+                handle.write("ip_from,ip_to,country_code\n16777216,16777471,AU\n8.8.8.0,8.8.8.255,US\n9.9.9.0,9.9.9.255,-\n")
+            out = io.StringIO()
+            call_command("build_ip_table", csv_path, output=output, stdout=out)
+            self.assertIn("Wrote 2 IP ranges", out.getvalue()) # the header and the '-' row are skipped
+            table = IPRangeTable(output)
+            self.assertEqual((table.lookup("1.0.0.1"), table.lookup("8.8.8.8")), ("AU", "US"))
+            table.close()
+
+
+class ClickEnrichmentTest(APITestCase):
+    """
+    Tests for the click enrichment stage.
+
+    This test class verifies:
+    - New click events get a shared Device row and the country of their IP address
+    - The countries and devices are added to the rollups served by the stats endpoint
+    - Events are enriched once, so running the stage again changes nothing
+    - Events enriched before the flush of their 'sync' clicks keep their dimensions in the rollups
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ip_table = os.path.join(self.directory.name, "ip.bin")
+        IPRangeTable.write([("1.1.1.0", "1.1.1.255", "AU"), ("8.8.8.0", "8.8.8.255", "US")], self.ip_table)
+        self.user = get_user_model().objects.create_user(username="enricher", password="enrichpass123") # create a dummy user
+        self.short = ShortURL.objects.create(original_url="https://enrich.com", user=self.user) # create a dummy short URL
+        self.hour = datetime(2025, 3, 1, 10, tzinfo=dt_timezone.utc)
+        persist_clicks([
+            ClickRecord(self.short.id, self.hour, "1.1.1.1", CHROME_WINDOWS),
+            ClickRecord(self.short.id, self.hour + timedelta(minutes=5), "8.8.8.8", SAFARI_IPHONE),
+            ClickRecord(self.short.id, self.hour + timedelta(minutes=9), "8.8.8.9", SAFARI_IPHONE),
+            ClickRecord(self.short.id, self.hour + timedelta(minutes=12), "192.168.0.1", ""), # no country, no user agent
+        ])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def enrich(self, **kwargs):
+        with override_settings(SHORTENER={"ENRICHMENT": {"IP_TABLE": self.ip_table}}):
+            return enrich_pending(**kwargs)
+
+    def test_events_are_enriched(self):
+        """
+        Test that every event gets a device and a country, with one Device row per distinct device
+        """
+        self.assertEqual(self.enrich(batch_size=3), 4) # two batches
+        events = ClickEvent.objects.select_related("device").order_by("clicked_at")
+        self.assertEqual([event.country for event in events], ["AU", "US", "US", ""]) # check the countries
+        self.assertEqual([event.device.device_type for event in events], ["desktop", "mobile", "mobile", "unknown"])
+        self.assertEqual(Device.objects.count(), 3) # the two iPhone clicks share their Device row
+
+    def test_stats_include_dimensions(self):
+        """
+        Test that the stats endpoint reports countries, browsers, OSes and device types per bucket
+        """
+        self.enrich()
+        self.client.force_authenticate(self.user) # stats are only served to the owner
+        response = self.client.get(reverse("shorturl-stats", args=[self.short.id]), {"granularity": "hour", "from": "2025-03-01T10:00:00Z", "to": "2025-03-01T11:00:00Z"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK) # check if status 200 OK
+        bucket = response.data["buckets"][0]
+        self.assertEqual(bucket["top_countries"], [("US", 2), ("AU", 1)]) # most frequent first
+        self.assertEqual(bucket["top_browsers"][0], ("Safari", 2))
+        self.assertEqual(dict(bucket["device_types"]), {"mobile": 2, "desktop": 1, "unknown": 1})
+
+    def test_enrichment_runs_once(self):
+        """
+        Test that a second run finds nothing to do and leaves the rollups unchanged
+        """
+        self.enrich()
+        self.assertEqual(self.enrich(), 0) # check nothing is left
+        day = ClickRollup.objects.get(short_url=self.short, granularity="day")
+        self.assertEqual(day.top_os, {"iOS": 2, "Windows": 1, "Other": 1}) # check the counts were added once
+
+    def test_enrichment_before_sync_flush(self):
+        """
+        Test that enriching 'sync' clicks whose rollups wait for the flush creates their buckets, and the flush then adds the clicks
+        """
+        buffer = ClickBuffer()
+        self.addCleanup(user_agents.clear) # the interned ids are rolled back with the test
+        other = ShortURL.objects.create(original_url="https://enrich-sync.com", user=self.user)
+        config = {"ENRICHMENT": {"IP_TABLE": self.ip_table}, "CLICK_LOGGING": {"MODE": "sync", "FLUSH_INTERVAL": None, "BATCH_SIZE": 100}}
+        with override_settings(SHORTENER=config):
+            with self.captureOnCommitCallbacks(execute=True): # run the callbacks of a committed request
+                buffer.add(ClickRecord(other.id, self.hour, "1.1.1.1", CHROME_WINDOWS))
+                buffer.add(ClickRecord(other.id, self.hour + timedelta(minutes=3), "8.8.8.8", SAFARI_IPHONE))
+            self.assertEqual(buffer.pending_aggregates(), 2) # check the rollups wait for the flush
+            self.assertFalse(ClickRollup.objects.filter(short_url=other).exists())
+
+            self.assertEqual(enrich_pending(), 6) # the four setUp events and the two 'sync' clicks
+            hour = ClickRollup.objects.get(short_url=other, granularity="hour")
+            self.assertEqual(hour.clicks, 0) # check the enricher created the bucket
+            self.assertEqual(hour.top_countries, {"AU": 1, "US": 1})
+
+            buffer.flush()
+        for granularity in ("hour", "day"):
+            rollup = ClickRollup.objects.get(short_url=other, granularity=granularity)
+            self.assertEqual(rollup.clicks, 2) # check the flush added the clicks to the same bucket
+            self.assertEqual(rollup.device_types, {"desktop": 1, "mobile": 1}) # check the dimensions were kept
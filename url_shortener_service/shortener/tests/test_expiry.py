@@ -0,0 +1,86 @@
+import io
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from shortener.cache import resolution_cache
+from shortener.expiry import sweep_expired
+from shortener.models import ShortURL
+from shortener.tests.test_query_plans import full_scans, query_plan
+
+
+class ExpirySweepTest(TestCase):
+    """
+    Tests for the expired link sweeper and the cache tombstones of expired codes.
+
+    This test class verifies:
+    - The sweep deactivates only expired links, in batches, through the expiration index
+    - Swept codes keep answering 410 from the cache, without a database lookup
+    - Cached mappings that expire while cached turn into tombstones without the destination URL
+    - The sweep_expired command and its dry run
+    """
+
+    def setUp(self):
+        resolution_cache.clear() # start every test with an empty cache
+        past = timezone.now() - timedelta(hours=1)
+        self.expired = [ShortURL.objects.create(original_url=f"https://old{i}.com", expiration_date=past) for i in range(3)] # expired links
+        self.live = ShortURL.objects.create(original_url="https://live.com", expiration_date=timezone.now() + timedelta(days=1)) # not expired yet
+        self.forever = ShortURL.objects.create(original_url="https://forever.com") # no expiration date
+
+    def test_sweep_deactivates_expired_links(self):
+        """
+        Test that only expired links are deactivated, whatever the batch size
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_expired(batch_size=2), 3) # check the number of swept links
+        self.assertEqual(set(ShortURL.objects.filter(is_active=False)), set(self.expired)) # check which links were deactivated
+        self.assertEqual(sweep_expired(), 0) # check if a second sweep finds nothing
+
+    def test_swept_codes_answer_from_cache(self):
+        """
+        Test that a swept code is answered with 410 Gone from its tombstone
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            sweep_expired()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse("redirect", args=[self.expired[0].short_code]))
+        self.assertEqual(response.status_code, status.HTTP_410_GONE) # check if still reported as expired
+        self.assertEqual([query["sql"] for query in captured if '"shortener_shorturl"' in query["sql"]], []) # check if no lookup ran
+
+    def test_cached_mapping_becomes_tombstone(self):
+        """
+        Test that an expired mapping is cached without its destination and a live one is cached in full
+        """
+        resolution_cache.resolve(self.expired[0].short_code)
+        self.assertEqual(resolution_cache.shared.get(self.expired[0].routing_key).original_url, "") # check the tombstone
+
+        cached = resolution_cache.resolve(self.live.short_code)
+        self.assertEqual(cached.original_url, "https://live.com") # check if live mappings keep their destination
+        expiring = cached._replace(expiration_date=timezone.now() - timedelta(seconds=1)) # the same mapping, once its expiration date passed
+        resolution_cache.local.set(self.live.routing_key, expiring, 30)
+        self.assertEqual(resolution_cache.resolve(self.live.short_code).original_url, "") # check if it was buried on read
+        self.assertEqual(resolution_cache.shared.get(self.live.routing_key).original_url, "") # check if the shared tier has the tombstone too
+
+    def test_sweep_query_uses_index(self):
+        """
+        Test that the sweep query reads the partial expiration index
+        """
+        queryset = ShortURL.objects.filter(is_active=True, expiration_date__lte=timezone.now()).order_by('expiration_date').values_list('id')[:10]
+        self.assertEqual(full_scans(query_plan(*queryset.query.sql_with_params())), []) # check if no full scan or sort
+
+    def test_command(self):
+        """
+        Test the sweep_expired command and its dry run
+        """
+        output = io.StringIO()
+        call_command("sweep_expired", "--dry-run", stdout=output)
+        self.assertIn("Would deactivate 3", output.getvalue()) # check the report
+        self.assertFalse(ShortURL.objects.filter(is_active=False).exists()) # check if nothing changed
+
+        call_command("sweep_expired", stdout=output)
+        self.assertEqual(ShortURL.objects.filter(is_active=False).count(), 3) # check if the expired links were swept
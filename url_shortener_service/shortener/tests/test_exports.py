@@ -0,0 +1,98 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from shortener.clicks import ClickRecord, persist_clicks
+from shortener.models import ShortURL
+
+User = get_user_model()
+
+
+class ExportTest(APITestCase):
+    """
+    Tests for the streaming CSV/NDJSON export endpoints.
+
+    This test class verifies:
+    - A user's links are exported as CSV, with their own links only
+    - A link's click history is exported as NDJSON, optionally gzipped and limited to a time range
+    - Exports are streamed, however many rows there are
+    - Click histories are only exported to the owner of the link (never for anonymous links), and invalid options return 400
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="exporter", password="exportpass123") # create a dummy user
+        refresh = RefreshToken.for_user(self.user) # create a refresh token for the user
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(refresh.access_token)) # authenticate as the dummy user
+        self.links = [ShortURL.objects.create(original_url=f"https://export{i}.com", user=self.user) for i in range(3)]
+        ShortURL.objects.create(original_url="https://someone-else.com") # not part of the user's export
+        self.start = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+        persist_clicks([ClickRecord(self.links[0].id, self.start + timedelta(hours=i), f"10.0.0.{i}", "ua", None) for i in range(5)])
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_links_csv(self):
+        """
+        Test that the links export lists every link of the user with a header row
+        """
+        response = self.client.get(reverse("shorturl-export"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK) # check if status 200 OK
+        self.assertTrue(response.streaming) # check the response is streamed
+        self.assertIn('filename="links.csv"', response["Content-Disposition"])
+        rows = list(csv.DictReader(io.StringIO(self.content(response).decode())))
+        self.assertEqual([row["short_code"] for row in rows], [link.short_code for link in self.links]) # only the user's links
+        self.assertEqual(rows[0]["clicks"], "5") # check the counters
+
+    def test_clicks_ndjson_gzip(self):
+        """
+        Test that the click history is exported as gzipped NDJSON, limited to the requested range
+        """
+        url = reverse("shorturl-export-clicks", args=[self.links[0].id])
+        response = self.client.get(url, {"type": "ndjson", "compression": "gzip", "from": "2025-03-01T01:00:00Z", "to": "2025-03-01T04:00:00Z"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK) # check if status 200 OK
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        rows = [json.loads(line) for line in gzip.decompress(self.content(response)).decode().splitlines()]
+        self.assertEqual([row["ip_address"] for row in rows], ["10.0.0.1", "10.0.0.2", "10.0.0.3"]) # check the range, oldest first
+        self.assertEqual(rows[0]["user_agent"], "ua") # check the interned user agent is exported as text
+
+    @override_settings(SHORTENER={"EXPORTS": {"CHUNK_SIZE": 2, "BUFFER_SIZE": 1}})
+    def test_streamed_in_chunks(self):
+        """
+        Test that small chunk and buffer sizes still export every row, one chunk per row
+        """
+        response = self.client.get(reverse("shorturl-export-clicks", args=[self.links[0].id]))
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 6) # header and five rows, each sent on its own
+        self.assertEqual(len(b"".join(chunks).decode().splitlines()), 6)
+
+    def test_owner_only_and_invalid_options(self):
+        """
+        Test that other users cannot export a link's clicks and invalid options are rejected
+        """
+        other = User.objects.create_user(username="other", password="otherpass123")
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(RefreshToken.for_user(other).access_token))
+        response = self.client.get(reverse("shorturl-export-clicks", args=[self.links[0].id]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN) # not the owner
+        anonymous_link = ShortURL.objects.get(original_url="https://someone-else.com") # shortened without an account
+        response = self.client.get(reverse("shorturl-export-clicks", args=[anonymous_link.id]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN) # check a link without an owner is not everyone's
+
+        self.client.credentials() # no user at all
+        response = self.client.get(reverse("shorturl-export-clicks", args=[anonymous_link.id]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED) # check anonymous users are refused too
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(RefreshToken.for_user(other).access_token))
+
+        response = self.client.get(reverse("shorturl-export"), {"type": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST) # unknown type
+        self.client.credentials() # remove the auth header
+        response = self.client.get(reverse("shorturl-export"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED) # the export needs a user
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from rest_framework.test import APITestCase
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from shortener.cache import resolution_cache
+from shortener.models import ShortURL, ClickEvent
+
+
+class RedirectFastPathTest(APITestCase):
+    """
+    Tests for the redirect fast path middleware.
+
+    This test class verifies:
+    - Redirects are answered after the security middleware and before the session, CSRF and authentication middleware run
+    - Invalid bearer tokens do not affect redirects on the fast path
+    - Clicks are still logged, and 404/410 keep their JSON detail bodies
+    - Other requests and disabled fast paths go through the regular stack
+    """
+
+    def setUp(self):
+        resolution_cache.clear() # start every test with an empty cache
+        self.short = ShortURL.objects.create(original_url="https://fast.com") # create a dummy short URL
+        self.redirect_url = reverse("redirect", args=[self.short.short_code]) # reverse the redirect URL
+
+    def test_skips_middleware_stack(self):
+        """
+        Test that the redirect is served without the authentication middleware and still logs the click
+        """
+        response = self.client.get(self.redirect_url, HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND) # check if status 302 Found
+        self.assertEqual(response["Location"], "https://fast.com") # check if redirecting to the original URL
+        self.assertFalse(hasattr(response.wsgi_request, "user")) # check if AuthenticationMiddleware never ran
+        self.assertNotIn("Set-Cookie", response) # check if no session or CSRF cookie was set
+        self.assertEqual(response["X-Content-Type-Options"], "nosniff") # check if SecurityMiddleware still ran
+        self.assertEqual(ClickEvent.objects.filter(short_url=self.short).count(), 1) # check if the click was logged
+
+    def test_error_responses(self):
+        """
+        Test the JSON bodies of the 404 and 410 responses
+        """
+        expired = ShortURL.objects.create(original_url="https://old.com", expiration_date=timezone.now() - timedelta(days=1))
+        response = self.client.get(reverse("redirect", args=["missing"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND) # check unknown code
+        self.assertIn("detail", response.json())
+        response = self.client.get(reverse("redirect", args=[expired.short_code]))
+        self.assertEqual(response.status_code, status.HTTP_410_GONE) # check expired link
+        self.assertEqual(response.json(), {"detail": "URL has expired."})
+
+    def test_other_requests_pass_through(self):
+        """
+        Test that non-redirect paths and a disabled fast path use the regular stack
+        """
+        response = self.client.get(reverse("shorturl-list"))
+        self.assertTrue(hasattr(response.wsgi_request, "user")) # check if the full stack ran
+
+        with override_settings(SHORTENER={'REDIRECTS': {'FAST_PATH': False}}):
+            response = self.client.get(self.redirect_url, HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED) # check if the DRF view authenticated the request
+
+        with override_settings(SHORTENER={'REDIRECTS': {'FAST_PATH': False}}):
+            response = self.client.get(reverse("redirect", args=["missing"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND) # check if the view answers like the fast path
+        self.assertIn("detail", response.json())
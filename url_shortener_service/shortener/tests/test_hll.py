@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from shortener.clicks import ClickRecord, persist_clicks
+from shortener.hll import HyperLogLog
+from rest_framework_simplejwt.tokens import RefreshToken
+from shortener.models import ShortURL, VisitorSketch
+
+User = get_user_model()
+
+
+class HyperLogLogTest(TestCase):
+    """
+    Unit tests for the HyperLogLog sketch.
+
+    This test class verifies:
+    - Estimates stay within a few standard errors of the true cardinality
+    - Merging two sketches estimates the size of the union
+    - Serialization round-trips and keeps the size fixed
+    """
+
+    def test_estimate_is_within_error_bound(self):
+        """
+        Test that 20,000 distinct values are estimated within 4 standard errors
+        """
+        sketch = HyperLogLog(12)
+        for i in range(20000):
+            sketch.add(f"10.0.{i}")
+        self.assertLess(abs(sketch.count() - 20000) / 20000, 4 * sketch.relative_error) # check the error bound
+
+    def test_merge_estimates_union(self):
+        """
+        Test that merging sketches with overlapping values counts the overlap once
+        """
+        first, second = HyperLogLog(10), HyperLogLog(10)
+        for i in range(300):
+            first.add(i)
+            second.add(i + 150) # 150 values overlap
+        self.assertAlmostEqual(first.merge(second).count(), 450, delta=450 * 4 * first.relative_error) # check the union
+
+    def test_serialization_round_trip(self):
+        """
+        Test that to_bytes/from_bytes keeps the registers and uses 2**p + 1 bytes
+        """
+        sketch = HyperLogLog(10)
+        sketch.add("1.1.1.1")
+        data = sketch.to_bytes()
+        self.assertEqual(len(data), 1025) # check the fixed size
+        self.assertEqual(HyperLogLog.from_bytes(data).count(), 1) # check the round trip
+
+
+class UniqueVisitorsTest(TestCase):
+    """
+    Tests for per-link unique visitor tracking.
+
+    This test class verifies:
+    - Written clicks update the link's sketch and its unique_visitors estimate
+    - The serializer and the stats endpoint expose the estimate with its error bound
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="visitors", password="visitorspass123") # create a dummy user
+        self.short = ShortURL.objects.create(original_url="https://visitors.com", user=self.user) # create a dummy short URL
+        self.moment = datetime(2025, 3, 1, 10, tzinfo=dt_timezone.utc) # a fixed time for the clicks
+
+    def test_clicks_update_visitor_estimate(self):
+        """
+        Test that repeat visitors are counted once across batches
+        """
+        persist_clicks([ClickRecord(self.short.id, self.moment, ip, "ua") for ip in ("1.1.1.1", "2.2.2.2", "1.1.1.1")])
+        persist_clicks([ClickRecord(self.short.id, self.moment, ip, "ua") for ip in ("2.2.2.2", "3.3.3.3")])
+
+        self.short.refresh_from_db()
+        self.assertEqual(self.short.clicks, 5) # every click counted
+        self.assertEqual(self.short.unique_visitors, 3) # check if each IP was counted once
+        self.assertEqual(len(VisitorSketch.objects.get(short_url=self.short).registers), 4097) # a fixed 4 KB sketch
+
+    def test_api_exposes_estimate_with_error(self):
+        """
+        Test that the detail and stats responses include the estimate and its relative error
+        """
+        persist_clicks([ClickRecord(self.short.id, self.moment + timedelta(hours=h), f"10.0.0.{h % 3}", "ua") for h in range(6)])
+
+        detail = self.client.get(reverse("shorturl-detail", args=[self.short.id])).data
+        self.assertEqual(detail["unique_visitors"]["estimate"], 3) # check the all-time estimate
+        self.assertGreater(detail["unique_visitors"]["relative_error"], 0) # check the error bound is reported
+
+        stats = self.client.get(reverse("shorturl-stats", args=[self.short.id]), {"from": "2025-03-01T10:00:00Z", "to": "2025-03-01T16:00:00Z"},
+                                HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token)).data # stats are owner only
+        self.assertEqual(stats["unique_ips"]["estimate"], 3) # check the hourly sketches were merged, not summed
+        self.assertEqual(sum(bucket["unique_ips"] for bucket in stats["buckets"]), 6)
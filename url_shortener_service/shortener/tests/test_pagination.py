@@ -0,0 +1,113 @@
+from rest_framework.test import APITestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+from shortener.models import ShortURL
+from shortener.tests.test_query_plans import full_scans, query_plan
+
+User = get_user_model()
+
+
+class KeysetPaginationTest(APITestCase):
+    """
+    Tests for keyset (cursor) pagination of the short URL listings.
+
+    This test class verifies:
+    - ?paginate=cursor walks every link exactly once in (clicks, id) order without a COUNT query
+    - Click updates between pages neither repeat nor reorder links already returned
+    - Previous links lead back to the same page, and ?count=true adds the total
+    - Ordering by created_at and the per-user listing are supported, invalid cursors are rejected
+    - Page number pagination stays the default
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="pageuser", password="pagepass123") # create a dummy user
+        self.links = [ShortURL.objects.create(user=self.user, original_url=f"https://page{i}.com", clicks=i % 4) for i in range(12)] # with tied click counts
+        self.list_url = reverse("shorturl-list")
+
+    def walk(self, url):
+        """Follow next links from `url`, returning the ids of every page"""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([item["id"] for item in response.data["results"]])
+            url = response.data["next"]
+        return pages
+
+    def test_walks_every_link_in_key_order(self):
+        """
+        Test that cursor pages cover every link once, ordered by clicks then id, without counting
+        """
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.list_url, {"paginate": "cursor", "page_size": 5})
+        self.assertNotIn("count", response.data) # check if the total is skipped
+        self.assertFalse([query for query in captured if "COUNT(" in query["sql"]]) # check if no COUNT query ran
+
+        pages = self.walk(response.data["next"])
+        ids = [item["id"] for item in response.data["results"]] + [link_id for page in pages for link_id in page]
+        expected = [link.id for link in sorted(self.links, key=lambda link: (link.clicks, link.id), reverse=True)]
+        self.assertEqual(ids, expected) # check the (clicks, id) order and that nothing is repeated
+
+    def test_stable_under_click_updates(self):
+        """
+        Test that links clicked between two page requests are never returned twice, and that
+        creation time pages still return every link exactly once
+        """
+        first = self.client.get(self.list_url, {"paginate": "cursor", "page_size": 4}).data
+        seen = [item["id"] for item in first["results"]]
+        ShortURL.objects.filter(id__in=[self.links[0].id, seen[-1]]).update(clicks=F("clicks") + 10) # clicks land between the two pages
+        rest = [link_id for page in self.walk(first["next"]) for link_id in page]
+        self.assertEqual(set(seen) & set(rest), set()) # check if no link appears twice
+
+        first = self.client.get(self.list_url, {"paginate": "cursor", "page_size": 4, "ordering": "-created_at"}).data
+        ShortURL.objects.update(clicks=F("clicks") + 10) # every link is clicked before the next page is read
+        rest = [link_id for page in self.walk(first["next"]) for link_id in page]
+        ids = [item["id"] for item in first["results"]] + rest
+        self.assertEqual(ids, [link.id for link in reversed(self.links)]) # check if every link is returned once, newest first
+
+    def test_previous_link_and_count(self):
+        """
+        Test that the previous link of the second page returns the first page, and that ?count=true adds the total
+        """
+        first = self.client.get(self.list_url, {"paginate": "cursor", "page_size": 5, "count": "true"}).data
+        self.assertEqual(first["count"], 12) # check the total
+        self.assertIsNone(first["previous"]) # check if the first page has no previous page
+
+        second = self.client.get(first["next"]).data
+        back = self.client.get(second["previous"]).data
+        self.assertEqual([item["id"] for item in back["results"]], [item["id"] for item in first["results"]]) # check the round trip
+
+    def test_created_at_ordering_and_user_listing(self):
+        """
+        Test that the per-user listing pages by creation time with an index read
+        """
+        refresh = RefreshToken.for_user(self.user) # create a refresh token for the user
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(refresh.access_token)) # authenticate as the dummy user
+        url = reverse("user_urls") + "?paginate=cursor&ordering=created_at&page_size=5"
+        with CaptureQueriesContext(connection) as captured:
+            pages = self.walk(url)
+        self.assertEqual([link_id for page in pages for link_id in page], [link.id for link in self.links]) # check the creation order
+
+        page_queries = [query["sql"] for query in captured if '"shortener_shorturl"' in query["sql"] and "LIMIT" in query["sql"]]
+        for sql in page_queries:
+            self.assertEqual(full_scans(query_plan(sql)), []) # check if every page is read through an index
+
+    def test_invalid_cursor(self):
+        """
+        Test that a tampered cursor is rejected with 404 Not Found
+        """
+        response = self.client.get(self.list_url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_numbers_by_default(self):
+        """
+        Test that the listings keep page number pagination when no cursor is requested
+        """
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.data["count"], 12) # check if the total is included
+        self.assertIn("page=2", response.data["next"]) # check if the next link is a page number
@@ -0,0 +1,134 @@
+import csv
+import gzip
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from shortener import partitions
+from shortener.clicks import ClickRecord, persist_clicks
+from django.db import connection
+from shortener.models import ShortURL, ClickEvent, ClickRollup, Device, UserAgent
+
+
+class ClickPartitionTest(TestCase):
+    """
+    Tests for monthly click partitions and the retention policy.
+
+    This test class verifies:
+    - Rotation moves events of closed months into per-month partitions and keeps recent ones
+    - Partitions are exported to gzip CSV files, with the country and device of enriched events
+    - Partitions created before the enrichment columns get them on the next rotation
+    - archive_clicks exports and drops partitions past retention, but keeps months whose rollups miss clicks of a link
+    """
+
+    def setUp(self):
+        self.short = ShortURL.objects.create(original_url="https://archive.com") # create a dummy short URL
+        self.archive_dir = tempfile.mkdtemp() # temporary export directory
+        self.old = datetime(2024, 1, 15, tzinfo=dt_timezone.utc) # a month past any retention
+
+    def add_event(self, clicked_at, ip="1.1.1.1", **enrichment):
+        """Insert a raw click event without rollups"""
+        user_agent = UserAgent.objects.get_or_create(value="ua")[0]
+        ClickEvent.objects.create(short_url=self.short, clicked_at=clicked_at, ip_address=ip, user_agent=user_agent, **enrichment)
+
+    def test_rotate_moves_closed_months(self):
+        """
+        Test that events before the cutoff land in their month's partition and leave ClickEvent
+        """
+        self.add_event(self.old)
+        self.add_event(self.old + timedelta(days=31)) # February 2024
+        self.add_event(timezone.now()) # current month
+
+        moved = partitions.rotate(datetime(2024, 3, 1, tzinfo=dt_timezone.utc), batch_size=2)
+
+        self.assertEqual(moved, {"shortener_clickevent_y2024m01": 1, "shortener_clickevent_y2024m02": 1}) # check the routing
+        self.assertEqual(ClickEvent.objects.count(), 1) # check if only the recent event stayed
+        self.assertEqual([name for _, _, name in partitions.list_partitions()], ["shortener_clickevent_y2024m01", "shortener_clickevent_y2024m02"])
+
+    def test_export_partition_writes_gzip_csv(self):
+        """
+        Test that an exported partition contains a header row and every event
+        """
+        self.add_event(self.old, ip="9.9.9.9")
+        partitions.rotate(datetime(2024, 2, 1, tzinfo=dt_timezone.utc))
+
+        path = partitions.export_partition("shortener_clickevent_y2024m01", self.archive_dir)
+        with gzip.open(path, "rt") as archive:
+            rows = list(csv.reader(archive))
+        self.assertEqual(rows[0], partitions.ARCHIVE_COLUMNS) # check the header
+        self.assertEqual(rows[1][3], "9.9.9.9") # check the event
+
+    def test_enrichment_is_archived(self):
+        """
+        Test that the country and device of an enriched event survive rotation and export
+        """
+        device = Device.objects.create(browser="Firefox", os="Linux", device_type="desktop")
+        self.add_event(self.old, country="DE", device=device)
+        self.add_event(self.old + timedelta(hours=1)) # not enriched yet
+        partitions.rotate(datetime(2024, 2, 1, tzinfo=dt_timezone.utc))
+
+        path = partitions.export_partition("shortener_clickevent_y2024m01", self.archive_dir)
+        with gzip.open(path, "rt") as archive:
+            rows = [dict(zip(partitions.ARCHIVE_COLUMNS, row)) for row in list(csv.reader(archive))[1:]]
+        self.assertEqual([(row["country"], row["browser"], row["os"], row["device_type"]) for row in rows],
+                         [("DE", "Firefox", "Linux", "desktop"), ("", "", "", "")])
+
+    def test_older_partitions_get_the_new_columns(self):
+        """
+        Test that a partition without the enrichment columns is upgraded before events are moved into it
+        """
+        name = connection.ops.quote_name("shortener_clickevent_y2024m01")
+        with connection.cursor() as cursor: # the table as created before countries and devices were archived
+            cursor.execute(f"CREATE TABLE {name} (id integer NOT NULL PRIMARY KEY, short_url_id bigint NOT NULL, clicked_at datetime NOT NULL, "
+                           "ip_address varchar(45) NOT NULL, user_agent varchar(255) NULL, referrer varchar(255) NULL)")
+        self.add_event(self.old, country="FR")
+        partitions.rotate(datetime(2024, 2, 1, tzinfo=dt_timezone.utc))
+        rows = list(partitions.iter_rows("shortener_clickevent_y2024m01"))
+        self.assertEqual(rows[0][partitions.ARCHIVE_COLUMNS.index("country")], "FR") # check the column was added and filled
+
+    def test_retention_requires_rollups(self):
+        """
+        Test that archive_clicks keeps an expired month until its rollups count every click of each link
+        """
+        with override_settings(SHORTENER={'CLICK_RETENTION': {'ARCHIVE_DIR': self.archive_dir}}):
+            self.add_event(self.old) # raw event only, no rollups
+            call_command("archive_clicks", stdout=io.StringIO())
+            self.assertEqual(len(partitions.list_partitions()), 1) # check if the month was kept
+
+            persist_clicks([ClickRecord(self.short.id, self.old, "2.2.2.2", "ua")]) # a click with rollups
+            self.assertTrue(ClickRollup.objects.filter(granularity="day").exists())
+            output = io.StringIO()
+            call_command("archive_clicks", stdout=output)
+            self.assertEqual(len(partitions.list_partitions()), 1) # check a rollup counting 1 of 2 clicks is not enough
+            self.assertIn(f"(e.g. {self.short.id})", output.getvalue())
+
+            ClickRollup.objects.filter(granularity="day").update(clicks=2) # the rollups now cover the month
+            call_command("archive_clicks", stdout=io.StringIO())
+
+        self.assertEqual(partitions.list_partitions(), []) # check if the month was dropped
+        self.assertTrue(os.path.exists(os.path.join(self.archive_dir, "shortener_clickevent_y2024m01.csv.gz"))) # check if exported first
+        self.assertEqual(ClickEvent.objects.count(), 0) # check if the hot table only keeps recent months
+
+    def test_dry_run_changes_nothing(self):
+        """
+        Test that --dry-run reports without moving events
+        """
+        self.add_event(self.old)
+        output = io.StringIO()
+        call_command("archive_clicks", "--dry-run", "--no-export", stdout=output)
+        self.assertEqual(ClickEvent.objects.count(), 1) # check if nothing moved
+        self.assertIn("Would move", output.getvalue())
+
+    def test_deleted_links_do_not_block_retention(self):
+        """
+        Test that archived clicks of a deleted link, whose rollups went with it, do not keep the month
+        """
+        self.add_event(self.old)
+        partitions.rotate(datetime(2024, 2, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitions.uncovered_links("shortener_clickevent_y2024m01", 2024, 1), [self.short.id])
+        self.short.delete()
+        self.assertEqual(partitions.uncovered_links("shortener_clickevent_y2024m01", 2024, 1), [])
@@ -0,0 +1,100 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from shortener import qr
+from shortener.models import ShortURL
+
+User = get_user_model()
+
+class QRCodeTest(APITestCase):
+    """
+    Tests for QR code generation and the QR image endpoint.
+
+    This test class verifies:
+    - List responses carry only a link to the QR image unless ?include=qr_code is given
+    - Detail responses still embed the QR code
+    - The QR endpoint serves PNG and SVG images with ETag and Cache-Control headers
+    - A matching If-None-Match returns 304 without rendering
+    - Each (short link, size, type) is rendered only once
+    """
+
+    def setUp(self):
+        cache.clear() # drop QR images cached by other tests
+        self.user = User.objects.create_user(username="qruser", password="qrpass123") # create a dummy user
+        refresh = RefreshToken.for_user(self.user) # create a refresh token for the user
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(refresh.access_token)) # authenticate as the dummy user
+        self.short = ShortURL.objects.create(user=self.user, original_url="https://qr.com") # create a dummy short URL
+        self.qr_url = reverse("shorturl-qr", args=[self.short.id]) # QR endpoint of the short URL
+
+    def test_list_has_qr_link_only(self):
+        """
+        Test that list items contain qr_code_url but no inline qr_code by default
+        """
+        response = self.client.get(reverse("shorturl-list"))
+        item = response.data["results"][0]
+        self.assertNotIn("qr_code", item) # check if the inline image is skipped
+        self.assertTrue(item["qr_code_url"].endswith(self.qr_url)) # check if the link points at the QR endpoint
+
+    def test_list_includes_qr_code_on_request(self):
+        """
+        Test that ?include=qr_code embeds the QR code in list items
+        """
+        response = self.client.get(reverse("user_urls"), {"include": "qr_code"})
+        self.assertTrue(response.data["results"][0]["qr_code"].startswith("data:image/png;base64,")) # check if embedded
+
+    def test_detail_includes_qr_code(self):
+        """
+        Test that the detail response still embeds the QR code
+        """
+        response = self.client.get(reverse("shorturl-detail", args=[self.short.id]))
+        self.assertTrue(response.data["qr_code"].startswith("data:image/png;base64,")) # check if embedded
+
+    def test_qr_endpoint_serves_png_with_cache_headers(self):
+        """
+        Test that the QR endpoint returns a PNG image with ETag and Cache-Control
+        """
+        response = self.client.get(self.qr_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK) # check if status 200 OK
+        self.assertEqual(response["Content-Type"], "image/png") # check if PNG
+        self.assertTrue(response.content.startswith(b"\x89PNG")) # check the PNG signature
+        self.assertIn("ETag", response) # check if tagged
+        self.assertIn("max-age", response["Cache-Control"]) # check if cacheable
+
+    def test_qr_endpoint_serves_svg(self):
+        """
+        Test that ?type=svg returns an SVG image
+        """
+        response = self.client.get(self.qr_url, {"type": "svg", "size": 4})
+        self.assertEqual(response["Content-Type"], "image/svg+xml") # check if SVG
+        self.assertIn(b"<svg", response.content)
+
+    def test_qr_endpoint_rejects_invalid_size(self):
+        """
+        Test that an out-of-range size returns 400 Bad Request
+        """
+        response = self.client.get(self.qr_url, {"size": 500})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST) # check if status 400 Bad Request
+
+    def test_matching_etag_returns_304_without_rendering(self):
+        """
+        Test that a conditional request with the current ETag returns 304 Not Modified
+        """
+        etag = self.client.get(self.qr_url)["ETag"] # first request renders the image
+        with mock.patch.object(qr, "render_qr") as render:
+            response = self.client.get(self.qr_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED) # check if status 304 Not Modified
+        render.assert_not_called() # check if nothing was rendered
+
+    def test_image_is_rendered_once(self):
+        """
+        Test that repeated requests for the same QR image render it only once
+        """
+        with mock.patch.object(qr, "render_qr", wraps=qr.render_qr) as render:
+            for _ in range(3):
+                self.client.get(reverse("shorturl-detail", args=[self.short.id]))
+        self.assertEqual(render.call_count, 1) # check if later requests used the cached image
@@ -0,0 +1,102 @@
+import re
+from datetime import timedelta
+
+from rest_framework.test import APITestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from shortener.models import ShortURL, ClickEvent
+from shortener.cache import resolution_cache
+
+User = get_user_model()
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN \w+$')  # "SCAN table" without "USING ... INDEX"
+
+
+def query_plan(sql, params=None):
+    """
+    Plan lines of a query, with sequential scans disabled on PostgreSQL so that an available
+    index is always chosen, even for the tiny tables of the test database.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute('EXPLAIN ' + sql, params)
+                return [row[0].strip() for row in cursor.fetchall()]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """
+    Plan lines that read a whole table or sort rows outside an index.
+    """
+    if connection.vendor == 'postgresql':
+        return [line for line in plan if 'Seq Scan' in line or line.lstrip('-> ').startswith('Sort')]
+    return [line for line in plan if SQLITE_FULL_SCAN.match(line) or 'TEMP B-TREE' in line]
+
+
+class QueryPlanTest(APITestCase):
+    """
+    Query plan regression tests for the hot paths (SQLite and PostgreSQL).
+
+    This test class verifies:
+    - The redirect lookup by short code uses an index
+    - The short URL listing ordered by clicks reads an index instead of sorting the table
+    - The per-user listing filters and orders through one index
+    - Click events of a link in a time range are read through an index
+    """
+
+    def setUp(self):
+        resolution_cache.clear() # force the redirect to query the database
+        self.user = User.objects.create_user(username="planuser", password="planpass123") # create a dummy user
+        self.links = [ShortURL.objects.create(user=self.user, original_url=f"https://plan{i}.com", clicks=i) for i in range(3)] # a few links to list
+
+    def assertUsesIndexes(self, queries, table):
+        """Assert that every SELECT on `table` is planned without a full scan"""
+        selects = [query["sql"] for query in queries if query["sql"].startswith('SELECT') and f'"{table}"' in query["sql"]]
+        self.assertTrue(selects) # check if the endpoint queried the table at all
+        for sql in selects:
+            plan = query_plan(sql)
+            self.assertEqual(full_scans(plan), [], f"{sql}\n" + "\n".join(plan)) # check if no full scan or sort
+
+    def test_redirect_lookup(self):
+        """
+        Test that resolving a short code searches an index
+        """
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse("redirect", args=[self.links[0].short_code]))
+        self.assertUsesIndexes(captured, "shortener_shorturl")
+
+    def test_listing_ordered_by_clicks(self):
+        """
+        Test that the default listing is read in index order
+        """
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse("shorturl-list"))
+        self.assertUsesIndexes(captured, "shortener_shorturl")
+
+    def test_user_listing(self):
+        """
+        Test that a user's links are filtered and ordered through the same index
+        """
+        refresh = RefreshToken.for_user(self.user) # create a refresh token for the user
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(refresh.access_token)) # authenticate as the dummy user
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse("user_urls"))
+        self.assertUsesIndexes(captured, "shortener_shorturl")
+
+    def test_click_events_in_range(self):
+        """
+        Test that a link's click events in a time range are read through an index
+        """
+        since = timezone.now() - timedelta(days=1)
+        with CaptureQueriesContext(connection) as captured:
+            list(ClickEvent.objects.filter(short_url=self.links[0], clicked_at__gte=since).order_by('clicked_at'))
+        self.assertUsesIndexes(captured, "shortener_clickevent")
@@ -0,0 +1,132 @@
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from shortener.clicks import ClickRecord, click_buffer, persist_clicks
+from shortener.interning import user_agents
+from shortener.models import ClickCounterShard, ClickEvent, ClickRollup, ShortURL
+from shortener.rebuild import ClickAggregate, ClickRebuild, RebuildReport, scan_range
+
+START = datetime(2025, 5, 1, 10, tzinfo=dt_timezone.utc)
+
+
+def rollup_state():
+    return sorted(ClickRollup.objects.values_list('short_url_id', 'granularity', 'bucket_start', 'clicks', 'unique_ips', 'top_referrers', 'top_user_agents'))
+
+
+@override_settings(SHORTENER={'CLICK_REBUILD': {'CHECKPOINT_DIR': None}}) # no checkpoints unless a test passes a directory
+class ClickRebuildTest(TestCase):
+    """
+    Tests for rebuilding click counters and rollups from the ClickEvent table.
+
+    This test class verifies:
+    - Drifted counters and rollups are reported by a dry run and corrected by a real run
+    - Scans of separate link ranges add up to one scan, also through their JSON form
+    - Clicks only left in archived daily rollups, counter shards and events logged during the run are accounted for
+    - An interrupted run resumes after the last corrected link, and a dry run leaves its checkpoint alone
+    - The pending aggregates of 'sync' clicks queued in the process are flushed first, not counted twice
+    """
+
+    def setUp(self):
+        self.links = [ShortURL.objects.create(original_url=f"https://rebuild{i}.com") for i in range(3)] # create dummy short URLs
+        records = [ClickRecord(self.links[i % 3].id, START + timedelta(minutes=37 * i), f"10.0.0.{i % 7}", f"ua{i % 2}", "https://ref.com" if i % 4 else None) for i in range(60)]
+        persist_clicks(records)
+
+    def test_dry_run_then_fix(self):
+        """
+        Test that broken counters and rollups are found, left alone by the dry run, then repaired
+        """
+        expected_rollups = rollup_state()
+        ShortURL.objects.filter(pk=self.links[0].pk).update(clicks=3) # lost increments
+        ShortURL.objects.filter(pk=self.links[1].pk).update(clicks=99) # counted twice
+        ClickRollup.objects.filter(short_url=self.links[2], granularity='day').update(clicks=1)
+        ClickRollup.objects.filter(short_url=self.links[2], granularity='hour').first().delete()
+
+        report = ClickRebuild(range_size=2).run(dry_run=True)
+        self.assertEqual(sorted((pk, before, after) for pk, _, before, after in report.changed),
+                         [(self.links[0].pk, 3, 20), (self.links[1].pk, 99, 20)]) # check the diff report
+        self.assertEqual(report.drift, 17 - 79)
+        self.assertEqual((report.buckets_created, report.buckets_updated, report.buckets_deleted), (1, 2, 0)) # an hour created, both days of the link updated
+        self.assertEqual(ShortURL.objects.get(pk=self.links[0].pk).clicks, 3) # check nothing was written
+
+        ClickRebuild(range_size=2, batch_size=1).run()
+        self.assertEqual(list(ShortURL.objects.order_by("pk").values_list("clicks", flat=True)), [20, 20, 20])
+        self.assertEqual(rollup_state(), expected_rollups) # check the rollups match what was maintained incrementally
+
+    def test_link_ranges_add_up_to_one_scan(self):
+        """
+        Test that the aggregates of link ranges (as returned by pool processes) hold what a single scan does
+        """
+        low, high = self.links[0].pk, self.links[-1].pk + 1
+        max_id = ClickEvent.objects.order_by("-id").first().id
+        whole = scan_range(low, high, max_id, 100, 10).to_dict()
+        parts = [ClickAggregate.from_dict(scan_range(start, start + 2, max_id, 5, 10).to_dict()).to_dict() for start in range(low, high, 2)]
+        self.assertEqual({pk: clicks for part in parts for pk, clicks in part["clicks"].items()}, whole["clicks"])
+        self.assertEqual(sorted(str(bucket) for part in parts for bucket in part["buckets"]), sorted(map(str, whole["buckets"])))
+        self.assertEqual(scan_range(low, high, max_id - 1, 100, 10).clicks[self.links[-1].pk], 19) # check events past max_id are left to the tail
+
+    def test_archived_shards_and_tail(self):
+        """
+        Test that archived rollup clicks are added, unfolded shard clicks subtracted and late events counted
+        """
+        link = self.links[0]
+        ClickRollup.objects.create(short_url=link, granularity="day", bucket_start=START - timedelta(days=60), clicks=5) # events moved out long ago
+        ClickCounterShard.objects.create(short_url=link, shard=0, clicks=4) # hot link clicks not folded yet
+        ShortURL.objects.filter(pk=link.pk).update(clicks=20 + 5 - 4)
+
+        rebuild = ClickRebuild()
+        rebuild.plan()
+        (low, high, aggregate), = rebuild.scan()
+        persist_clicks([ClickRecord(link.id, START + timedelta(days=1), "10.0.0.1", "ua0")]) # logged while the run is in progress
+        report = rebuild.apply(aggregate, low, high, RebuildReport())
+        self.assertEqual(report.changed, []) # check the counter was consistent
+        link.refresh_from_db()
+        self.assertEqual(link.clicks, 22) # check the late click was kept
+        self.assertTrue(ClickRollup.objects.filter(short_url=link, bucket_start=START - timedelta(days=60)).exists()) # archived bucket untouched
+
+    def test_resume_from_checkpoints(self):
+        """
+        Test that a second run with --resume starts after the links the first one corrected, and clears the checkpoint when done
+        """
+        ShortURL.objects.filter(pk__in=[self.links[0].pk, self.links[2].pk]).update(clicks=0)
+        with tempfile.TemporaryDirectory() as directory:
+            rebuild = ClickRebuild(range_size=2, checkpoint_dir=directory)
+            rebuild.plan()
+            low, high, aggregate = next(rebuild.scan())
+            rebuild.apply(aggregate, low, high, RebuildReport()) # interrupted after the first range
+            self.assertEqual(ShortURL.objects.get(pk=self.links[0].pk).clicks, 20)
+
+            out = io.StringIO()
+            call_command("rebuild_clicks", dry_run=True, checkpoint_dir=directory, stdout=out)
+            self.assertIn("Would correct 1 of 3 links", out.getvalue()) # a dry run checks every link
+            self.assertEqual(os.listdir(directory), ["state.json"]) # and keeps the unfinished run
+
+            out = io.StringIO()
+            call_command("rebuild_clicks", resume=True, checkpoint_dir=directory, stdout=out)
+            self.assertIn(f"links up to id {self.links[1].pk} are corrected", out.getvalue())
+            self.assertIn("Corrected 1 of 1 links", out.getvalue()) # check only the remaining range was done
+            self.assertEqual(os.listdir(directory), []) # check the finished run removed its checkpoint
+        self.assertEqual(ShortURL.objects.get(pk=self.links[2].pk).clicks, 20)
+
+    def test_sync_aggregates_flushed_first(self):
+        """
+        Test that a 'sync' click whose rollups are still queued is added to the rollups once, not by the rebuild and again by the flush
+        """
+        self.addCleanup(user_agents.clear) # the interned ids are rolled back with the test
+        expected_rollups = rollup_state()
+        config = {'CLICK_REBUILD': {'CHECKPOINT_DIR': None}, 'CLICK_LOGGING': {'MODE': 'sync', 'FLUSH_INTERVAL': None, 'BATCH_SIZE': 100}}
+        with override_settings(SHORTENER=config):
+            with self.captureOnCommitCallbacks(execute=True): # run the callbacks of a committed request
+                click_buffer.add(ClickRecord(self.links[0].id, START, "10.0.0.1", "ua0"))
+            self.assertEqual(click_buffer.pending_aggregates(), 1) # the event is written, its rollups wait for the flush
+
+            report = ClickRebuild().run()
+            self.assertEqual(click_buffer.pending_aggregates(), 0) # check the rebuild flushed them first
+            self.assertEqual(report.changed, []) # the counter was written with the event
+            click_buffer.flush()
+        hour = ClickRollup.objects.get(short_url=self.links[0], granularity="hour", bucket_start=START)
+        before = next(row for row in expected_rollups if row[:3] == (self.links[0].id, "hour", START))
+        self.assertEqual(hour.clicks, before[3] + 1) # check the click was counted once
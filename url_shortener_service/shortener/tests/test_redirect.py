@@ -54,7 +54,7 @@ class RedirectViewTest(APITestCase):
         response = self.client.get(url) # send a GET request to the redirect URL with the expired short code
 
         self.assertEqual(response.status_code, status.HTTP_410_GONE) # check if the status code is 410 Gone
-        self.assertIn("expired", response.data["detail"].lower()) # check if the response contains an expired message in the detail field
+        self.assertIn("expired", response.json()["detail"].lower()) # check if the response contains an expired message in the detail field
 
 
 
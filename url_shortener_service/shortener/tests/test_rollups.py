@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from shortener.clicks import ClickRecord, persist_clicks
+from shortener.models import ShortURL, ClickRollup
+
+User = get_user_model()
+
+
+class ClickRollupTest(APITestCase):
+    """
+    Tests for the hourly/daily click rollups and the stats endpoint.
+
+    This test class verifies:
+    - Written clicks are folded into one hour and one day bucket per link
+    - Later batches update the existing buckets
+    - The stats endpoint serves buckets for a range without reading raw click events
+    - Invalid stats parameters return 400 Bad Request
+    - Only the owner of the link, or staff, can read its stats
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="statsuser", password="statspass123") # create a dummy user
+        self.short = ShortURL.objects.create(original_url="https://stats.com", user=self.user) # create a dummy short URL
+        self.client.force_authenticate(self.user) # stats are only served to the owner
+        self.stats_url = reverse("shorturl-stats", args=[self.short.id]) # /api/shorten/<id>/stats/
+        self.hour = datetime(2025, 3, 1, 10, tzinfo=dt_timezone.utc) # a fixed hour for the clicks
+
+    def click(self, minutes, ip="1.1.1.1", referrer=None, user_agent="ua"):
+        """Click record at `minutes` past the fixed hour"""
+        return ClickRecord(self.short.id, self.hour + timedelta(minutes=minutes), ip, user_agent, referrer)
+
+    def test_clicks_are_rolled_up(self):
+        """
+        Test that a batch creates hour and day buckets with counts, unique IPs and top referrers
+        """
+        persist_clicks([
+            self.click(1, referrer="https://news.com"),
+            self.click(2, ip="2.2.2.2", referrer="https://news.com"),
+            self.click(70, ip="3.3.3.3"), # next hour, same day
+        ])
+
+        hours = ClickRollup.objects.filter(short_url=self.short, granularity="hour").order_by("bucket_start")
+        self.assertEqual([row.clicks for row in hours], [2, 1]) # check the hourly counts
+        self.assertEqual(hours[0].unique_ips, 2) # check the unique IP estimate
+        self.assertEqual(hours[0].top_referrers, {"https://news.com": 2}) # check the referrer counts
+
+        day = ClickRollup.objects.get(short_url=self.short, granularity="day")
+        self.assertEqual(day.clicks, 3) # check the daily count
+        self.assertEqual(day.unique_ips, 3)
+
+    def test_later_batches_update_buckets(self):
+        """
+        Test that a second batch adds to the existing bucket instead of creating another one
+        """
+        persist_clicks([self.click(1)])
+        persist_clicks([self.click(5), self.click(6, ip="9.9.9.9")])
+
+        bucket = ClickRollup.objects.get(short_url=self.short, granularity="hour")
+        self.assertEqual(bucket.clicks, 3) # check if the counts were added
+        self.assertEqual(bucket.unique_ips, 2) # check if the sketch was merged
+
+    def test_stats_endpoint_reads_rollups_only(self):
+        """
+        Test that the stats endpoint returns the buckets in range without touching click events
+        """
+        persist_clicks([self.click(1), self.click(2), self.click(130)])
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.stats_url, {"granularity": "hour", "from": "2025-03-01T10:30:00Z", "to": "2025-03-01T13:00:00Z"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK) # check if status 200 OK
+        self.assertEqual(response.data["total_clicks"], 3) # the bucket containing `from` is included
+        self.assertEqual([bucket["clicks"] for bucket in response.data["buckets"]], [2, 1]) # check the buckets
+        self.assertFalse(any("shortener_clickevent" in query["sql"] for query in captured)) # check raw events were not read
+
+    def test_stats_endpoint_day_granularity(self):
+        """
+        Test that day granularity accepts plain dates
+        """
+        persist_clicks([self.click(1)])
+        response = self.client.get(self.stats_url, {"granularity": "day", "from": "2025-03-01", "to": "2025-03-02"})
+        self.assertEqual(response.data["buckets"][0]["clicks"], 1) # check the daily bucket
+
+    def test_invalid_stats_parameters_return_400(self):
+        """
+        Test that an unknown granularity or unparsable dates return 400 Bad Request
+        """
+        response = self.client.get(self.stats_url, {"granularity": "week"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST) # check if status 400 Bad Request
+        response = self.client.get(self.stats_url, {"from": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.stats_url, {"granularity": "hour", "from": "2020-01-01", "to": "2025-01-01"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST) # too many buckets
+
+    def test_stats_owner_or_staff_only(self):
+        """
+        Test that anonymous users and other users cannot read a link's stats, and that links without an owner are staff only
+        """
+        other = User.objects.create_user(username="otherstats", password="otherpass123")
+        anonymous_link = ShortURL.objects.create(original_url="https://anonymous.com") # shortened without an account
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.stats_url).status_code, status.HTTP_401_UNAUTHORIZED) # check anonymous users are refused
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.stats_url).status_code, status.HTTP_403_FORBIDDEN) # check another user is refused
+        self.assertEqual(self.client.get(reverse("shorturl-stats", args=[anonymous_link.id])).status_code, status.HTTP_403_FORBIDDEN)
+
+        other.is_staff = True # promote the other user to staff
+        other.save()
+        self.assertEqual(self.client.get(self.stats_url).status_code, status.HTTP_200_OK) # check staff can read any link's stats
+        self.assertEqual(self.client.get(reverse("shorturl-stats", args=[anonymous_link.id])).status_code, status.HTTP_200_OK)
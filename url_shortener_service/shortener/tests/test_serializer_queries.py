@@ -0,0 +1,73 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from shortener.models import ShortURL
+
+User = get_user_model()
+
+
+class ListQueryCountTest(APITestCase):
+    """
+    Tests for the number of queries of the list endpoints and of updates.
+
+    This test class verifies:
+    - Listing links runs the same number of queries whatever the page size
+    - Short links and QR code URLs are still built for every row
+    - Updating a link without changing its short code does not check the code for uniqueness
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="lister", password="listerpass123") # create a dummy user
+        self.client.force_authenticate(self.user)
+
+    def create_links(self, count):
+        for number in range(count):
+            ShortURL.objects.create(original_url=f"https://list{number}.com", user=self.user)
+
+    def count_queries(self, url, params):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK) # check if status 200 OK
+        return len(captured), response
+
+    def test_constant_queries(self):
+        """
+        Test that a page of 2 links and a page of 40 links cost the same number of queries, on both list endpoints
+        """
+        self.create_links(2)
+        small = {name: self.count_queries(reverse(name), {"paginate": "cursor", "page_size": 50})[0] for name in ("shorturl-list", "user_urls")}
+        self.create_links(38)
+        for name in ("shorturl-list", "user_urls"):
+            queries, response = self.count_queries(reverse(name), {"paginate": "cursor", "page_size": 50})
+            self.assertEqual(len(response.data["results"]), 40)
+            self.assertEqual(queries, small[name]) # check the count does not grow with the rows
+        self.assertEqual(self.count_queries(reverse("shorturl-list"), {})[0], self.count_queries(reverse("shorturl-list"), {"page": 2})[0])
+
+    def test_links_built_per_row(self):
+        """
+        Test that the precomputed bases still produce each row's own links
+        """
+        self.create_links(2)
+        _, response = self.count_queries(reverse("shorturl-list"), {})
+        for row in response.data["results"]:
+            self.assertEqual(row["short_link"], f"http://testserver/r/{row['short_code']}/")
+            self.assertEqual(row["qr_code_url"], "http://testserver" + reverse("shorturl-qr", args=[row["id"]]))
+
+    def test_unchanged_code_not_checked(self):
+        """
+        Test that PATCHing a link with its own short code skips the uniqueness query, and a taken code is refused
+        """
+        link = ShortURL.objects.create(original_url="https://own.com", short_code="owncode", user=self.user)
+        ShortURL.objects.create(original_url="https://taken.com", short_code="taken")
+        url = reverse("shorturl-detail", args=[link.id])
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.patch(url, {"short_code": "owncode"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK) # check if status 200 OK
+        self.assertFalse(any("owncode" in query["sql"] and query["sql"].startswith("SELECT 1") for query in captured)) # no exists() query
+
+        response = self.client.patch(url, {"short_code": "taken"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST) # check the code is still checked when it changes
+        self.assertIn("short_code", response.data)
@@ -0,0 +1,144 @@
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from shortener.cache import resolution_cache
+from shortener.models import RedirectChange, ShortURL
+from shortener.snapshot import RedirectSnapshot, SnapshotReader, redirect_snapshot
+
+
+class RedirectSnapshotFileTest(TestCase):
+    """
+    Tests for the snapshot file format.
+
+    This test class verifies:
+    - Codes are found by binary search whatever order they were written in, with their URL and expiry
+    - Unknown codes, codes too long for a record and files of another format are handled
+    """
+
+    def test_write_and_lookup(self):
+        """
+        Test a snapshot round trip
+        """
+        expiry = datetime(2030, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc)
+        rows = [("zzz", 3, "https://z.com/ü", None), ("abc", 1, "https://a.com", expiry), ("m", 2, "https://m.com", None),
+                ("1234567/waytoolongforarecord", 4, "https://long.com", None)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "redirects.bin")
+            self.assertEqual(RedirectSnapshot.write(rows, path, 1000.0, 42), 3) # the long code is left to the database
+            snapshot = RedirectSnapshot(path)
+            self.assertEqual((snapshot.generated_at, snapshot.change_id), (1000.0, 42))
+            self.assertEqual(snapshot.lookup("abc"), (1, "https://a.com", True, expiry)) # check the expiry survives to the microsecond
+            self.assertEqual(snapshot.lookup("zzz"), (3, "https://z.com/ü", True, None))
+            self.assertEqual(snapshot.lookup("m")[0], 2)
+            self.assertIsNone(snapshot.lookup("ab")) # a prefix of a code is not a match
+            self.assertIsNone(snapshot.lookup("zzzz"))
+            self.assertIsNone(snapshot.lookup("1234567/waytoolongforarecord"))
+            snapshot.close()
+
+            with open(path, "r+b") as handle:
+                handle.write(b"XXXX")
+            with self.assertRaises(ValueError): # check other files are refused
+                RedirectSnapshot(path)
+
+
+class SnapshotRedirectTest(TestCase):
+    """
+    Tests for redirects served from the snapshot.
+
+    This test class verifies:
+    - Codes in the snapshot resolve without any database query
+    - Links changed or deleted after the snapshot are resolved from the database instead, in every process
+    - Markers are read by id, so one committed late (with an old timestamp) is not missed, and bulk deletes write them
+    - Links created after the snapshot fall back to the database
+    - A rebuilt snapshot is picked up, and the command drops the markers it covers
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "redirects.bin")
+        self.settings = override_settings(SHORTENER={"REDIRECT_SNAPSHOT": {"FILE": self.path, "RELOAD_INTERVAL": 0, "REFRESH_MARGIN": 0}})
+        self.settings.enable()
+        self.link = ShortURL.objects.create(original_url="https://snapshot.com") # create a dummy short URL
+        call_command("build_redirect_snapshot", stdout=io.StringIO())
+        redirect_snapshot.clear()
+        resolution_cache.clear() # make the lookups miss the cache tiers
+        resolution_cache.reset_stats()
+
+    def tearDown(self):
+        self.settings.disable()
+        redirect_snapshot.clear()
+        self.directory.cleanup()
+
+    def test_resolved_without_database(self):
+        """
+        Test that a code in the snapshot is answered from the mapped file
+        """
+        redirect_snapshot.refresh() # opens the file and reads the change markers, once per RELOAD_INTERVAL
+        with self.assertNumQueries(0):
+            entry = redirect_snapshot.lookup(self.link.routing_key)
+        self.assertEqual(entry[:2], (self.link.id, "https://snapshot.com"))
+
+        with override_settings(SHORTENER={"REDIRECT_SNAPSHOT": {"FILE": self.path, "RELOAD_INTERVAL": 60}}):
+            with self.assertNumQueries(0): # check the whole resolution stays off the database
+                self.assertEqual(resolution_cache.resolve(self.link.short_code).original_url, "https://snapshot.com")
+        self.assertEqual(resolution_cache.stats()["snapshot_hits"], 1)
+
+    def test_changed_links_leave_the_snapshot(self):
+        """
+        Test that updated and deleted links are not served stale, here and in other processes
+        """
+        other = SnapshotReader() # the snapshot reader of another worker process
+        self.assertIsNotNone(other.get(self.link.routing_key))
+
+        self.link.original_url = "https://changed.com"
+        self.link.save()
+        self.assertEqual(RedirectChange.objects.count(), 1) # check a marker was written
+        self.assertIsNone(redirect_snapshot.get(self.link.routing_key)) # this process skips the code right away
+        self.assertIsNone(other.get(self.link.routing_key)) # the other process at its next refresh
+        self.assertEqual(resolution_cache.resolve(self.link.short_code).original_url, "https://changed.com")
+
+        self.link.delete()
+        resolution_cache.clear()
+        self.assertIsNone(resolution_cache.resolve(self.link.short_code)) # check the deleted link no longer redirects
+
+    def test_new_links_fall_back_to_the_database(self):
+        """
+        Test that a link created after the snapshot resolves from the database, then from a rebuilt snapshot
+        """
+        newer = ShortURL.objects.create(original_url="https://newer.com")
+        resolution_cache.clear()
+        self.assertIsNone(redirect_snapshot.get(newer.routing_key))
+        self.assertEqual(resolution_cache.resolve(newer.short_code).original_url, "https://newer.com")
+        self.assertEqual(resolution_cache.stats()["db_lookups"], 1)
+
+        self.link.save() # leaves a marker the rebuilt snapshot covers
+        out = io.StringIO()
+        call_command("build_redirect_snapshot", stdout=out)
+        self.assertIn("Wrote 2 short codes", out.getvalue())
+        self.assertFalse(RedirectChange.objects.exists()) # check the markers were dropped
+        self.assertEqual(redirect_snapshot.get(newer.routing_key)[1], "https://newer.com") # check the new file was picked up
+        self.assertIsNotNone(redirect_snapshot.get(self.link.routing_key)) # and the marker no longer applies
+
+    def test_markers_read_by_id(self):
+        """
+        Test that a marker written with an old timestamp, as by a slow commit, still reaches other processes
+        """
+        other = SnapshotReader()
+        self.assertIsNotNone(other.get(self.link.routing_key)) # read the markers once
+        RedirectChange.objects.create(short_code=self.link.routing_key, changed_at=datetime.now(dt_timezone.utc) - timedelta(hours=1))
+        self.assertIsNone(other.get(self.link.routing_key)) # check the next catch-up sees it
+
+    def test_bulk_delete_leaves_the_snapshot(self):
+        """
+        Test that links deleted with QuerySet.delete() are marked like single deletes
+        """
+        other = SnapshotReader()
+        self.assertIsNotNone(other.get(self.link.routing_key))
+        ShortURL.objects.filter(pk=self.link.pk).delete()
+        self.assertEqual(list(RedirectChange.objects.values_list("short_code", flat=True)), [self.link.routing_key])
+        self.assertIsNone(other.get(self.link.routing_key))
+        self.assertIsNone(resolution_cache.resolve(self.link.short_code))
@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from shortener.models import ShortURL
+from shortener.throttling import RateLimiter, rate_limiter
+
+User = get_user_model()
+
+LIMITS = {'RATE_LIMITS': {'RATES': {'shorten': '2/min', 'redirect': '2/min'}}, 'CLICK_LOGGING': {'MODE': 'sync'}}  # clicks written in the request, as in the rest of the suite
+
+
+class RateLimiterTest(TestCase):
+    """
+    Tests for the rate limiter itself.
+
+    This test class verifies:
+    - A token bucket allows a burst of a full period, then refills at the average rate
+    - Checks run no database queries
+    - Shared sliding windows count the requests of every process together
+    """
+
+    @override_settings(SHORTENER={'RATE_LIMITS': {'RATES': {'shorten': '3/min'}}})
+    def test_token_bucket(self):
+        """
+        Test the burst, the wait time and the refill of a token bucket
+        """
+        limiter = RateLimiter()
+        with self.assertNumQueries(0): # check the limiter never touches the database
+            results = [limiter.check('shorten', 'ip:1.1.1.1', now=100.0) for _ in range(4)]
+        self.assertEqual([allowed for allowed, _ in results], [True, True, True, False]) # a burst of 3, then throttled
+        self.assertAlmostEqual(results[-1][1], 20.0) # one token every 20 seconds
+        self.assertTrue(limiter.check('shorten', 'ip:2.2.2.2', now=100.0)[0]) # other clients have their own bucket
+        self.assertTrue(limiter.check('shorten', 'ip:1.1.1.1', now=120.0)[0]) # refilled one token
+        self.assertFalse(limiter.check('shorten', 'ip:1.1.1.1', now=121.0)[0])
+        self.assertTrue(limiter.check('redirect', 'ip:1.1.1.1', now=121.0)[0]) # scopes without a rate are not limited
+
+    @override_settings(SHORTENER={'RATE_LIMITS': {'RATES': {'redirect': '2/min'}, 'SHARED_CACHE_ALIAS': 'default'}})
+    def test_shared_windows(self):
+        """
+        Test that two processes sharing a cache enforce one limit together
+        """
+        cache.clear()
+        first, second = RateLimiter(), RateLimiter() # the limiters of two worker processes
+        self.assertTrue(first.check('redirect', 'ip:1.1.1.1', now=600.0)[0])
+        self.assertTrue(second.check('redirect', 'ip:1.1.1.1', now=601.0)[0])
+        allowed, wait = first.check('redirect', 'ip:1.1.1.1', now=602.0)
+        self.assertFalse(allowed) # the third request of the window, whichever process serves it
+        self.assertAlmostEqual(wait, 58.0) # until the window ends
+        self.assertFalse(second.check('redirect', 'ip:1.1.1.1', now=690.0)[0]) # still counts half of the previous window
+        self.assertTrue(second.check('redirect', 'ip:1.1.1.1', now=780.0)[0]) # two windows later
+        cache.clear()
+
+
+@override_settings(SHORTENER=LIMITS)
+class ThrottledEndpointsTest(APITestCase):
+    """
+    Tests for the limits applied to the API and the redirects.
+
+    This test class verifies:
+    - Link creation is limited per client with a 429 response and a Retry-After header, reads are not
+    - Redirects are limited in the fast path, for existing and unknown codes alike
+    - Redirects served by the DRF view share the same limit
+    - A client-supplied X-Forwarded-For header does not give a client new limits
+    """
+
+    def setUp(self):
+        rate_limiter.reset() # buckets are kept per process
+        self.short = ShortURL.objects.create(original_url="https://limited.com") # create a dummy short URL
+
+    def tearDown(self):
+        rate_limiter.reset()
+
+    def test_create_throttled(self):
+        """
+        Test that the third link created in a minute is refused while listing still works
+        """
+        url = reverse("shorturl-list")
+        self.client.force_authenticate(User.objects.create_user(username="creator", password="creatorpass123")) # limited per user
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, {"original_url": "https://a.com"}).status_code, status.HTTP_201_CREATED)
+        response = self.client.post(url, {"original_url": "https://a.com"})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS) # check if status 429
+        self.assertEqual(response["Retry-After"], "30") # one token every 30 seconds
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK) # reads are not limited
+        self.client.force_authenticate(User.objects.create_user(username="other", password="otherpass123"))
+        response = self.client.post(url, {"original_url": "https://a.com"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED) # another user from the same address is unaffected
+
+    def test_fast_path_throttled(self):
+        """
+        Test that redirects and scans of unknown codes share the client's redirect limit
+        """
+        self.assertEqual(self.client.get(f"/r/{self.short.short_code}/").status_code, status.HTTP_302_FOUND)
+        self.assertEqual(self.client.get("/r/doesnotexist/").status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(f"/r/{self.short.short_code}/")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS) # check if status 429
+        self.assertEqual(response["Retry-After"], "30")
+        self.assertEqual(response.json()["detail"], "Request was throttled. Expected available in 30 seconds.") # same body as DRF
+        self.short.refresh_from_db()
+        self.assertEqual(self.short.clicks, 1) # check the throttled request was not counted as a click
+
+    @override_settings(SHORTENER={**LIMITS, 'REDIRECTS': {'FAST_PATH': False}})
+    def test_drf_view_throttled(self):
+        """
+        Test that the DRF redirect view applies the same limit when the fast path is off
+        """
+        url = reverse("redirect", args=[self.short.short_code])
+        for _ in range(2):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_302_FOUND)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS) # check if status 429
+        self.assertIn("Retry-After", response)
+
+    def test_forwarded_for_ignored(self):
+        """
+        Test that rotating X-Forwarded-For values does not escape the redirect limit without trusted proxies
+        """
+        url = f"/r/{self.short.short_code}/"
+        for i in range(2):
+            self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR=f"10.0.0.{i}").status_code, status.HTTP_302_FOUND)
+        response = self.client.get(url, HTTP_X_FORWARDED_FOR="10.0.0.99")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS) # check the limit is keyed on REMOTE_ADDR
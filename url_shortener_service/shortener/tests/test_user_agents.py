@@ -0,0 +1,61 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from shortener.clicks import ClickRecord, persist_clicks
+from shortener.interning import user_agents
+from shortener.models import ClickEvent, ShortURL, UserAgent
+
+
+class UserAgentInterningTest(TestCase):
+    """
+    Tests for the user agent dimension table and its in-process intern cache.
+
+    This test class verifies:
+    - Click events reference one shared UserAgent row per distinct string
+    - Clicks without a user agent store NULL
+    - Committed ids are served from the cache without querying the dimension table
+    """
+
+    def setUp(self):
+        user_agents.clear() # start every test with an empty intern cache
+        self.short = ShortURL.objects.create(original_url="https://agents.com") # create a dummy short URL
+        self.clicked_at = datetime(2025, 3, 1, 10, tzinfo=dt_timezone.utc)
+
+    def tearDown(self):
+        user_agents.clear() # the rows are rolled back, their ids must not outlive the test
+
+    def click(self, user_agent):
+        return ClickRecord(self.short.id, self.clicked_at, "1.1.1.1", user_agent)
+
+    def test_events_share_user_agent_rows(self):
+        """
+        Test that repeated user agents are stored once and empty ones as NULL
+        """
+        persist_clicks([self.click("agent-a"), self.click("agent-b"), self.click("agent-a"), self.click("")])
+        persist_clicks([self.click("agent-a")]) # a later batch reuses the row
+
+        self.assertEqual(sorted(UserAgent.objects.values_list("value", flat=True)), ["agent-a", "agent-b"]) # check the dimension rows
+        self.assertEqual(ClickEvent.objects.filter(user_agent__value="agent-a").count(), 3)
+        self.assertEqual(ClickEvent.objects.filter(user_agent__isnull=True).count(), 1) # check the missing user agent
+
+    def test_cached_ids_skip_the_dimension_table(self):
+        """
+        Test that once committed, known user agents are resolved without a query
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            first = user_agents.ids(["agent-a", "agent-b"])
+        with CaptureQueriesContext(connection) as captured:
+            second = user_agents.ids(["agent-b", "agent-a", ""])
+        self.assertEqual(second, first) # check the same ids are returned, empty strings skipped
+        self.assertEqual(len(captured), 0) # check no query was needed
+
+    def test_uncommitted_ids_are_not_cached(self):
+        """
+        Test that ids of rows whose transaction did not commit are looked up again
+        """
+        user_agents.ids(["agent-a"]) # on_commit never runs inside the test transaction
+        with CaptureQueriesContext(connection) as captured:
+            user_agents.ids(["agent-a"])
+        self.assertTrue(any('"shortener_useragent"' in query["sql"] for query in captured)) # check the table was read again
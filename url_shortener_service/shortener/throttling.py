@@ -0,0 +1,182 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .conf import get_setting
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    Parse a DRF style rate such as '100/min' or '5/s' into (requests, seconds), None for no limit.
+    """
+    if rate is None:
+        return None
+    requests, period = rate.split('/')
+    return int(requests), PERIODS[period.strip()[0]]
+
+
+class LocalBuckets:
+    """
+    In-process token buckets, one per (scope, client). A bucket holds up to `requests` tokens
+    and refills at requests/seconds tokens per second, so a client may burst a full period's
+    worth of requests and is then held to the average rate. Only the least recently seen
+    MAX_CLIENTS buckets are kept; an evicted client starts again with a full bucket.
+    """
+
+    def __init__(self):
+        self._buckets = OrderedDict()  # key -> (tokens, monotonic time of the last update), oldest first
+        self._lock = threading.Lock()  # guard the OrderedDict across request threads
+
+    def take(self, key, requests, seconds, now):
+        """Take a token. Returns (allowed, seconds until a token is available)."""
+        refill = requests / seconds  # tokens per second
+        with self._lock:
+            state = self._buckets.get(key)
+            tokens = requests if state is None else min(requests, state[0] + (now - state[1]) * refill)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > get_setting('RATE_LIMITS')['MAX_CLIENTS']:  # forget the least recently seen client
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / refill
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SharedWindows:
+    """
+    Sliding window counters in a Django cache alias (Redis, Memcached...), shared by every worker.
+    A client's count is the current fixed window plus the previous one weighted by how much of
+    it still overlaps the sliding window: one get_many and one atomic incr per check.
+    """
+
+    def _backend(self):
+        return caches[get_setting('RATE_LIMITS')['SHARED_CACHE_ALIAS']]
+
+    def _keys(self, key, seconds, now):
+        window = int(now // seconds)
+        prefix = get_setting('RATE_LIMITS')['KEY_PREFIX']
+        return f'{prefix}{key}:{window - 1}', f'{prefix}{key}:{window}'
+
+    def _decide(self, previous, current, requests, seconds, now):
+        elapsed = (now % seconds) / seconds  # share of the current window already gone
+        allowed = previous * (1 - elapsed) + current <= requests
+        return allowed, 0 if allowed else seconds * (1 - elapsed)
+
+    def take(self, key, requests, seconds, now):
+        backend = self._backend()
+        previous_key, current_key = self._keys(key, seconds, now)
+        previous = backend.get_many([previous_key]).get(previous_key, 0)
+        backend.add(current_key, 0, timeout=2 * seconds)  # no-op when the window already has a counter
+        try:
+            current = backend.incr(current_key)
+        except ValueError:  # the counter expired between add() and incr()
+            backend.set(current_key, 1, timeout=2 * seconds)
+            current = 1
+        return self._decide(previous, current, requests, seconds, now)
+
+    async def atake(self, key, requests, seconds, now):
+        backend = self._backend()
+        previous_key, current_key = self._keys(key, seconds, now)
+        previous = (await backend.aget_many([previous_key])).get(previous_key, 0)
+        await backend.aadd(current_key, 0, timeout=2 * seconds)
+        try:
+            current = await backend.aincr(current_key)
+        except ValueError:
+            await backend.aset(current_key, 1, timeout=2 * seconds)
+            current = 1
+        return self._decide(previous, current, requests, seconds, now)
+
+
+class RateLimiter:
+    """
+    Per-client request limits for the scopes configured in SHORTENER['RATE_LIMITS']['RATES'].
+
+    Checked from memory, without database queries: by default with in-process token buckets,
+    so each worker process enforces the limit on its own; with a SHARED_CACHE_ALIAS, with
+    sliding window counters in that cache, so the limit holds across workers.
+    """
+
+    def __init__(self):
+        self.local = LocalBuckets()
+        self.shared = SharedWindows()
+        self._rates = {}  # rate string -> (requests, seconds), parsed once
+
+    def rate(self, scope):
+        config = get_setting('RATE_LIMITS')
+        if not config['ENABLED']:
+            return None
+        rate = config['RATES'].get(scope)
+        if rate not in self._rates:
+            self._rates[rate] = parse_rate(rate)
+        return self._rates[rate]
+
+    def check(self, scope, ident, now=None):
+        """Count a request of a client. Returns (allowed, seconds to wait before retrying)."""
+        rate = self.rate(scope)
+        if rate is None:
+            return True, 0
+        key = f'{scope}:{ident}'
+        if get_setting('RATE_LIMITS')['SHARED_CACHE_ALIAS']:
+            return self.shared.take(key, *rate, time.time() if now is None else now)  # wall clock, shared by servers
+        return self.local.take(key, *rate, time.monotonic() if now is None else now)
+
+    async def acheck(self, scope, ident, now=None):
+        """Async version of check(), for the ASGI redirect path."""
+        rate = self.rate(scope)
+        if rate is None:
+            return True, 0
+        key = f'{scope}:{ident}'
+        if get_setting('RATE_LIMITS')['SHARED_CACHE_ALIAS']:
+            return await self.shared.atake(key, *rate, time.time() if now is None else now)
+        return self.local.take(key, *rate, time.monotonic() if now is None else now)  # no I/O, safe in the event loop
+
+    def reset(self):
+        self.local.clear()
+
+
+rate_limiter = RateLimiter()  # process-wide instance used by the throttles and the redirect fast path
+
+_ident = BaseThrottle()  # only used for get_ident(), which honours REST_FRAMEWORK['NUM_PROXIES']
+
+
+def client_ident(request):
+    """The client a request is counted against: the user when authenticated, else the IP address."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{_ident.get_ident(request)}'
+
+
+def retry_after_seconds(wait):
+    return max(1, math.ceil(wait))
+
+
+class RateLimitThrottle(BaseThrottle):
+    """
+    DRF throttle backed by rate_limiter, for the scope named by the subclass.
+    Throttled requests get DRF's 429 response with a Retry-After header.
+    """
+    scope = None
+
+    def allow_request(self, request, view):
+        allowed, self.wait_seconds = rate_limiter.check(self.scope, client_ident(request))
+        return allowed
+
+    def wait(self):
+        return retry_after_seconds(self.wait_seconds)
+
+
+class ShortenRateThrottle(RateLimitThrottle):
+    """Limits link creation (POST /api/shorten/ and /api/shorten/bulk/)."""
+    scope = 'shorten'
@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import ShortURLViewSet, RedirectToOriginalView, ListUserURLsView
+from .views import ShortURLViewSet, RedirectToOriginalView, AsyncRedirectView, ListUserURLsView, CacheStatsView
+from .conf import get_setting
 
 from rest_framework.routers import DefaultRouter
 from shortener.views import ShortURLViewSet
@@ -7,9 +8,13 @@ from shortener.views import ShortURLViewSet
 router = DefaultRouter()
 router.register(r'api/shorten', ShortURLViewSet, basename='shorturl')
 
+# the async view avoids a thread hop per redirect under ASGI, the DRF view is cheaper under WSGI
+redirect_view = AsyncRedirectView if get_setting('REDIRECTS')['ASYNC'] else RedirectToOriginalView
+
 urlpatterns = [
     path('api/user-urls/', ListUserURLsView.as_view(), name='user_urls'), 
-    path('r/<str:short_code>/', RedirectToOriginalView.as_view(), name='redirect'),
+    path('r/<str:short_code>/', redirect_view.as_view(), name='redirect'),
+    path('api/cache-stats/', CacheStatsView.as_view(), name='cache_stats'),
 ]
 
 urlpatterns += router.urls  
@@ -1,70 +1,284 @@
+import json
+from datetime import datetime, timezone as dt_timezone
 
 from rest_framework import permissions, viewsets, generics
-from . models import ShortURL, ClickEvent
-from . serializers import ShortURLSerializer
+from . models import ShortURL
+from . serializers import ShortURLReadSerializer, ShortURLSerializer
 from rest_framework.views import APIView
-from django.shortcuts import get_object_or_404, redirect
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.pagination import PageNumberPagination
-from . permissions import IsOwnerOrReadOnly
+from . pagination import ShortURLPagination
+from . permissions import IsOwnerOrReadOnly, IsOwnerOrStaff
+from . cache import resolution_cache
+from . domains import short_link_base
+from . conf import get_setting
+from . qr import IMAGE_TYPES, get_qr_image, qr_etag
+from . bulk import create_short_urls
+from . parsers import NDJSONParser
+from . import rollups
+from . visitors import unique_visitors
+from . redirects import afollow, follow
+from . counters import with_pending_clicks
+from . exports import CLICK_COLUMNS, CONTENT_TYPES, LINK_COLUMNS, export_response
+from . throttling import ShortenRateThrottle
 from rest_framework import filters
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views import View
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 
 
 
-class ShortURLViewSet(viewsets.ModelViewSet):
+def stream_json_array(rows):
+    """
+    Yield a JSON array one element at a time.
+    """
+    yield '['
+    for position, row in enumerate(rows):
+        yield (',' if position else '') + json.dumps(row, default=str)
+    yield ']'
+
+
+def parse_stats_datetime(value):
+    """
+    Parse an ISO 8601 date or datetime query parameter into an aware datetime (UTC when no offset is given).
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        parsed = datetime.combine(day, datetime.min.time())
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
+
+
+def parse_export_params(query_params):
+    """
+    Read ?type=csv|ndjson and ?compression=gzip of the export endpoints. Returns (type, gzip, error message).
+    """
+    export_type = query_params.get('type', 'csv')
+    compression = query_params.get('compression', '')
+    if export_type not in CONTENT_TYPES:
+        return None, False, "Invalid type. Use csv or ndjson."
+    if compression not in ('', 'gzip'):
+        return None, False, "Invalid compression. Use gzip or leave it out."
+    return export_type, compression == 'gzip', None
+
+
+class QRCodeContextMixin:
+    """
+    Embed the QR code image in responses for single objects, and in list responses
+    only when the client asks for it with ?include=qr_code.
+    """
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        include = self.request.query_params.get('include', '').split(',') # comma-separated list of extra fields
+        is_list = getattr(self, 'action', 'list') == 'list' # generic list views have no action
+        context['include_qr_code'] = 'qr_code' in include or not is_list
+        return context
+
+
+class ShortURLViewSet(QRCodeContextMixin, viewsets.ModelViewSet):
     """
     ViewSet for handling ShortURL objects.
     Provides CRUD operations for ShortURL objects.
     """
-    queryset = ShortURL.objects.all()  # retrieve all ShortURL objects
+    queryset = with_pending_clicks(ShortURL.objects.all())  # retrieve all ShortURL objects, with clicks of hot links not folded yet
     serializer_class = ShortURLSerializer  # serialization and deserialization of ShortURL objects
     permission_classes = [permissions.IsAuthenticatedOrReadOnly ,IsOwnerOrReadOnly] # Allow authenticated users to create, update, and delete ShortURL objects, while others can only read them
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter] # Enable filtering on the queryset 
     filterset_fields = ['clicks', 'expiration_date'] # Fields that can be filtered in the queryset
-    ordering = ['-clicks'] # Default ordering of the queryset by clicks in descending order
-    pagination_class = PageNumberPagination
+    ordering = ['-clicks', '-id'] # Default ordering by clicks in descending order, the id keeps pages deterministic
+    pagination_class = ShortURLPagination # page numbers, or keyset pages with ?paginate=cursor
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve'): # read-only serializer, nothing to validate
+            return ShortURLReadSerializer
+        return super().get_serializer_class()
+
+    def get_throttles(self):
+        if self.action in ('create', 'bulk'): # only link creation is limited, reads stay unthrottled
+            return [ShortenRateThrottle()]
+        return super().get_throttles()
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user if self.request.user.is_authenticated else None)  # Save the user if authenticated, otherwise None
 
+    def perform_update(self, serializer):
+        old_key = serializer.instance.routing_key  # remember the code and domain before a possible change
+        instance = serializer.save()
+        resolution_cache.invalidate(old_key, instance.routing_key)  # drop both the old and the new mapping
+
+    def perform_destroy(self, instance):
+        key = instance.routing_key
+        instance.delete()
+        resolution_cache.invalidate(key)  # the code must stop redirecting right away
+
+    # Shorten many URLs in one request, from a JSON array or an NDJSON stream
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        items = request.data
+        max_items = get_setting('BULK')['MAX_ITEMS']
+        if not isinstance(items, list):
+            return Response({"error": "Expected a JSON array or an NDJSON stream of objects."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > max_items:
+            return Response({"error": f"Too many items, the limit is {max_items}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = create_short_urls(items, request.user)
+        failed = sum(1 for outcome, _ in results if outcome == 'error')
+        link_bases = {None: request.build_absolute_uri('/r/')} # computed once per domain for the whole batch
+
+        def rows():
+            for index, (outcome, value) in enumerate(results):
+                if outcome == 'created':
+                    if value.domain_id not in link_bases:
+                        link_bases[value.domain_id] = short_link_base(request, value.domain_id)
+                    yield {'index': index, 'status': 'created', 'id': value.pk, 'short_code': value.short_code,
+                           'short_link': f'{link_bases[value.domain_id]}{value.short_code}/', 'original_url': value.original_url}
+                else:
+                    yield {'index': index, 'status': 'error', 'errors': value}
+
+        ndjson = NDJSONParser.media_type in (request.content_type or '') or NDJSONParser.media_type in request.headers.get('Accept', '')
+        if ndjson: # answer in the format the items were sent in
+            content = (json.dumps(row, default=str) + '\n' for row in rows())
+            response = StreamingHttpResponse(content, content_type=NDJSONParser.media_type)
+        else:
+            response = StreamingHttpResponse(stream_json_array(rows()), content_type='application/json')
+        response.status_code = status.HTTP_201_CREATED if not failed else status.HTTP_207_MULTI_STATUS # 207 when some items failed
+        response['X-Bulk-Created'] = len(results) - failed
+        response['X-Bulk-Failed'] = failed
+        return response
+
+    # Stream every link of the requesting user, e.g. /api/shorten/export/?type=ndjson&compression=gzip
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[permissions.IsAuthenticated])
+    def export(self, request):
+        export_type, gzip, error = parse_export_params(request.query_params)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        links = with_pending_clicks(ShortURL.objects.filter(user=request.user)).order_by('id')
+        return export_response(links, LINK_COLUMNS, export_type, 'links', gzip=gzip)
+
+    # Stream the click history of a link to its owner, e.g. /api/shorten/1/clicks/export/?type=csv&from=2025-01-01
+    @action(detail=True, methods=['get'], url_path='clicks/export', permission_classes=[permissions.IsAuthenticated, IsOwnerOrStaff])
+    def export_clicks(self, request, pk=None):
+        url_obj = self.get_object() # click histories hold visitor IP addresses, so only the owner (or staff) gets past this
+        export_type, gzip, error = parse_export_params(request.query_params)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        clicks = url_obj.clickevent_set.order_by('clicked_at', 'id') # served by the (short_url, clicked_at) index
+        try:
+            start = parse_stats_datetime(request.query_params.get('from'))
+            end = parse_stats_datetime(request.query_params.get('to'))
+        except ValueError:
+            return Response({"error": "Invalid from/to. Use an ISO 8601 date or datetime."}, status=status.HTTP_400_BAD_REQUEST)
+        if start:
+            clicks = clicks.filter(clicked_at__gte=start)
+        if end:
+            clicks = clicks.filter(clicked_at__lt=end)
+        return export_response(clicks, CLICK_COLUMNS, export_type, f'clicks-{url_obj.short_code}', gzip=gzip)
+
+    # Click statistics of a short URL for its owner, from the hourly/daily rollups, e.g. /api/shorten/1/stats/?granularity=day&from=2025-01-01
+    @action(detail=True, methods=['get'], url_path='stats', permission_classes=[IsOwnerOrStaff])
+    def stats(self, request, pk=None):
+        url_obj = self.get_object()
+        granularity = request.query_params.get('granularity', rollups.HOUR)
+        if granularity not in rollups.GRANULARITIES:
+            return Response({"error": "Invalid granularity. Use hour or day."}, status=status.HTTP_400_BAD_REQUEST)
+
+        step = rollups.GRANULARITIES[granularity]
+        try:
+            end = parse_stats_datetime(request.query_params.get('to')) or timezone.now() # default: up to now
+            start = parse_stats_datetime(request.query_params.get('from')) or end - step * (24 if granularity == rollups.HOUR else 30) # default: last 24 hours or 30 days
+        except ValueError:
+            return Response({"error": "Invalid from/to. Use an ISO 8601 date or datetime."}, status=status.HTTP_400_BAD_REQUEST)
+        start = rollups.bucket_start(start, granularity) # include the bucket containing `from`
+        if start >= end:
+            return Response({"error": "from must be before to."}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start) / step > get_setting('ROLLUPS')['MAX_BUCKETS']:
+            return Response({"error": "Range too large for this granularity."}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = rollups.read_stats(url_obj, granularity, start, end)
+        data['short_code'] = url_obj.short_code
+        data['unique_visitors'] = unique_visitors(url_obj.unique_visitors) # all-time estimate from the link's sketch
+        return Response(data)
+
+    # QR code image of a short URL, e.g. /api/shorten/1/qr/?size=5&type=svg
+    @action(detail=True, methods=['get'], url_path='qr')
+    def qr(self, request, pk=None):
+        url_obj = self.get_object()
+        config = get_setting('QR_CODES')
+
+        image_type = request.query_params.get('type', 'png') # png or svg
+        if image_type not in IMAGE_TYPES:
+            return Response({"error": "Invalid type. Use png or svg."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = int(request.query_params.get('size', config['DEFAULT_SIZE'])) # pixels per QR module
+        except ValueError:
+            size = 0
+        if not 1 <= size <= config['MAX_SIZE']:
+            return Response({"error": f"Invalid size. Use an integer between 1 and {config['MAX_SIZE']}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        short_link = f'{short_link_base(request, url_obj.domain_id)}{url_obj.short_code}/'
+        etag = qr_etag(short_link, size, image_type)
+        if etag in request.headers.get('If-None-Match', ''): # the client already has this image
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(get_qr_image(short_link, size, image_type), content_type=IMAGE_TYPES[image_type])
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=config['MAX_AGE'])
+        return response
+
 
 
 class RedirectToOriginalView(APIView):
     """"
     APIView to handle redirection from short code to original URL.
     """
+    throttle_classes = [] # follow() applies the per-client redirect limit, as in the fast path
+
     def get(self, request, short_code): # Handle GET requests to redirect to the original URL
-        url_obj = get_object_or_404(ShortURL, short_code=short_code, is_active=True)  # Retrieve the ShortURL object by short_code
-
-        # check if the URL has expired
-        if url_obj.expiration_date and url_obj.expiration_date < timezone.now():
-            return Response({'detail': 'URL has expired.'}, status=status.HTTP_410_GONE)
-        
-        # log the click event
-        url_obj.clicks += 1 # Increment the click count
-        url_obj.save() # Save the updated ShortURL object
-        ClickEvent.objects.create(
-            short_url=url_obj,  # Create a ClickEvent object with the ShortURL object
-            ip_address=request.META.get('REMOTE_ADDR', ''),  # Get the user's IP address
-            user_agent=request.META.get('HTTP_USER_AGENT', '')  # Get the user's user agent
-        )
-        return redirect(url_obj.original_url) # Redirect to the original URL
+        return follow(request, short_code) # same resolution, checks and click logging as the fast path
     
 
-class ListUserURLsView(generics.ListAPIView):
+class AsyncRedirectView(View):
+    """
+    Native async version of RedirectToOriginalView, used under ASGI (see SHORTENER['REDIRECTS']).
+
+    Skips DRF entirely (no request parsing, content negotiation, authentication or permission
+    checks, none of which a public redirect needs), resolves through the async cache and ORM
+    APIs and queues the click without waiting for the database.
+    """
+    async def get(self, request, short_code):
+        return await afollow(request, short_code)
+
+
+class ListUserURLsView(QRCodeContextMixin, generics.ListAPIView):
     """
     APIView to list all ShortURL objects created by the authenticated user.
     """
-    serializer_class = ShortURLSerializer  # Use the ShortURLSerializer for serialization
+    serializer_class = ShortURLReadSerializer  # Read-only serializer, the view only lists
     permission_classes = [IsOwnerOrReadOnly] # Allow authenticated users to view their own ShortURL objects, while others can only read them
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter] # Enable filtering on the queryset 
     filterset_fields = ['clicks', 'expiration_date'] # Fields that can be filtered in the queryset
-    ordering = ['-clicks'] # Default ordering of the queryset by clicks in descending order
-    pagination_class = PageNumberPagination
+    ordering = ['-clicks', '-id'] # Default ordering by clicks in descending order, the id keeps pages deterministic
+    pagination_class = ShortURLPagination # page numbers, or keyset pages with ?paginate=cursor
     
     def get_queryset(self):
-        return ShortURL.objects.filter(user=self.request.user)  # Return ShortURL objects created by the authenticated user
+        return with_pending_clicks(ShortURL.objects.filter(user=self.request.user))  # Return ShortURL objects created by the authenticated user
+
+
+class CacheStatsView(APIView):
+    """
+    APIView exposing the redirect resolution cache counters of this worker process for monitoring.
+    """
+    permission_classes = [permissions.IsAdminUser] # Only staff users can read the counters
 
+    def get(self, request):
+        return Response(resolution_cache.stats()) # hits, misses, database lookups and invalidations
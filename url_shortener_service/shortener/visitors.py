@@ -0,0 +1,93 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+
+from .conf import get_setting
+from .hll import HyperLogLog, relative_error
+
+
+class VisitorSketchBatch:
+    """
+    Per-link unique visitor sketches touched by one click batch.
+
+    Loads the stored sketches of the batch's links with one SELECT, adds the batch's IP
+    addresses in memory, and writes them back with one bulk UPDATE and one bulk INSERT.
+    """
+
+    def __init__(self, records):
+        from .models import VisitorSketch  # imported here because models.py is loaded after this module
+
+        self.enabled = get_setting('VISITORS')['ENABLED']
+        self.rows = {}  # short_url_id -> stored VisitorSketch
+        self.sketches = {}  # short_url_id -> merged HyperLogLog
+        if not self.enabled or not records:
+            return
+
+        ips = defaultdict(set)
+        for record in records:
+            ips[record.short_url_id].add(record.ip_address)
+        self.rows = {row.short_url_id: row for row in VisitorSketch.objects.select_for_update().filter(short_url_id__in=ips)}
+        precision = get_setting('VISITORS')['HLL_PRECISION']
+        for short_url_id, addresses in ips.items():
+            row = self.rows.get(short_url_id)
+            sketch = HyperLogLog.from_bytes(row.registers if row else None, precision)
+            for address in addresses:
+                sketch.add(address)
+            self.sketches[short_url_id] = sketch
+
+    def estimates(self):
+        """New unique visitor estimate per short URL id."""
+        return {short_url_id: sketch.count() for short_url_id, sketch in self.sketches.items()}
+
+    def save(self, short_url_ids):
+        """
+        Store the merged sketches of the given (still existing) short URLs.
+        """
+        from .models import VisitorSketch
+
+        to_update, to_create = [], []
+        for short_url_id in short_url_ids:
+            sketch = self.sketches.get(short_url_id)
+            if sketch is None:
+                continue
+            row = self.rows.get(short_url_id)
+            if row is None:
+                to_create.append(VisitorSketch(short_url_id=short_url_id, registers=sketch.to_bytes()))
+            else:
+                row.registers = sketch.to_bytes()
+                to_update.append(row)
+        if to_update:
+            VisitorSketch.objects.bulk_update(to_update, ['registers'])
+        if not to_create:
+            return
+        try:
+            with transaction.atomic():
+                VisitorSketch.objects.bulk_create(to_create)
+        except IntegrityError:
+            self._merge_concurrent([row.short_url_id for row in to_create])
+
+    def _merge_concurrent(self, short_url_ids):
+        """
+        Another worker created some of these sketches first: merge theirs into ours and store the union.
+        """
+        from .models import ShortURL, VisitorSketch
+
+        stored = {row.short_url_id: row for row in VisitorSketch.objects.select_for_update().filter(short_url_id__in=short_url_ids)}
+        for short_url_id in short_url_ids:
+            sketch = self.sketches[short_url_id]
+            row = stored.get(short_url_id)
+            if row is None:
+                VisitorSketch.objects.create(short_url_id=short_url_id, registers=sketch.to_bytes())
+                continue
+            sketch.merge(HyperLogLog.from_bytes(row.registers))
+            row.registers = sketch.to_bytes()
+            row.save(update_fields=['registers'])
+            ShortURL.objects.filter(pk=short_url_id).update(unique_visitors=sketch.count())
+
+
+def unique_visitors(estimate):
+    """
+    Unique visitor estimate of a short URL with its relative standard error, as exposed by the API.
+    The error only depends on the configured precision, so no sketch is allocated per row.
+    """
+    return {'estimate': estimate, 'relative_error': relative_error(get_setting('VISITORS')['HLL_PRECISION'])}
@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'url_shortener.settings')
+os.environ.setdefault('SHORTENER_ASYNC_REDIRECTS', '1')  # serve redirects with the native async view
 
 application = get_asgi_application()
@@ -0,0 +1,76 @@
+"""
+DATABASES['default'] for the url_shortener project, built from environment variables.
+
+    SHORTENER_DB_ENGINE        'sqlite' (default) or 'postgresql'
+    SHORTENER_DB_CONNECTIONS   'persistent' (default), 'per-request', or 'pool' (PostgreSQL only)
+    SHORTENER_DB_CONN_MAX_AGE  Seconds a persistent connection is reused (default 600, 'none' for unlimited)
+    SHORTENER_DB_NAME          SQLite file (default db.sqlite3 next to manage.py) or PostgreSQL database name
+    SHORTENER_DB_USER, SHORTENER_DB_PASSWORD, SHORTENER_DB_HOST, SHORTENER_DB_PORT   PostgreSQL only
+    SHORTENER_DB_POOL_MIN_SIZE, SHORTENER_DB_POOL_MAX_SIZE   Connections per worker process in 'pool' mode (default 2 and 10)
+    SHORTENER_SQLITE_PRAGMAS   '1' (default) applies SQLITE_PRAGMAS on every new connection, '0' keeps SQLite's defaults
+    SHORTENER_SQLITE_MMAP_SIZE Bytes of the database file SQLite reads through mmap (default 256 MB)
+"""
+import os
+
+CONNECTION_MODES = ('persistent', 'per-request', 'pool')
+
+# Applied to every new SQLite connection: WAL lets readers (redirects) run while a click is being
+# written, synchronous=NORMAL only syncs at checkpoints instead of every commit (a power cut may lose
+# the last commits, never corrupt the file), and reads of the file go through mmap instead of read().
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size={mmap_size}',
+    'PRAGMA temp_store=MEMORY',
+)
+
+
+def database_config(base_dir, environ=os.environ):
+    """The settings dict of the default database, see the module docstring for the variables read."""
+    engine = environ.get('SHORTENER_DB_ENGINE', 'sqlite')
+    mode = environ.get('SHORTENER_DB_CONNECTIONS', 'persistent')
+    if engine not in ('sqlite', 'postgresql'):
+        raise ValueError(f"SHORTENER_DB_ENGINE must be 'sqlite' or 'postgresql', not {engine!r}.")
+    if mode not in CONNECTION_MODES:
+        raise ValueError(f'SHORTENER_DB_CONNECTIONS must be one of {", ".join(CONNECTION_MODES)}, not {mode!r}.')
+    if mode == 'pool' and engine != 'postgresql':
+        raise ValueError("SHORTENER_DB_CONNECTIONS='pool' needs SHORTENER_DB_ENGINE='postgresql'.")
+
+    max_age = environ.get('SHORTENER_DB_CONN_MAX_AGE', '600')
+    config = {
+        # 0 closes the connection at the end of every request; pooled connections go back to the pool instead
+        'CONN_MAX_AGE': 0 if mode != 'persistent' else None if max_age.lower() == 'none' else int(max_age),
+        'CONN_HEALTH_CHECKS': mode == 'persistent',  # a reused connection that went away is replaced, not failed on
+    }
+    if engine == 'sqlite':
+        options = {
+            'timeout': 20,  # seconds a writer waits for the lock held by another one
+            'transaction_mode': 'IMMEDIATE',  # take the write lock when atomic() starts, instead of failing on upgrade
+        }
+        if environ.get('SHORTENER_SQLITE_PRAGMAS', '1') == '1':
+            mmap_size = int(environ.get('SHORTENER_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+            options['init_command'] = ';'.join(SQLITE_PRAGMAS).format(mmap_size=mmap_size)
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': environ.get('SHORTENER_DB_NAME') or os.path.join(base_dir, 'db.sqlite3'),
+            'OPTIONS': options,
+            **config,
+        }
+
+    options = {}
+    if mode == 'pool':  # psycopg_pool, one pool per worker process (needs psycopg[pool])
+        options['pool'] = {
+            'min_size': int(environ.get('SHORTENER_DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(environ.get('SHORTENER_DB_POOL_MAX_SIZE', 10)),
+            'timeout': 10,  # seconds a request waits for a free connection
+        }
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': environ.get('SHORTENER_DB_NAME', 'url_shortener'),
+        'USER': environ.get('SHORTENER_DB_USER', ''),
+        'PASSWORD': environ.get('SHORTENER_DB_PASSWORD', ''),
+        'HOST': environ.get('SHORTENER_DB_HOST', ''),
+        'PORT': environ.get('SHORTENER_DB_PORT', ''),
+        'OPTIONS': options,
+        **config,
+    }
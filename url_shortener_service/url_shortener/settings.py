@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'shortener.middleware.RedirectFastPathMiddleware',  # right after the security headers and HTTPS redirect, so redirects skip everything below
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,6 +57,7 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'url_shortener.urls'
 
 import os
+import sys
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 TEMPLATES = [
@@ -80,10 +82,19 @@ WSGI_APPLICATION = 'url_shortener.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+from .database import database_config
+
 DATABASES = {
+    'default': database_config(BASE_DIR),  # SQLite with WAL and persistent connections unless SHORTENER_DB_* says otherwise
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),  # use os.path.join here
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',  # swap for Redis/Memcached to share entries across workers
     }
 }
 
@@ -138,4 +149,47 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
-}
\ No newline at end of file
+    # Reverse proxies in front of the app: 0 keys rate limits on REMOTE_ADDR and ignores a client-supplied
+    # X-Forwarded-For, N > 0 trusts the address the N-th proxy from the end added
+    'NUM_PROXIES': int(os.environ.get('SHORTENER_NUM_PROXIES', '0')),
+}
+
+
+# Covering indexes (Index.include) only exist on PostgreSQL, SQLite builds them without the extra columns
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+
+# `manage.py test` checks clicks right after each request, so the suite logs them in the request
+TESTING = sys.argv[1:2] == ['test']
+
+# URL shortener settings, see shortener/conf.py for every key and its default
+SHORTENER = {
+    'RESOLUTION_CACHE': {
+        'SHARED_CACHE_ALIAS': 'default',  # use the 'default' cache above as the shared tier
+    },
+    'CLICK_LOGGING': {
+        'MODE': os.environ.get('SHORTENER_CLICK_MODE', 'sync' if TESTING else 'memory'),  # 'disk' to journal queued clicks, 'sync' to write them in the request
+        'JOURNAL_DIR': os.path.join(BASE_DIR, 'var', 'clicks'),  # journal files for the 'disk' mode
+    },
+    'BLOOM_FILTER': {
+        'FILE': os.environ.get('SHORTENER_CODE_FILTER_FILE'),  # e.g. var/code-filter.bin, for fast worker restarts
+    },
+    'REDIRECT_SNAPSHOT': {
+        'FILE': os.environ.get('SHORTENER_REDIRECT_SNAPSHOT'),  # e.g. var/redirects.bin, rebuilt with `manage.py build_redirect_snapshot`
+    },
+    'REDIRECTS': {
+        'ASYNC': os.environ.get('SHORTENER_ASYNC_REDIRECTS') == '1',  # set by asgi.py, so ASGI servers get the async view
+    },
+    'RATE_LIMITS': {
+        'RATES': {'shorten': '60/min', 'redirect': '600/min'},  # per worker process unless SHARED_CACHE_ALIAS is set
+    },
+    'ENRICHMENT': {
+        'IP_TABLE': os.path.join(BASE_DIR, 'var', 'ip-country.bin'),  # built from a CSV with `manage.py build_ip_table`
+    },
+    'CLICK_REBUILD': {
+        'CHECKPOINT_DIR': os.path.join(BASE_DIR, 'var', 'rebuild'),  # progress of `manage.py rebuild_clicks`, for --resume
+    },
+    'CLICK_RETENTION': {
+        'ARCHIVE_DIR': os.path.join(BASE_DIR, 'var', 'archive'),  # exported click partitions
+    },
+}